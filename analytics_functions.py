@@ -1,6 +1,6 @@
 """
 ============================================
-TURICANJE - ANALYTICS FUNCTIONS (SYNC VERSION)
+TURICANJE - ANALYTICS FUNCTIONS (ASYNC VERSION)
 ============================================
 Funciones para guardar data automáticamente en:
 1. conversation_raw (TODO)
@@ -8,7 +8,8 @@ Funciones para guardar data automáticamente en:
 
 Con filtro de números excluidos para testing.
 
-NOTA: Versión SÍNCRONA compatible con ConnectionPool síncrono
+NOTA: Versión ASÍNCRONA sobre AsyncConnectionPool (services/db):
+las escrituras no bloquean el event loop
 ============================================
 """
 
@@ -18,7 +19,7 @@ import uuid
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
 import pytz
-from psycopg_pool import ConnectionPool
+from psycopg_pool import AsyncConnectionPool
 
 # ============================================
 # CONFIGURACIÓN
@@ -52,18 +53,18 @@ def is_excluded_user(wa_id: str) -> bool:
 
 
 # ============================================
-# FUNCIÓN: Guardar evento RAW (SYNC)
+# FUNCIÓN: Guardar evento RAW
 # ============================================
 
-def save_raw_event_sync(
+async def save_raw_event(
     event_type: str,
     wa_id: str,
     session_id: str,
     data: Dict[str, Any],
-    pool: ConnectionPool
+    pool: AsyncConnectionPool
 ) -> bool:
     """
-    Guarda un evento en la tabla conversation_raw (VERSIÓN SÍNCRONA).
+    Guarda un evento en la tabla conversation_raw.
     
     Args:
         event_type: Tipo de evento
@@ -82,9 +83,9 @@ def save_raw_event_sync(
     try:
         now = datetime.now(TZ)
         
-        with pool.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
                     """
                     INSERT INTO conversation_raw (event_type, wa_id, session_id, timestamp, raw_data)
                     VALUES (%s, %s, %s, %s, %s)
@@ -103,23 +104,23 @@ def save_raw_event_sync(
 
 
 # ============================================
-# FUNCIÓN: Incrementar métrica diaria (SYNC)
+# FUNCIÓN: Incrementar métrica diaria
 # ============================================
 
-def increment_metric_sync(
+async def increment_metric(
     date: str,
     metric: str,
     value: int,
-    pool: ConnectionPool
+    pool: AsyncConnectionPool
 ) -> bool:
     """
-    Incrementa una métrica específica en analytics_dashboard (VERSIÓN SÍNCRONA).
+    Incrementa una métrica específica en analytics_dashboard.
     """
     try:
-        with pool.connection() as conn:
-            with conn.cursor() as cur:
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
                 # Upsert: insert o update si ya existe
-                cur.execute(
+                await cur.execute(
                     f"""
                     INSERT INTO analytics_dashboard (date, {metric})
                     VALUES (%s, %s)
@@ -142,15 +143,15 @@ def increment_metric_sync(
 
 
 # ============================================
-# FUNCIÓN: Actualizar usuario único (SYNC)
+# FUNCIÓN: Actualizar usuario único
 # ============================================
 
-def update_unique_user_sync(
+async def update_unique_user(
     wa_id: str,
-    pool: ConnectionPool
+    pool: AsyncConnectionPool
 ) -> bool:
     """
-    Actualiza o crea registro de usuario único (VERSIÓN SÍNCRONA).
+    Actualiza o crea registro de usuario único.
     """
     # ✅ FILTRO: No guardar si está excluido
     if is_excluded_user(wa_id):
@@ -159,20 +160,20 @@ def update_unique_user_sync(
     try:
         now = datetime.now(TZ)
         
-        with pool.connection() as conn:
-            with conn.cursor() as cur:
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
                 # Verificar si existe
-                cur.execute(
+                await cur.execute(
                     "SELECT wa_id FROM users_unique WHERE wa_id = %s",
                     (wa_id,)
                 )
-                row = cur.fetchone()
+                row = await cur.fetchone()
                 
                 is_new_user = row is None
                 
                 if is_new_user:
                     # Insertar nuevo usuario
-                    cur.execute(
+                    await cur.execute(
                         """
                         INSERT INTO users_unique (wa_id, first_seen, last_seen)
                         VALUES (%s, %s, %s)
@@ -182,7 +183,7 @@ def update_unique_user_sync(
                     print(f"[ANALYTICS] 🆕 Nuevo usuario: {wa_id}")
                 else:
                     # Actualizar last_seen
-                    cur.execute(
+                    await cur.execute(
                         "UPDATE users_unique SET last_seen = %s WHERE wa_id = %s",
                         (now, wa_id)
                     )
@@ -197,24 +198,7 @@ def update_unique_user_sync(
 
 
 # ============================================
-# WRAPPERS ASYNC (para compatibilidad)
-# ============================================
-
-async def save_raw_event(event_type, wa_id, session_id, data, pool):
-    """Wrapper async que llama a la versión sync"""
-    return save_raw_event_sync(event_type, wa_id, session_id, data, pool)
-
-async def increment_metric(date, metric, value, pool):
-    """Wrapper async que llama a la versión sync"""
-    return increment_metric_sync(date, metric, value, pool)
-
-async def update_unique_user(wa_id, pool):
-    """Wrapper async que llama a la versión sync"""
-    return update_unique_user_sync(wa_id, pool)
-
-
-# ============================================
-# FUNCIONES DE LOGGING (usando wrappers sync)
+# FUNCIONES DE LOGGING
 # ============================================
 
 async def log_search(
@@ -229,7 +213,7 @@ async def log_search(
     used_expansion: bool,
     expanded_terms: List[str],
     db_query_time_ms: int,
-    pool: ConnectionPool
+    pool: AsyncConnectionPool
 ) -> bool:
     """Registra una búsqueda completa"""
     if is_excluded_user(wa_id):
@@ -256,8 +240,8 @@ async def log_search(
             "is_weekend": now.weekday() >= 5
         }
         
-        save_raw_event_sync("search", wa_id, session_id, raw_data, pool)
-        increment_metric_sync(today, "total_searches", 1, pool)
+        await save_raw_event("search", wa_id, session_id, raw_data, pool)
+        await increment_metric(today, "total_searches", 1, pool)
         
         return True
         
@@ -279,7 +263,7 @@ async def log_click(
     result_position: int,
     distance_meters: Optional[float],
     was_open: bool,
-    pool: ConnectionPool
+    pool: AsyncConnectionPool
 ) -> bool:
     """Registra un click en un lugar"""
     if is_excluded_user(wa_id):
@@ -304,14 +288,14 @@ async def log_click(
             "hour": now.hour
         }
         
-        save_raw_event_sync("click", wa_id, session_id, raw_data, pool)
-        increment_metric_sync(today, "total_clicks", 1, pool)
+        await save_raw_event("click", wa_id, session_id, raw_data, pool)
+        await increment_metric(today, "total_clicks", 1, pool)
         
         if is_affiliate:
-            increment_metric_sync(today, "affiliate_clicks", 1, pool)
+            await increment_metric(today, "affiliate_clicks", 1, pool)
         
         if has_cashback:
-            increment_metric_sync(today, "cashback_place_clicks", 1, pool)
+            await increment_metric(today, "cashback_place_clicks", 1, pool)
         
         return True
         
@@ -324,7 +308,7 @@ async def log_session_start(
     wa_id: str,
     session_id: str,
     is_new_user: bool,
-    pool: ConnectionPool
+    pool: AsyncConnectionPool
 ) -> bool:
     """Registra inicio de sesión"""
     if is_excluded_user(wa_id):
@@ -340,13 +324,13 @@ async def log_session_start(
             "timestamp": now.isoformat()
         }
         
-        save_raw_event_sync("session_start", wa_id, session_id, raw_data, pool)
-        increment_metric_sync(today, "daily_active_users", 1, pool)
+        await save_raw_event("session_start", wa_id, session_id, raw_data, pool)
+        await increment_metric(today, "daily_active_users", 1, pool)
         
         if is_new_user:
-            increment_metric_sync(today, "new_users", 1, pool)
+            await increment_metric(today, "new_users", 1, pool)
         else:
-            increment_metric_sync(today, "returning_users", 1, pool)
+            await increment_metric(today, "returning_users", 1, pool)
         
         return True
         
@@ -360,7 +344,7 @@ async def log_location_shared(
     session_id: str,
     lat: float,
     lng: float,
-    pool: ConnectionPool
+    pool: AsyncConnectionPool
 ) -> bool:
     """Registra cuando usuario comparte ubicación"""
     if is_excluded_user(wa_id):
@@ -375,7 +359,7 @@ async def log_location_shared(
             "timestamp": now.isoformat()
         }
         
-        save_raw_event_sync("location", wa_id, session_id, raw_data, pool)
+        await save_raw_event("location", wa_id, session_id, raw_data, pool)
         
         return True
         
@@ -389,7 +373,7 @@ async def log_pagination(
     session_id: str,
     page_number: int,
     search_craving: str,
-    pool: ConnectionPool
+    pool: AsyncConnectionPool
 ) -> bool:
     """Registra cuando usuario pide 'más' opciones"""
     if is_excluded_user(wa_id):
@@ -404,7 +388,7 @@ async def log_pagination(
             "timestamp": now.isoformat()
         }
         
-        save_raw_event_sync("pagination", wa_id, session_id, raw_data, pool)
+        await save_raw_event("pagination", wa_id, session_id, raw_data, pool)
         
         return True
         
@@ -417,7 +401,7 @@ async def log_goodbye_sent(
     wa_id: str,
     session_id: str,
     clicked_link: bool,
-    pool: ConnectionPool
+    pool: AsyncConnectionPool
 ) -> bool:
     """Registra cuando se envía mensaje de despedida automático"""
     if is_excluded_user(wa_id):
@@ -432,8 +416,8 @@ async def log_goodbye_sent(
             "timestamp": now.isoformat()
         }
         
-        save_raw_event_sync("goodbye", wa_id, session_id, raw_data, pool)
-        increment_metric_sync(today, "goodbye_messages_sent", 1, pool)
+        await save_raw_event("goodbye", wa_id, session_id, raw_data, pool)
+        await increment_metric(today, "goodbye_messages_sent", 1, pool)
         
         return True
         
@@ -452,7 +436,7 @@ def init_analytics():
     Muestra configuración en logs.
     """
     print("\n" + "="*50)
-    print("📊 ANALYTICS SYSTEM INITIALIZED (SYNC VERSION)")
+    print("📊 ANALYTICS SYSTEM INITIALIZED (ASYNC VERSION)")
     print("="*50)
     print(f"🚫 Números excluidos: {len(EXCLUDED_PHONE_NUMBERS)}")
     if EXCLUDED_PHONE_NUMBERS:
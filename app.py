@@ -8,6 +8,7 @@ import random
 import time
 import math
 import asyncio
+import dataclasses
 from typing import Dict, Optional, Any, List, Tuple
 from datetime import datetime, time as dt_time, timedelta
 
@@ -17,7 +18,6 @@ from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import PlainTextResponse
 import httpx
 import psycopg
-from psycopg_pool import ConnectionPool
 from dotenv import load_dotenv
 
 # ===== ANALYTICS =====
@@ -35,6 +35,24 @@ from analytics_functions import (
 from handlers import loyalty
 from handlers import invitations
 from handlers import menu_budget
+# ===== PIPELINE DEL WEBHOOK =====
+from services.work_queue import WorkQueue
+from services.dedup import MessageDeduplicator
+from services.mailboxes import MailboxRegistry
+from services.admission import AdmissionController
+from services.webhook_capture import WebhookRecorder
+from services.session_store import create_session_store
+from services.session import Session
+from services import place_cache
+from services import place_catalog
+from services.idle_timers import IdleTimers
+from services.session_snapshots import SessionSnapshotter
+from services import webhook_events
+from services import webhook_parser
+from services import db
+from services import search_sql
+from services import search_schema
+from services.webhook_parser import IncomingMessage
 
 # ===== BOT INTERACTIONS LOGGING =====
 # Guarda conversaciones completas en bot_interactions
@@ -60,10 +78,6 @@ async def log_bot_interaction(
         return
     
     try:
-        pool = get_pool()
-        if not pool:
-            return
-            
         sql = """
         INSERT INTO bot_interactions (
             session_id, user_phone, user_message, bot_response,
@@ -80,21 +94,18 @@ async def log_bot_interaction(
         search_results_json = json.dumps(search_results[:5]) if search_results else None
         user_location_json = json.dumps(user_location) if user_location else None
         
-        with pool.connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql, (
-                    session_id,
-                    wa_id,
-                    user_msg_limited,
-                    bot_resp_limited,
-                    message_type,
-                    intent,
-                    search_query,
-                    search_results_json,
-                    selected_place_id,
-                    user_location_json
-                ))
-                conn.commit()
+        await db.execute("bot.log_interaction", sql, (
+            session_id,
+            wa_id,
+            user_msg_limited,
+            bot_resp_limited,
+            message_type,
+            intent,
+            search_query,
+            search_results_json,
+            selected_place_id,
+            user_location_json
+        ))
         
         print(f"[BOT-LOG] ✅ Guardado: {wa_id[:6]}*** - {intent or message_type}")
         
@@ -164,23 +175,6 @@ DAY_MAP = {
     6: ("sun_open", "sun_close"),
 }
 
-def get_today_hours_filter() -> str:
-    """
-    Retorna la condición SQL para filtrar lugares que tengan horarios HOY.
-    Ejemplo: Si hoy es lunes → "mon_open IS NOT NULL AND mon_close IS NOT NULL"
-    """
-    import datetime
-    import pytz
-    
-    # Obtener día actual en México (timezone por defecto)
-    tz = pytz.timezone("America/Mexico_City")
-    now = datetime.datetime.now(tz)
-    weekday = now.weekday()  # 0=lunes, 6=domingo
-    
-    open_col, close_col = DAY_MAP[weekday]
-    
-    return f"{open_col} IS NOT NULL AND {close_col} IS NOT NULL"
-
 def is_open_now_by_day(place: dict) -> bool:
     """
     Determina si un lugar está abierto AHORA usando las columnas individuales de horarios.
@@ -411,6 +405,14 @@ DB_PORT = int(os.getenv("DB_PORT", "5432"))
 DB_NAME = os.getenv("DB_NAME", "")
 DB_USER = os.getenv("DB_USER", "")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+# Consultas más lentas que esto (ms) van al log de consultas lentas (/metrics → db.slow_queries)
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+# Pool: conexiones mínimas siempre abiertas (pre-calentadas en el startup) y máximo;
+# las que sobran del mínimo se cierran tras DB_POOL_MAX_IDLE segundos sin uso
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "600"))
+DB_POOL_WARMUP_TIMEOUT = float(os.getenv("DB_POOL_WARMUP_TIMEOUT", "10"))
 
 # Configuración
 IDLE_RESET_SECONDS = int(os.getenv("IDLE_RESET_SECONDS", "120"))  # 2 minutos
@@ -419,9 +421,69 @@ MAX_SUGGESTIONS = 3  # FIJO: Siempre 3 opciones por página
 # ✅ FASE 5: Configuración de timeouts y paginación
 SEARCH_TIMEOUT = int(os.getenv("SEARCH_TIMEOUT", "120"))  # 2 min para pruebas (cambiar a 300 para prod)
 CONVERSATION_TIMEOUT = int(os.getenv("CONVERSATION_TIMEOUT", "120"))  # 2 min para pruebas
+GOODBYE_CONCURRENCY = int(os.getenv("GOODBYE_CONCURRENCY", "20"))
 SESSION_RESET_TIMEOUT = int(os.getenv("SESSION_RESET_TIMEOUT", "600"))  # 10 min - Nueva sesión completa
 PAGINATION_SIZE = 3  # Cuántos resultados mostrar por página
 
+# ✅ Comandos hardcoded de paginación (bypass IA)
+MORE_OPTIONS_WORDS = ['más', 'mas', 'dame más', 'dame mas', 'ver más', 'ver mas', 'siguiente', 'otra', 'otras']
+NO_MORE_OPTIONS_WORDS = ['no', 'ya no', 'ya', 'suficiente', 'no más', 'no mas', 'está bien', 'esta bien']
+
+# ✅ Pipeline del webhook: responder 200 de inmediato y procesar en background
+WEBHOOK_ASYNC_MODE = os.getenv("WEBHOOK_ASYNC_MODE", "false").lower() == "true"
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+# ✅ Carril rápido (puntos/QR, invitación, "más", selección por número): workers y slots propios
+WEBHOOK_FAST_WORKERS = int(os.getenv("WEBHOOK_FAST_WORKERS", "4"))
+WEBHOOK_FAST_IN_FLIGHT = int(os.getenv("WEBHOOK_FAST_IN_FLIGHT", "8"))
+
+# ✅ De-duplicación por message id (Meta re-entrega si respondemos lento)
+DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "memory").lower()  # memory | postgres
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "100000"))
+
+# ✅ Mailbox por usuario: mensajes de un mismo wa_id se procesan en orden estricto
+MAILBOX_IDLE_SECONDS = float(os.getenv("MAILBOX_IDLE_SECONDS", "30"))
+# ✅ Ventana para juntar mensajes rápidos ("hola" + "quiero tacos") en una sola llamada de IA (0 = desactivado)
+COALESCE_WINDOW_MS = int(os.getenv("COALESCE_WINDOW_MS", "0"))
+COALESCE_MAX_MS = int(os.getenv("COALESCE_MAX_MS", "2000"))
+
+# ✅ Control de admisión: mensajes procesándose a la vez, aceptados en espera y umbral de modo degradado
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "16"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "200"))
+WEBHOOK_DEGRADE_AT = int(os.getenv("WEBHOOK_DEGRADE_AT", str(WEBHOOK_MAX_IN_FLIGHT)))
+
+# ✅ Sesiones: memory (un worker) | postgres (workers/réplicas) | sqlite (workers de un mismo nodo)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").lower()
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.db")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "86400"))
+# ✅ Tope de sesiones en memoria: se expulsan las menos recientes (LRU). 0 = sin tope
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "50000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", "0"))
+# ✅ Warm restart (sólo SESSION_STORE=memory): snapshots incrementales a file | postgres ("" = desactivado)
+SESSION_SNAPSHOT = os.getenv("SESSION_SNAPSHOT", "").lower()
+SESSION_SNAPSHOT_PATH = os.getenv("SESSION_SNAPSHOT_PATH", "sessions_snapshot.jsonl")
+SESSION_SNAPSHOT_SECONDS = float(os.getenv("SESSION_SNAPSHOT_SECONDS", "10"))
+# ✅ Caché compartido de lugares (las sesiones sólo guardan ids + distancias)
+PLACE_CACHE_MAX_ENTRIES = int(os.getenv("PLACE_CACHE_MAX_ENTRIES", "5000"))
+# Catálogo de lugares en memoria: las búsquedas no van a la BD mientras el snapshot esté vigente
+PLACE_CATALOG_ENABLED = os.getenv("PLACE_CATALOG", "true").lower() == "true"
+PLACE_CATALOG_REFRESH_SECONDS = float(os.getenv("PLACE_CATALOG_REFRESH_SECONDS", "300"))
+PLACE_CATALOG_MAX_AGE = float(os.getenv("PLACE_CATALOG_MAX_AGE", "1800"))
+# Los /sheet/sync que llegan dentro de esta ventana (s) recargan el catálogo una sola vez
+PLACE_CATALOG_RELOAD_DELAY = float(os.getenv("PLACE_CATALOG_RELOAD_DELAY", "1.0"))
+# "Cualquier cosa abierta cerca": con catálogo, el radio crece hasta juntar N abiertos o llegar al tope en km
+NEARBY_OPEN_LIMIT = int(os.getenv("NEARBY_OPEN_LIMIT", "20"))
+NEARBY_OPEN_MAX_KM = float(os.getenv("NEARBY_OPEN_MAX_KM", "25"))
+# Columnas/índices de búsqueda en places (services/search_schema) para las búsquedas que van a la BD:
+# off | use (si la migración ya está aplicada) | migrate (aplicarla en el startup)
+SEARCH_DB_INDEXES = os.getenv("SEARCH_DB_INDEXES", "use").lower()
+# Radio de las búsquedas con ubicación en km (0 = sin radio): rectángulo lat/lng indexado + círculo exacto
+SEARCH_RADIUS_KM = float(os.getenv("SEARCH_RADIUS_KM", "0"))
+
+# 📼 Captura de tráfico: si se define, cada webhook se guarda sanitizado en este JSONL (ver benchmarks/replay_webhooks.py)
+WEBHOOK_CAPTURE_FILE = os.getenv("WEBHOOK_CAPTURE_FILE", "")
+
 # ✅ FASE 5: URLs de redes sociales
 FACEBOOK_PAGE_URL = "https://www.facebook.com/turicanjeapp"
 INSTAGRAM_URL = "https://www.instagram.com/turicanje"
@@ -463,37 +525,26 @@ def get_environment_config(phone_number_id: str) -> dict:
 # ================= APP =================
 app = FastAPI(title="Turicanje Bot", version="1.0.0")
 
-# Pool de conexiones a DB
-_pool: Optional[ConnectionPool] = None
-
-def get_pool() -> ConnectionPool:
-    global _pool
-    if _pool is None:
-        conninfo = (
-            f"host={DB_HOST} port={DB_PORT} dbname={DB_NAME} "
-            f"user={DB_USER} password={DB_PASSWORD} sslmode=require"
-        )
-        _pool = ConnectionPool(
-            conninfo=conninfo,
-            min_size=0,
-            max_size=8,
-            kwargs={"autocommit": True},
-            open=False,
-        )
-    try:
-        if getattr(_pool, "closed", True):
-            _pool.open()
-    except Exception:
-        _pool.open()
-    return _pool
+# ✅ Pool ASÍNCRONO de conexiones a DB (services/db): las consultas no bloquean el event loop
+db.init(
+    f"host={DB_HOST} port={DB_PORT} dbname={DB_NAME} "
+    f"user={DB_USER} password={DB_PASSWORD} sslmode=require",
+    min_size=DB_POOL_MIN,
+    max_size=DB_POOL_MAX,
+    slow_query_ms=DB_SLOW_QUERY_MS,
+    max_idle=DB_POOL_MAX_IDLE,
+)
+get_pool = db.get_pool
 
 @app.on_event("startup")
 async def startup():
+    global search_indexes_ready
     try:
-        get_pool().open()
-        with get_pool().connection() as conn, conn.cursor() as cur:
-            cur.execute("SELECT 1;")
-        print("[DB] Pool conectado correctamente")
+        warm_ms = await db.warm_up(timeout=DB_POOL_WARMUP_TIMEOUT)
+        print(f"[DB] Pool conectado correctamente ({DB_POOL_MIN}-{DB_POOL_MAX} conexiones, pre-calentado en {warm_ms:.0f}ms)")
+        await message_dedup.ensure_table()
+        await user_sessions.ensure_table()
+        search_indexes_ready = await search_schema.ensure(get_pool(), SEARCH_DB_INDEXES)
         # Inicializar módulo de loyalty
         loyalty.init(get_pool, send_whatsapp_message, send_whatsapp_image)
         print("[MODULES] ✅ Loyalty module initialized")
@@ -510,9 +561,8 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     try:
-        if _pool and not getattr(_pool, "closed", True):
-            _pool.close()
-            print("[DB] Pool cerrado")
+        await db.close()
+        print("[DB] Pool cerrado")
     except Exception as e:
         print(f"[DB] Error cerrando pool: {e}")
 
@@ -882,14 +932,47 @@ async def send_whatsapp_image(to: str, image_url: str, caption: Optional[str] =
         print(f"{config['prefix']} [ERROR] Enviando imagen: {e}")
 
 # ================= GESTIÓN DE USUARIOS =================
-user_sessions = {}
+# ✅ Interfaz tipo dict; con backend compartido cada mensaje hace load() antes y save() después
+user_sessions = create_session_store(
+    SESSION_STORE,
+    pool_getter=get_pool,
+    sqlite_path=SESSION_SQLITE_PATH,
+    ttl_seconds=SESSION_TTL_SECONDS,
+    max_sessions=SESSION_MAX_COUNT,
+    max_bytes=SESSION_MAX_BYTES
+)
+
+# ✅ Deadlines de inactividad (heap): la revisión de despedidas cuesta O(sesiones que vencen)
+idle_timers = IdleTimers()
+# Sesión expulsada por el tope LRU: ya no hay despedida que mandarle
+user_sessions.on_evict = idle_timers.discard
+
+def _on_session_restored(wa_id: str, session: Session):
+    # Reprogramar la despedida pendiente de la sesión restaurada
+    if not session.goodbye_sent:
+        idle_timers.touch(wa_id, session.last_seen + CONVERSATION_TIMEOUT)
+
+
+session_snapshots = SessionSnapshotter(
+    user_sessions,
+    backend=SESSION_SNAPSHOT,
+    path=SESSION_SNAPSHOT_PATH,
+    pool_getter=get_pool,
+    interval=SESSION_SNAPSHOT_SECONDS,
+    max_age=max(IDLE_RESET_SECONDS, CONVERSATION_TIMEOUT),
+    on_restore=_on_session_restored
+) if SESSION_SNAPSHOT and SESSION_STORE == "memory" else None
+
+# ✅ Despedidas simultáneas máximas (una ráfaga de 500 vencimientos tarda segundos, no minutos)
+goodbye_semaphore = asyncio.Semaphore(GOODBYE_CONCURRENCY)
 
 def reset_user_session(wa_id: str):
     if wa_id in user_sessions:
         del user_sessions[wa_id]
+    idle_timers.discard(wa_id)
     print(f"[SESSION] Reset completo para usuario {wa_id}")
 
-def get_or_create_user_session(wa_id: str) -> Dict[str, Any]:
+def get_or_create_user_session(wa_id: str) -> Session:
     """Crea o recupera sesión de usuario. Siempre usa español."""
     current_time = time.time()
     
@@ -899,30 +982,23 @@ def get_or_create_user_session(wa_id: str) -> Dict[str, Any]:
         
         if time_diff < IDLE_RESET_SECONDS:
             session["last_seen"] = current_time
+            user_sessions.touch(wa_id)
+            idle_timers.touch(wa_id, current_time + CONVERSATION_TIMEOUT)
             return session
         else:
             print(f"[SESSION] Sesión expirada para {wa_id} ({time_diff:.1f}s)")
             reset_user_session(wa_id)
     
     name = get_random_name()  # ✅ Siempre usa nombres en español
-    session = {
-        "session_id": str(uuid.uuid4()),
-        "name": name,
-        "language": "es",  # ✅ SIEMPRE ESPAÑOL
-        "last_seen": current_time,
-        "session_start": current_time,  # ✅ FASE 5: Timestamp de inicio de sesión
-        "is_new": True,
-        "last_search": None,  # ✅ FASE 5: Cambiado de {} a None
-        "last_results": [],
-        "user_location": None,
-        # ✅ FASE 5: Nuevos campos para analytics y despedida
-        "goodbye_sent": False,
-        "message_count": 0,
-        "search_count": 0,
-        "shown_count": 0,
-        "clicked_link": False
-    }
+    # ✅ Sesión compacta (slots): los resultados se guardan como ids + distancias
+    session = Session(
+        name=name,
+        language="es",  # ✅ SIEMPRE ESPAÑOL
+        last_seen=current_time,
+        session_start=current_time  # ✅ FASE 5: Timestamp de inicio de sesión
+    )
     user_sessions[wa_id] = session
+    idle_timers.touch(wa_id, current_time + CONVERSATION_TIMEOUT)
     print(f"[SESSION] Nueva sesión: {wa_id} -> {name} (es)")
     
     # ✅ ANALYTICS: Log session start
@@ -997,45 +1073,87 @@ async def send_goodbye_message(wa_id: str, session: dict):
     except Exception as e:
         print(f"[GOODBYE] Error enviando despedida a {wa_id}: {e}")
 
-def check_idle_sessions():
+async def check_idle_sessions():
     """
-    Verifica sesiones inactivas y envía mensajes de despedida.
-    Se ejecuta cada 30 segundos en background.
+    Envía mensajes de despedida a las sesiones inactivas.
+    Sólo revisa las sesiones cuyo deadline (last_seen + CONVERSATION_TIMEOUT) ya venció
+    y manda las despedidas en paralelo (acotado por GOODBYE_CONCURRENCY).
     """
     
     current_time = time.time()
     sessions_to_goodbye = []
     
-    for wa_id, session in list(user_sessions.items()):
-        last_seen = session.get("last_seen", 0)
-        idle_time = current_time - last_seen
-        goodbye_sent = session.get("goodbye_sent", False)
+    for wa_id in idle_timers.pop_expired(current_time):
+        # Con backend compartido, otro worker pudo haber atendido al usuario después
+        await user_sessions.load(wa_id)
+        session = user_sessions.get(wa_id)
+        if session is None or session.get("goodbye_sent", False):
+            user_sessions.release(wa_id)
+            continue
         
-        # Si pasaron CONVERSATION_TIMEOUT segundos y no se envió despedida
-        if idle_time >= CONVERSATION_TIMEOUT and not goodbye_sent:
+        last_seen = session.get("last_seen", 0)
+        if current_time - last_seen < CONVERSATION_TIMEOUT:
+            # Tuvo actividad en otro worker: reprogramar
+            idle_timers.touch(wa_id, last_seen + CONVERSATION_TIMEOUT)
+            user_sessions.release(wa_id)
+            continue
+        
+        session["goodbye_sent"] = True
+        # Con varios workers, cada uno dispara su timer para el mismo usuario: sólo
+        # despide el que gana la escritura condicional (los demás ven el conflicto)
+        if await user_sessions.save(wa_id):
             sessions_to_goodbye.append((wa_id, session))
-            session["goodbye_sent"] = True
     
-    # Enviar despedidas de forma asíncrona
     if sessions_to_goodbye:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        for wa_id, session in sessions_to_goodbye:
-            try:
-                loop.run_until_complete(send_goodbye_message(wa_id, session))
-            except Exception as e:
-                print(f"[GOODBYE] Error en loop para {wa_id}: {e}")
-        
-        loop.close()
+        print(f"[GOODBYE] Enviando {len(sessions_to_goodbye)} despedida(s)")
+        await asyncio.gather(*(
+            _send_goodbye_limited(wa_id, session) for wa_id, session in sessions_to_goodbye
+        ))
+
+
+async def _send_goodbye_limited(wa_id: str, session: Session):
+    async with goodbye_semaphore:
+        await send_goodbye_message(wa_id, session)
 
-# ✅ Iniciar background scheduler
-from apscheduler.schedulers.background import BackgroundScheduler
 
-scheduler = BackgroundScheduler()
-scheduler.add_job(check_idle_sessions, 'interval', seconds=30)  # Cada 30 segundos
-scheduler.start()
-print("[SCHEDULER] ✅ Background job iniciado - verificando sesiones inactivas cada 30s")
+async def idle_sessions_loop():
+    """Tarea del event loop principal: revisa despedidas cada segundo."""
+    while True:
+        try:
+            await check_idle_sessions()
+        except Exception as e:
+            print(f"[GOODBYE] Error revisando sesiones inactivas: {e}")
+        await asyncio.sleep(1)
+
+
+_idle_task: Optional[asyncio.Task] = None
+
+
+_snapshot_tasks: List[asyncio.Task] = []
+
+
+@app.on_event("startup")
+async def start_idle_sessions_task():
+    global _idle_task
+    _idle_task = asyncio.create_task(idle_sessions_loop(), name="idle-sessions")
+    print("[GOODBYE] ✅ Revisión de sesiones inactivas iniciada (cada 1s)")
+    
+    if session_snapshots:
+        # La restauración corre en segundo plano: el webhook atiende desde el primer momento
+        _snapshot_tasks.append(asyncio.create_task(session_snapshots.restore(), name="session-restore"))
+        _snapshot_tasks.append(asyncio.create_task(session_snapshots.run(), name="session-snapshots"))
+        print(f"[SNAPSHOT] ✅ Snapshots de sesiones cada {SESSION_SNAPSHOT_SECONDS:.0f}s ({SESSION_SNAPSHOT})")
+
+
+@app.on_event("shutdown")
+async def stop_idle_sessions_task():
+    if _idle_task:
+        _idle_task.cancel()
+    for task in _snapshot_tasks:
+        task.cancel()
+    if session_snapshots:
+        # Último snapshot para que el siguiente arranque no pierda nada
+        await session_snapshots.flush()
 
 # ================= FIN FASE 5: DESPEDIDAS =================
 
@@ -1142,7 +1260,7 @@ async def expand_search_terms_with_ai(craving: str, language: str, wa_id: str) -
     Expande términos de búsqueda de manera CONSERVADORA.
     Solo incluye sinónimos muy cercanos o variaciones del mismo platillo.
     """
-    if not OPENAI_API_KEY:
+    if not OPENAI_API_KEY or admission.should_degrade("expansión IA"):
         return [craving]
     
     try:
@@ -1202,6 +1320,13 @@ Responde SOLO una lista separada por comas, sin explicaciones."""
         print(f"[AI-EXPAND] {wa_id}: Error: {e}")
         return [craving]
 
+def extract_intent_heuristic(text: str) -> Dict[str, Any]:
+    """Intención sin IA (modo degradado): saludo si lo parece, si no el texto completo como antojo."""
+    if is_greeting(text):
+        return {"intent": "greeting", "craving": None, "needs_location": False, "business_name": None}
+    return {"intent": "search", "craving": text.strip(), "needs_location": False, "business_name": None}
+
+
 async def extract_intent_with_ai(text: str, language: str, name: str, wa_id: str) -> Dict[str, Any]:
     # ✅ INTENTAR CON CLAUDE PRIMERO (más barato)
     if ANTHROPIC_API_KEY:
@@ -1400,7 +1525,7 @@ business_name only has value if they mentioned a specific business name."""
 
 # ================= BASE DE DATOS: NUEVO ORDEN =================
 
-def search_place_by_name(business_name: str) -> Optional[Dict[str, Any]]:
+async def search_place_by_name(business_name: str) -> Optional[Dict[str, Any]]:
     """
     Busca un negocio específico por nombre EXACTO (ignorando mayúsculas/acentos)
     Solo retorna si el nombre coincide exactamente, no si solo contiene la palabra
@@ -1429,33 +1554,33 @@ def search_place_by_name(business_name: str) -> Optional[Dict[str, Any]]:
         
         print(f"[DB-SEARCH-NAME] Buscando negocio EXACTO: '{business_name}'")
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, params)
-            row = cur.fetchone()
-            
-            if row:
-                place = dict(row)
-                place["products"] = list(place.get("products") or [])
-                # ✅ FIX: Manejar hours correctamente (puede ser dict, string JSON, o None)
-                hours_raw = place.get("hours")
-                if hours_raw is None:
-                    place["hours"] = {}
-                elif isinstance(hours_raw, dict):
-                    place["hours"] = hours_raw
-                elif isinstance(hours_raw, str):
-                    try:
-                        place["hours"] = json.loads(hours_raw)
-                    except:
-                        place["hours"] = {}
-                else:
+        in_catalog, row = place_catalog.find_by_name(business_name) if PLACE_CATALOG_ENABLED else (False, None)
+        if not in_catalog:
+            row = await db.fetch_one("search.by_name", sql, params)
+        
+        if row:
+            place = dict(row)
+            place["products"] = list(place.get("products") or [])
+            # ✅ FIX: Manejar hours correctamente (puede ser dict, string JSON, o None)
+            hours_raw = place.get("hours")
+            if hours_raw is None:
+                place["hours"] = {}
+            elif isinstance(hours_raw, dict):
+                place["hours"] = hours_raw
+            elif isinstance(hours_raw, str):
+                try:
+                    place["hours"] = json.loads(hours_raw)
+                except:
                     place["hours"] = {}
-                # ✅ FIX: Calcular is_open_now (antes no se calculaba)
-                place["is_open_now"] = is_open_now_by_day(place)
-                print(f"[DB-SEARCH-NAME] ✅ Encontrado EXACTO: {place['name']} (abierto={place['is_open_now']})")
-                return place
             else:
-                print(f"[DB-SEARCH-NAME] ❌ No coincide exacto: '{business_name}'")
-                return None
+                place["hours"] = {}
+            # ✅ FIX: Calcular is_open_now (antes no se calculaba)
+            place["is_open_now"] = is_open_now_by_day(place)
+            print(f"[DB-SEARCH-NAME] ✅ Encontrado EXACTO: {place['name']} (abierto={place['is_open_now']})")
+            return place
+        else:
+            print(f"[DB-SEARCH-NAME] ❌ No coincide exacto: '{business_name}'")
+            return None
             
     except Exception as e:
         print(f"[DB-SEARCH-NAME] Error: {e}")
@@ -1466,7 +1591,92 @@ def search_place_by_name(business_name: str) -> Optional[Dict[str, Any]]:
 # (Aprox. línea 1310 de tu app.py)
 # ===========================================================================
 
-def search_exact_in_categories(craving: str, limit: int = 10) -> List[Dict[str, Any]]:
+async def fetch_places_by_ids(place_ids: List[int]) -> List[Dict[str, Any]]:
+    """Trae lugares por id (para resolver resultados guardados en sesión que no están en caché)."""
+    if not place_ids:
+        return []
+    sql = """
+    SELECT id, name, category, products, categories, priority, cashback, hours, 
+           address, phone, url_order, imagen_url, url_extra, afiliado,
+           lat, lng, timezone, delivery,
+           mon_open, mon_close, tue_open, tue_close, wed_open, wed_close,
+           thu_open, thu_close, fri_open, fri_close, sat_open, sat_close,
+           sun_open, sun_close
+    FROM public.places
+    WHERE id = ANY(%s);
+    """
+    catalog_rows = place_catalog.get_many(place_ids) if PLACE_CATALOG_ENABLED else {}
+    missing = [place_id for place_id in place_ids if place_id not in catalog_rows]
+    rows = list(catalog_rows.values())
+    if missing:
+        rows += await db.fetch_all("places.by_ids", sql, (missing,))
+    
+    results = []
+    for row in rows:
+        place = dict(row)
+        place["products"] = list(place.get("products") or [])
+        place["categories"] = list(place.get("categories") or [])
+        results.append(place)
+    return results
+
+
+place_cache.init(fetch_places_by_ids, format_distance, max_entries=PLACE_CACHE_MAX_ENTRIES,
+                 lookup=place_catalog.get_many if PLACE_CATALOG_ENABLED else None)
+
+
+async def load_place_catalog(place_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """Lugares para el catálogo en memoria: todos, o sólo esos ids (recarga tras /sheet/sync)."""
+    if place_ids is None:
+        return await db.fetch_all("catalog.load", search_sql.CATALOG_ALL)
+    return await db.fetch_all("catalog.by_ids", search_sql.CATALOG_BY_IDS, {"ids": list(place_ids)})
+
+
+place_catalog.init(load_place_catalog, max_age=PLACE_CATALOG_MAX_AGE, refresh_interval=PLACE_CATALOG_REFRESH_SECONDS,
+                   reload_delay=PLACE_CATALOG_RELOAD_DELAY)
+
+
+# Se activa en el startup si places tiene las columnas de búsqueda (search_schema.ensure)
+search_indexes_ready = False
+
+
+async def fetch_search_rows(name: str, sql: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Ejecuta una búsqueda de search_sql: desde el catálogo en memoria, o en la BD si no hay snapshot vigente."""
+    # Mismo plegado (minúsculas, sin acentos) en memoria y en la BD: "cafe" encuentra "Café"
+    params = search_sql.fold_params(params)
+    if SEARCH_RADIUS_KM > 0 and sql in search_sql.NEAR:
+        params = search_sql.radius_params(params, SEARCH_RADIUS_KM)
+    if PLACE_CATALOG_ENABLED:
+        rows = place_catalog.search(sql, params)
+        if rows is not None:
+            return rows
+    if search_indexes_ready and sql in search_sql.INDEXED:
+        # Misma búsqueda sobre las columnas plegadas con índice GIN
+        sql = search_sql.INDEXED[sql]
+    if "radius_m" in params:
+        sql = search_sql.BOUNDED[sql]
+    return await db.fetch_all(name, sql, params)
+
+
+_catalog_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def start_place_catalog():
+    global _catalog_task
+    if PLACE_CATALOG_ENABLED:
+        # Carga en segundo plano: mientras tanto las búsquedas van a la BD
+        _catalog_task = asyncio.create_task(place_catalog.run(), name="place-catalog")
+        print(f"[CATALOG] ✅ Catálogo en memoria (recarga cada {PLACE_CATALOG_REFRESH_SECONDS:.0f}s)")
+
+
+@app.on_event("shutdown")
+async def stop_place_catalog():
+    if _catalog_task:
+        _catalog_task.cancel()
+    place_catalog.cancel_reloads()
+
+
+async def search_exact_in_categories(craving: str, limit: int = 10) -> List[Dict[str, Any]]:
     """
     PASO 2 DEL FLUJO SEO: Búsqueda EXACTA en la columna categories.
     
@@ -1482,71 +1692,36 @@ def search_exact_in_categories(craving: str, limit: int = 10) -> List[Dict[str,
     if not craving:
         return []
     
-    # ✅ Obtener filtro de horarios del día
-    today_filter = get_today_hours_filter()
-    
     try:
-        # Normalizar el término para búsqueda (minúsculas)
-        search_term = craving.lower().strip()
-        
-        # También buscar variaciones singular/plural para coincidencia exacta
+        # Variaciones singular/plural para coincidencia exacta (= ANY, no LIKE)
         variations = normalize_search_term(craving)
+        params = {"terms": variations, "weekday": search_sql.today_weekday(), "limit": limit}
+        sql = search_sql.EXACT_IN_CATEGORIES
         
-        # Crear condiciones para coincidencia EXACTA (no LIKE)
-        # Usamos = en lugar de LIKE para que sea exacto
-        exact_conditions = " OR ".join([f"LOWER(item) = %s" for _ in variations])
+        print(f"[DB-SEARCH-SEO] PASO 2: Buscando EXACTO en categories: {variations}")
         
-        sql = f"""
-        SELECT id, name, category, products, categories, priority, cashback, hours, 
-               address, phone, url_order, imagen_url, url_extra, afiliado,
-               lat, lng, timezone, delivery,
-               mon_open, mon_close, tue_open, tue_close, wed_open, wed_close,
-               thu_open, thu_close, fri_open, fri_close, sat_open, sat_close,
-               sun_open, sun_close
-        FROM public.places 
-        WHERE is_active = TRUE
-        AND EXISTS (
-            SELECT 1 FROM jsonb_array_elements_text(categories) as item
-            WHERE {exact_conditions}
-        )
-        AND {today_filter}
-        ORDER BY 
-            CASE WHEN (plan_activo = true AND (plan_fecha_vencimiento IS NULL OR plan_fecha_vencimiento > NOW())) THEN 0 ELSE 1 END ASC,
-            CASE WHEN cashback = true THEN 1 ELSE 0 END DESC,
-            priority DESC,
-            id ASC
-        LIMIT %s;
-        """
+        rows = await fetch_search_rows("search.exact_categories", sql, params)
         
-        # Parámetros: variaciones exactas (sin %) + limit
-        params = tuple(variations + [limit])
+        results = []
+        for row in rows:
+            place = dict(row)
+            place["products"] = list(place.get("products") or [])
+            place["categories"] = list(place.get("categories") or [])
+            place["is_open_now"] = is_open_now_by_day(place)
+            results.append(place)
         
-        print(f"[DB-SEARCH-SEO] PASO 2: Buscando EXACTO en categories: {variations}")
+        if results:
+            print(f"[DB-SEARCH-SEO] ✅ PASO 2: Encontrados {len(results)} con coincidencia EXACTA en categories")
+        else:
+            print(f"[DB-SEARCH-SEO] ❌ PASO 2: No hay coincidencia exacta en categories")
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-            
-            results = []
-            for row in rows:
-                place = dict(row)
-                place["products"] = list(place.get("products") or [])
-                place["categories"] = list(place.get("categories") or [])
-                place["is_open_now"] = is_open_now_by_day(place)
-                results.append(place)
-            
-            if results:
-                print(f"[DB-SEARCH-SEO] ✅ PASO 2: Encontrados {len(results)} con coincidencia EXACTA en categories")
-            else:
-                print(f"[DB-SEARCH-SEO] ❌ PASO 2: No hay coincidencia exacta en categories")
-            
-            return results
+        return results
             
     except Exception as e:
         print(f"[DB-SEARCH-SEO] Error en búsqueda exacta categories: {e}")
         return []
 
-def search_exact_user_text(raw_text: str, limit: int = 10) -> List[Dict[str, Any]]:
+async def search_exact_user_text(raw_text: str, limit: int = 10) -> List[Dict[str, Any]]:
     """
     NUEVA FUNCIÓN: Busca el texto EXACTO del usuario en categories.
     
@@ -1565,50 +1740,25 @@ def search_exact_user_text(raw_text: str, limit: int = 10) -> List[Dict[str, Any
     
     search_term = raw_text.lower().strip()
     
-    # ✅ Obtener filtro de horarios del día
-    today_filter = get_today_hours_filter()
-    
     try:
-        # Buscar coincidencia EXACTA en categories (ignorando mayúsculas)
-        sql_exact = f"""
-        SELECT id, name, category, products, categories, priority, cashback, hours, 
-               address, phone, url_order, imagen_url, url_extra, afiliado,
-               lat, lng, timezone, delivery,
-               mon_open, mon_close, tue_open, tue_close, wed_open, wed_close,
-               thu_open, thu_close, fri_open, fri_close, sat_open, sat_close,
-               sun_open, sun_close
-        FROM public.places 
-        WHERE is_active = TRUE
-        AND EXISTS (
-            SELECT 1 FROM jsonb_array_elements_text(categories) as item
-            WHERE LOWER(item) = %s
-        )
-        AND {today_filter}
-        ORDER BY 
-            CASE WHEN (plan_activo = true AND (plan_fecha_vencimiento IS NULL OR plan_fecha_vencimiento > NOW())) THEN 0 ELSE 1 END ASC,
-            CASE WHEN cashback = true THEN 1 ELSE 0 END DESC,
-            priority DESC,
-            id ASC
-        LIMIT %s;
-        """
+        # Coincidencia EXACTA en categories (misma sentencia que el PASO 2, con un solo término)
+        params = {"terms": [search_term], "weekday": search_sql.today_weekday(), "limit": limit}
         
         print(f"[EXACT-USER-TEXT] Buscando EXACTO: '{search_term}'")
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql_exact, (search_term, limit))
-            rows = cur.fetchall()
+        rows = await fetch_search_rows("search.exact_user_text", search_sql.EXACT_IN_CATEGORIES, params)
+        
+        if rows:
+            results = []
+            for row in rows:
+                place = dict(row)
+                place["products"] = list(place.get("products") or [])
+                place["categories"] = list(place.get("categories") or [])
+                place["is_open_now"] = is_open_now_by_day(place)
+                results.append(place)
             
-            if rows:
-                results = []
-                for row in rows:
-                    place = dict(row)
-                    place["products"] = list(place.get("products") or [])
-                    place["categories"] = list(place.get("categories") or [])
-                    place["is_open_now"] = is_open_now_by_day(place)
-                    results.append(place)
-                
-                print(f"[EXACT-USER-TEXT] ✅ Encontrados {len(results)} con texto EXACTO '{search_term}'")
-                return results
+            print(f"[EXACT-USER-TEXT] ✅ Encontrados {len(results)} con texto EXACTO '{search_term}'")
+            return results
         
         print(f"[EXACT-USER-TEXT] ❌ No hay coincidencia exacta para '{search_term}'")
         return []
@@ -1617,7 +1767,7 @@ def search_exact_user_text(raw_text: str, limit: int = 10) -> List[Dict[str, Any
         print(f"[EXACT-USER-TEXT] Error: {e}")
         return []
 
-def search_places_without_location(craving: str, limit: int = 10) -> List[Dict[str, Any]]:
+async def search_places_without_location(craving: str, limit: int = 10) -> List[Dict[str, Any]]:
     """
     FLUJO SEO COMPLETO (3 PASOS):
     
@@ -1633,7 +1783,7 @@ def search_places_without_location(craving: str, limit: int = 10) -> List[Dict[s
     # ═══════════════════════════════════════════════════════════════
     # PASO 2: Búsqueda EXACTA en categories (SEO)
     # ═══════════════════════════════════════════════════════════════
-    exact_results = search_exact_in_categories(craving, limit)
+    exact_results = await search_exact_in_categories(craving, limit)
     
     if exact_results:
         # ✅ Encontró coincidencia exacta → retornar SOLO esos
@@ -1645,69 +1795,30 @@ def search_places_without_location(craving: str, limit: int = 10) -> List[Dict[s
     # ═══════════════════════════════════════════════════════════════
     print(f"[DB-SEARCH-SEO] PASO 3: No hay exacto, buscando AMPLIO con LIKE...")
     
-    # ✅ Obtener filtro de horarios del día
-    today_filter = get_today_hours_filter()
-    
     try:
         # ✅ Crear variaciones de búsqueda (singular/plural)
         variations = normalize_search_term(craving)
         print(f"[DB-SEARCH] Variaciones de '{craving}': {variations}")
         
-        # Crear condiciones OR para cada variación (con LIKE para búsqueda amplia)
-        or_conditions_cat = " OR ".join([f"LOWER(item) LIKE %s" for _ in variations])
-        or_conditions_prod = " OR ".join([f"LOWER(item) LIKE %s" for _ in variations])
-        or_conditions_category = " OR ".join([f"LOWER(category) LIKE %s" for _ in variations])
+        # Patrones LIKE como un solo array: LIKE ANY en categories/products/category
+        patterns = search_sql.like_patterns(variations)
+        params = {"patterns": patterns, "weekday": search_sql.today_weekday(), "limit": limit}
+        sql = search_sql.BROAD
         
-        sql = f"""
-        SELECT id, name, category, products, categories, priority, cashback, hours, 
-               address, phone, url_order, imagen_url, url_extra, afiliado,
-               lat, lng, timezone, delivery,
-               mon_open, mon_close, tue_open, tue_close, wed_open, wed_close,
-               thu_open, thu_close, fri_open, fri_close, sat_open, sat_close,
-               sun_open, sun_close
-        FROM public.places 
-        WHERE is_active = TRUE
-        AND (
-            EXISTS (
-                SELECT 1 FROM jsonb_array_elements_text(categories) as item
-                WHERE {or_conditions_cat}
-            )
-            OR EXISTS (
-                SELECT 1 FROM jsonb_array_elements_text(products) as item
-                WHERE {or_conditions_prod}
-            )
-            OR ({or_conditions_category})
-        )
-        AND {today_filter}
-        ORDER BY 
-            CASE WHEN (plan_activo = true AND (plan_fecha_vencimiento IS NULL OR plan_fecha_vencimiento > NOW())) THEN 0 ELSE 1 END ASC,
-            CASE WHEN cashback = true THEN 1 ELSE 0 END DESC,
-            priority DESC,
-            id ASC
-        LIMIT %s;
-        """
+        print(f"[DB-SEARCH-SEO] PASO 3: Buscando AMPLIO '{craving}' con patrones: {patterns}")
         
-        # Crear patrones LIKE para cada variación
-        patterns = [f"%{v}%" for v in variations]
-        # params: patterns para categories + patterns para products + patterns para category + limit
-        params = tuple(patterns + patterns + patterns + [limit])
+        rows = await fetch_search_rows("search.broad_like", sql, params)
         
-        print(f"[DB-SEARCH-SEO] PASO 3: Buscando AMPLIO '{craving}' con patrones: {patterns}")
+        results = []
+        for row in rows:
+            place = dict(row)
+            place["products"] = list(place.get("products") or [])
+            place["categories"] = list(place.get("categories") or [])
+            place["is_open_now"] = is_open_now_by_day(place)
+            results.append(place)
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-            
-            results = []
-            for row in rows:
-                place = dict(row)
-                place["products"] = list(place.get("products") or [])
-                place["categories"] = list(place.get("categories") or [])
-                place["is_open_now"] = is_open_now_by_day(place)
-                results.append(place)
-            
-            print(f"[DB-SEARCH-SEO] PASO 3: {len(results)} resultados con búsqueda AMPLIA")
-            return results
+        print(f"[DB-SEARCH-SEO] PASO 3: {len(results)} resultados con búsqueda AMPLIA")
+        return results
             
     except Exception as e:
         print(f"[DB-SEARCH] Error: {e}")
@@ -1728,7 +1839,7 @@ async def search_places_without_location_ai(craving: str, language: str, wa_id:
     
     # ETAPA 1: Buscar término EXACTO primero
     print(f"[DB-SEARCH] ETAPA 1: Buscando término exacto '{craving}'")
-    exact_results = search_places_without_location(craving, limit)
+    exact_results = await search_places_without_location(craving, limit)
     
     if exact_results:
         print(f"[DB-SEARCH] ✅ Encontrados {len(exact_results)} con término exacto")
@@ -1738,76 +1849,40 @@ async def search_places_without_location_ai(craving: str, language: str, wa_id:
     print(f"[DB-SEARCH] ETAPA 2: No encontró exacto, expandiendo con IA...")
     expanded_terms = await expand_search_terms_with_ai(craving, language, wa_id)
     
-    # ✅ FASE 2: Obtener filtro de horarios del día
-    today_filter = get_today_hours_filter()
-    
     try:
-        # Crear condiciones OR dinámicas para cada término
-        or_conditions = " OR ".join([f"LOWER(item) LIKE %(pattern_{i})s" for i in range(len(expanded_terms))])
-        or_conditions_category = " OR ".join([f"LOWER(category) LIKE %(pattern_{i})s" for i in range(len(expanded_terms))])
-        
-        sql = f"""
-        SELECT id, name, category, products, priority, cashback, hours, 
-               address, phone, url_order, imagen_url, url_extra, afiliado,
-               lat, lng, timezone, delivery,
-               mon_open, mon_close, tue_open, tue_close, wed_open, wed_close,
-               thu_open, thu_close, fri_open, fri_close, sat_open, sat_close,
-               sun_open, sun_close
-        FROM public.places 
-        WHERE is_active = TRUE
-        AND (
-            EXISTS (
-                SELECT 1 FROM jsonb_array_elements_text(categories) as item
-                WHERE {or_conditions}
-            )
-            OR EXISTS (
-                SELECT 1 FROM jsonb_array_elements_text(products) as item
-                WHERE {or_conditions}
-            )
-            OR {or_conditions_category}
-        )
-        AND {today_filter}
-        ORDER BY 
-            CASE WHEN (plan_activo = true AND (plan_fecha_vencimiento IS NULL OR plan_fecha_vencimiento > NOW())) THEN 0 ELSE 1 END ASC,
-            CASE WHEN cashback = true THEN 1 ELSE 0 END DESC,
-            priority DESC,
-            (SELECT COUNT(*) FROM jsonb_array_elements_text(categories) as item
-             WHERE {or_conditions}) DESC,
-            id ASC
-        LIMIT %(limit)s;
-        """
-        
-        # Crear parámetros dinámicos para cada término
-        params = {f"pattern_{i}": f"%{term}%" for i, term in enumerate(expanded_terms)}
-        params["limit"] = limit
+        # Todos los términos expandidos en un solo parámetro array (LIKE ANY)
+        params = {
+            "patterns": search_sql.like_patterns(expanded_terms),
+            "weekday": search_sql.today_weekday(),
+            "limit": limit
+        }
+        sql = search_sql.EXPANDED
         
         print(f"[DB-SEARCH] Buscando con expansión: {expanded_terms}")
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-            
-            results = []
-            for row in rows:
-                place = dict(row)
-                place["products"] = list(place.get("products") or [])
-                place["is_open_now"] = is_open_now_by_day(place)
+        rows = await fetch_search_rows("search.expanded", sql, params)
+        
+        results = []
+        for row in rows:
+            place = dict(row)
+            place["products"] = list(place.get("products") or [])
+            place["is_open_now"] = is_open_now_by_day(place)
 
-                results.append(place)
-            
-            if results:
-                print(f"[DB-SEARCH] ✅ Encontrados {len(results)} con expansión")
-            else:
-                print(f"[DB-SEARCH] ❌ No encontró nada ni con expansión")
-            
-            return results, True  # used_expansion=True
+            results.append(place)
+        
+        if results:
+            print(f"[DB-SEARCH] ✅ Encontrados {len(results)} con expansión")
+        else:
+            print(f"[DB-SEARCH] ❌ No encontró nada ni con expansión")
+        
+        return results, True  # used_expansion=True
             
     except Exception as e:
         print(f"[DB-SEARCH] Error con expansión: {e}")
         return [], False
         return []
 
-def search_places_with_location(craving: str, user_lat: float, user_lng: float, limit: int = 10) -> List[Dict[str, Any]]:
+async def search_places_with_location(craving: str, user_lat: float, user_lng: float, limit: int = 10) -> List[Dict[str, Any]]:
     """
     FLUJO SEO COMPLETO CON UBICACIÓN (3 PASOS):
     
@@ -1820,143 +1895,27 @@ def search_places_with_location(craving: str, user_lat: float, user_lng: float,
     if not craving:
         return []
     
-    # ✅ Obtener filtro de horarios del día
-    today_filter = get_today_hours_filter()
+    weekday = search_sql.today_weekday()
     
     # ═══════════════════════════════════════════════════════════════
     # PASO 2: Búsqueda EXACTA en categories (SEO) - CON DISTANCIA
     # ═══════════════════════════════════════════════════════════════
     try:
         variations = normalize_search_term(craving)
-        exact_conditions = " OR ".join([f"LOWER(item) = %s" for _ in variations])
-        
-        sql_exact = f"""
-        WITH distances AS (
-            SELECT id, name, category, products, categories, priority, cashback, hours,
-                   address, phone, url_order, imagen_url, url_extra, afiliado,
-                   lat, lng, timezone, delivery,
-                   plan_activo, plan_fecha_vencimiento,
-                   mon_open, mon_close, tue_open, tue_close, wed_open, wed_close,
-                   thu_open, thu_close, fri_open, fri_close, sat_open, sat_close,
-                   sun_open, sun_close,
-                   CASE 
-                       WHEN lat IS NOT NULL AND lng IS NOT NULL THEN
-                           6371000 * 2 * ASIN(SQRT(
-                               POWER(SIN(RADIANS((lat - %s) / 2)), 2) +
-                               COS(RADIANS(%s)) * COS(RADIANS(lat)) *
-                               POWER(SIN(RADIANS((lng - %s) / 2)), 2)
-                           ))
-                       ELSE 999999
-                   END as distance_meters
-            FROM public.places 
-            WHERE is_active = TRUE
-            AND EXISTS (
-                SELECT 1 FROM jsonb_array_elements_text(categories) as item
-                WHERE {exact_conditions}
-            )
-            AND {today_filter}
-        )
-        SELECT * FROM distances
-        ORDER BY 
-            CASE WHEN (plan_activo = true AND (plan_fecha_vencimiento IS NULL OR plan_fecha_vencimiento > NOW())) THEN 0 ELSE 1 END ASC,
-            CASE WHEN cashback = true THEN 1 ELSE 0 END DESC,
-            priority DESC,
-            distance_meters ASC
-        LIMIT %s;
-        """
-        
-        params_exact = tuple([user_lat, user_lat, user_lng] + variations + [limit])
+        params_exact = {
+            "terms": variations,
+            "user_lat": user_lat,
+            "user_lng": user_lng,
+            "weekday": weekday,
+            "limit": limit
+        }
+        sql_exact = search_sql.EXACT_IN_CATEGORIES_NEAR
         
         print(f"[DB-SEARCH-SEO] PASO 2 (con ubicación): Buscando EXACTO en categories: {variations}")
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql_exact, params_exact)
-            rows = cur.fetchall()
-            
-            if rows:
-                results = []
-                for row in rows:
-                    place = dict(row)
-                    place["products"] = list(place.get("products") or [])
-                    place["categories"] = list(place.get("categories") or [])
-                    place["is_open_now"] = is_open_now_by_day(place)
-                    if place.get("distance_meters") and place["distance_meters"] < 999999:
-                        place["distance_text"] = format_distance(place["distance_meters"])
-                    else:
-                        place["distance_text"] = ""
-                    results.append(place)
-                
-                print(f"[DB-SEARCH-SEO] ✅ PASO 2: Encontrados {len(results)} con coincidencia EXACTA")
-                return results
-            
-            print(f"[DB-SEARCH-SEO] ❌ PASO 2: No hay coincidencia exacta, continuando a PASO 3...")
-            
-    except Exception as e:
-        print(f"[DB-SEARCH-SEO] Error en PASO 2: {e}")
-    
-    # ═══════════════════════════════════════════════════════════════
-    # PASO 3: Búsqueda AMPLIA con LIKE (fallback)
-    # ═══════════════════════════════════════════════════════════════
-    try:
-        variations = normalize_search_term(craving)
-        
-        # Crear condiciones OR para cada variación (con LIKE para búsqueda amplia)
-        or_conditions_cat = " OR ".join([f"LOWER(item) LIKE %s" for _ in variations])
-        or_conditions_prod = " OR ".join([f"LOWER(item) LIKE %s" for _ in variations])
-        or_conditions_category = " OR ".join([f"LOWER(category) LIKE %s" for _ in variations])
-        
-        sql = f"""
-        WITH distances AS (
-            SELECT id, name, category, products, categories, priority, cashback, hours,
-                   address, phone, url_order, imagen_url, url_extra, afiliado,
-                   lat, lng, timezone, delivery,
-                   plan_activo, plan_fecha_vencimiento,
-                   mon_open, mon_close, tue_open, tue_close, wed_open, wed_close,
-                   thu_open, thu_close, fri_open, fri_close, sat_open, sat_close,
-                   sun_open, sun_close,
-                   CASE 
-                       WHEN lat IS NOT NULL AND lng IS NOT NULL THEN
-                           6371000 * 2 * ASIN(SQRT(
-                               POWER(SIN(RADIANS((lat - %s) / 2)), 2) +
-                               COS(RADIANS(%s)) * COS(RADIANS(lat)) *
-                               POWER(SIN(RADIANS((lng - %s) / 2)), 2)
-                           ))
-                       ELSE 999999
-                   END as distance_meters
-            FROM public.places 
-            WHERE is_active = TRUE
-            AND (
-                EXISTS (
-                    SELECT 1 FROM jsonb_array_elements_text(categories) as item
-                    WHERE {or_conditions_cat}
-                )
-                OR EXISTS (
-                    SELECT 1 FROM jsonb_array_elements_text(products) as item
-                    WHERE {or_conditions_prod}
-                )
-                OR ({or_conditions_category})
-            )
-            AND {today_filter}
-        )
-        SELECT * FROM distances
-        ORDER BY 
-            CASE WHEN (plan_activo = true AND (plan_fecha_vencimiento IS NULL OR plan_fecha_vencimiento > NOW())) THEN 0 ELSE 1 END ASC,
-            CASE WHEN cashback = true THEN 1 ELSE 0 END DESC,
-            priority DESC,
-            distance_meters ASC
-        LIMIT %s;
-        """
-        
-        # Crear patrones LIKE para cada variación
-        patterns = [f"%{v}%" for v in variations]
-        params = tuple([user_lat, user_lat, user_lng] + patterns + patterns + patterns + [limit])
+        rows = await fetch_search_rows("search.exact_categories_near", sql_exact, params_exact)
         
-        print(f"[DB-SEARCH-SEO] PASO 3 (con ubicación): Buscando AMPLIO con patrones: {patterns}")
-        
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-            
+        if rows:
             results = []
             for row in rows:
                 place = dict(row)
@@ -1969,8 +1928,49 @@ def search_places_with_location(craving: str, user_lat: float, user_lng: float,
                     place["distance_text"] = ""
                 results.append(place)
             
-            print(f"[DB-SEARCH-SEO] PASO 3: {len(results)} resultados con búsqueda AMPLIA")
+            print(f"[DB-SEARCH-SEO] ✅ PASO 2: Encontrados {len(results)} con coincidencia EXACTA")
             return results
+        
+        print(f"[DB-SEARCH-SEO] ❌ PASO 2: No hay coincidencia exacta, continuando a PASO 3...")
+            
+    except Exception as e:
+        print(f"[DB-SEARCH-SEO] Error en PASO 2: {e}")
+    
+    # ═══════════════════════════════════════════════════════════════
+    # PASO 3: Búsqueda AMPLIA con LIKE (fallback)
+    # ═══════════════════════════════════════════════════════════════
+    try:
+        variations = normalize_search_term(craving)
+        
+        # Patrones LIKE como un solo array: LIKE ANY en categories/products/category
+        patterns = search_sql.like_patterns(variations)
+        params = {
+            "patterns": patterns,
+            "user_lat": user_lat,
+            "user_lng": user_lng,
+            "weekday": weekday,
+            "limit": limit
+        }
+        sql = search_sql.BROAD_NEAR
+        
+        print(f"[DB-SEARCH-SEO] PASO 3 (con ubicación): Buscando AMPLIO con patrones: {patterns}")
+        
+        rows = await fetch_search_rows("search.broad_like_near", sql, params)
+        
+        results = []
+        for row in rows:
+            place = dict(row)
+            place["products"] = list(place.get("products") or [])
+            place["categories"] = list(place.get("categories") or [])
+            place["is_open_now"] = is_open_now_by_day(place)
+            if place.get("distance_meters") and place["distance_meters"] < 999999:
+                place["distance_text"] = format_distance(place["distance_meters"])
+            else:
+                place["distance_text"] = ""
+            results.append(place)
+        
+        print(f"[DB-SEARCH-SEO] PASO 3: {len(results)} resultados con búsqueda AMPLIA")
+        return results
             
     except Exception as e:
         print(f"[DB-SEARCH] Error con ubicación: {e}")
@@ -1989,7 +1989,7 @@ async def search_places_with_location_ai(craving: str, user_lat: float, user_lng
     
     # ETAPA 1: Buscar término EXACTO primero
     print(f"[DB-SEARCH] ETAPA 1 (con ubicación): Buscando término exacto '{craving}'")
-    exact_results = search_places_with_location(craving, user_lat, user_lng, limit)
+    exact_results = await search_places_with_location(craving, user_lat, user_lng, limit)
     
     if exact_results:
         print(f"[DB-SEARCH] ✅ Encontrados {len(exact_results)} con término exacto")
@@ -1999,92 +1999,41 @@ async def search_places_with_location_ai(craving: str, user_lat: float, user_lng
     print(f"[DB-SEARCH] ETAPA 2 (con ubicación): No encontró exacto, expandiendo con IA...")
     expanded_terms = await expand_search_terms_with_ai(craving, language, wa_id)
     
-    # ✅ FASE 2: Obtener filtro de horarios del día
-    today_filter = get_today_hours_filter()
-    
     try:
-        # Crear condiciones OR dinámicas para cada término
-        or_conditions = " OR ".join([f"LOWER(item) LIKE %(pattern_{i})s" for i in range(len(expanded_terms))])
-        or_conditions_category = " OR ".join([f"LOWER(category) LIKE %(pattern_{i})s" for i in range(len(expanded_terms))])
-        
-        sql = f"""
-        WITH distances AS (
-            SELECT id, name, category, products, priority, cashback, hours,
-                   address, phone, url_order, imagen_url, url_extra, afiliado,
-                   lat, lng, timezone, delivery,
-                   plan_activo, plan_fecha_vencimiento,
-                   mon_open, mon_close, tue_open, tue_close, wed_open, wed_close,
-                   thu_open, thu_close, fri_open, fri_close, sat_open, sat_close,
-                   sun_open, sun_close,
-                   CASE 
-                       WHEN lat IS NOT NULL AND lng IS NOT NULL THEN
-                           6371000 * 2 * ASIN(SQRT(
-                               POWER(SIN(RADIANS((lat - %(user_lat)s) / 2)), 2) +
-                               COS(RADIANS(%(user_lat)s)) * COS(RADIANS(lat)) *
-                               POWER(SIN(RADIANS((lng - %(user_lng)s) / 2)), 2)
-                           ))
-                       ELSE 999999
-                   END as distance_meters,
-                   (SELECT COUNT(*) FROM jsonb_array_elements_text(categories) as item
-                    WHERE {or_conditions}) as product_match_score
-            FROM public.places 
-            WHERE (
-                EXISTS (
-                    SELECT 1 FROM jsonb_array_elements_text(categories) as item
-                    WHERE {or_conditions}
-                )
-                OR EXISTS (
-                    SELECT 1 FROM jsonb_array_elements_text(products) as item
-                    WHERE {or_conditions}
-                )
-                OR {or_conditions_category}
-            )
-            AND {today_filter}
-        )
-        SELECT * FROM distances
-        ORDER BY 
-            CASE WHEN (plan_activo = true AND (plan_fecha_vencimiento IS NULL OR plan_fecha_vencimiento > NOW())) THEN 0 ELSE 1 END ASC,
-            CASE WHEN cashback = true THEN 1 ELSE 0 END DESC,
-            priority DESC,
-            product_match_score DESC,
-            distance_meters ASC
-        LIMIT %(limit)s;
-        """
-        
-        # Crear parámetros dinámicos para cada término
-        params = {f"pattern_{i}": f"%{term}%" for i, term in enumerate(expanded_terms)}
-        params.update({
+        # Todos los términos expandidos en un solo parámetro array (LIKE ANY)
+        params = {
+            "patterns": search_sql.like_patterns(expanded_terms),
             "user_lat": user_lat,
             "user_lng": user_lng,
+            "weekday": search_sql.today_weekday(),
             "limit": limit
-        })
+        }
+        sql = search_sql.EXPANDED_NEAR
         
         print(f"[DB-SEARCH] Buscando con expansión y ubicación: {expanded_terms}")
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-            
-            results = []
-            for row in rows:
-                place = dict(row)
-                place["products"] = list(place.get("products") or [])
-                place["is_open_now"] = is_open_now_by_day(place)
+        rows = await fetch_search_rows("search.expanded_near", sql, params)
+        
+        results = []
+        for row in rows:
+            place = dict(row)
+            place["products"] = list(place.get("products") or [])
+            place["is_open_now"] = is_open_now_by_day(place)
 
-                
-                if place.get("distance_meters") and place["distance_meters"] < 999999:
-                    place["distance_text"] = format_distance(place["distance_meters"])
-                else:
-                    place["distance_text"] = ""
-                
-                results.append(place)
             
-            if results:
-                print(f"[DB-SEARCH] ✅ Encontrados {len(results)} con expansión y ubicación")
+            if place.get("distance_meters") and place["distance_meters"] < 999999:
+                place["distance_text"] = format_distance(place["distance_meters"])
             else:
-                print(f"[DB-SEARCH] ❌ No encontró nada ni con expansión")
+                place["distance_text"] = ""
             
-            return results, True  # used_expansion=True
+            results.append(place)
+        
+        if results:
+            print(f"[DB-SEARCH] ✅ Encontrados {len(results)} con expansión y ubicación")
+        else:
+            print(f"[DB-SEARCH] ❌ No encontró nada ni con expansión")
+        
+        return results, True  # used_expansion=True
             
     except Exception as e:
         print(f"[DB-SEARCH] Error con expansión y ubicación: {e}")
@@ -2258,7 +2207,7 @@ def get_smart_response_message(results: List[Dict[str, Any]], craving: str, lang
 # ================= SALUDOS CON IA =================
 async def generate_humanized_greeting(name: str, language: str) -> str:
     """Genera saludo humanizado con IA. SIEMPRE EN ESPAÑOL."""
-    if not OPENAI_API_KEY:
+    if not OPENAI_API_KEY or admission.should_degrade("saludo IA"):
         return get_fallback_greeting(name, language)
     
     try:
@@ -2371,6 +2320,12 @@ async def health():
         "time": local_now().isoformat(),
         "dry_run": not SEND_VIA_WHATSAPP,
         "active_sessions": len(user_sessions),
+        "sessions": {
+            "live": len(user_sessions),
+            "max_sessions": user_sessions.max_sessions,
+            "evictions": user_sessions.evictions,
+            "approx_bytes": user_sessions.approx_bytes(),
+        },
         "db_connected": True
     }
 @app.get("/debug/cashback")
@@ -2385,9 +2340,9 @@ async def debug_cashback_database():
         LIMIT 10;
         """
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql)
-            rows = cur.fetchall()
+        async with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+            await cur.execute(sql)
+            rows = await cur.fetchall()
             
             results = []
             for row in rows:
@@ -2425,9 +2380,9 @@ async def debug_verify_place(place_name: str):
         
         search_pattern = f"%{place_name.lower()}%"
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, (search_pattern,))
-            rows = cur.fetchall()
+        async with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+            await cur.execute(sql, (search_pattern,))
+            rows = await cur.fetchall()
             
             if not rows:
                 return {"status": "not_found", "search": place_name}
@@ -2463,9 +2418,9 @@ async def debug_place_hours(place_id: int):
         WHERE id = %s;
         """
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, (place_id,))
-            row = cur.fetchone()
+        async with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+            await cur.execute(sql, (place_id,))
+            row = await cur.fetchone()
             
             if row:
                 place = dict(row)
@@ -2498,9 +2453,9 @@ async def fix_cashback_real(negocio_id: int, value: bool):
         RETURNING negocio_id, cashback;
         """
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, (negocio_id, value, value))
-            row = cur.fetchone()
+        async with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+            await cur.execute(sql, (negocio_id, value, value))
+            row = await cur.fetchone()
             
             if row:
                 return {
@@ -2525,9 +2480,9 @@ async def debug_database_structure():
         ORDER BY table_name;
         """
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql)
-            rows = cur.fetchall()
+        async with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+            await cur.execute(sql)
+            rows = await cur.fetchall()
             
             tables = []
             views = []
@@ -2538,8 +2493,8 @@ async def debug_database_structure():
                     views.append(row["table_name"])
             
             # Buscar la definición de la vista places
-            cur.execute("SELECT definition FROM pg_views WHERE viewname = 'places'")
-            view_def = cur.fetchone()
+            await cur.execute("SELECT definition FROM pg_views WHERE viewname = 'places'")
+            view_def = await cur.fetchone()
             
             return {
                 "tables": tables,
@@ -2572,59 +2527,334 @@ async def handle_webhook(request: Request):
         print("[WEBHOOK] Firma inválida")
         raise HTTPException(status_code=403, detail="Firma inválida")
     
+    # ✅ Fast path: callbacks de statuses (sent/delivered/read) y otros eventos sin
+    # mensajes se cuentan y descartan sin decodificar el JSON. Va DESPUÉS de la
+    # firma: un POST sin firmar no debe inflar los contadores ni la captura
+    event_kind = webhook_events.classify_payload(body)
+    
+    # 📼 Modo captura: guardar el payload (sanitizado) para reproducirlo offline
+    if webhook_recorder:
+        webhook_recorder.record(body, event_kind)
+    
+    if event_kind == "statuses":
+        webhook_events.count_statuses(body)
+        return {"status": "ignored", "event": "statuses"}
+    if event_kind == "other":
+        webhook_events.count_event("other")
+        return {"status": "ignored", "event": "other"}
+    
+    # ✅ Los bytes ya verificados se decodifican UNA sola vez (orjson/msgspec si están instalados)
     try:
-        data = await request.json()
+        data = webhook_parser.loads(body)
     except Exception as e:
         print(f"[WEBHOOK] JSON inválido: {e}")
         raise HTTPException(status_code=400, detail="JSON inválido")
     
-    entries = data.get("entry", [])
-    if not entries:
+    if not isinstance(data, dict) or not data.get("entry"):
         return {"status": "no entries"}
     
-    changes = entries[0].get("changes", [])
-    if not changes:
-        return {"status": "no changes"}
+    # ✅ Recorrer TODO el batch: Meta puede mandar varias entries/changes/messages
+    batches = group_webhook_messages(data)
     
-    value = changes[0].get("value", {})
+    # ✅ Descartar re-entregas antes de cualquier trabajo caro
+    batches = await drop_duplicate_messages(batches)
     
-    # ✅ NUEVO: Extraer phone_number_id
-    phone_number_id = value.get("metadata", {}).get("phone_number_id", "")
-    config = get_environment_config(phone_number_id)
+    if not batches:
+        return {"status": "no messages"}
     
-    messages = value.get("messages", [])
+    total_messages = sum(len(items) for items in batches.values())
     
-    if not messages:
-        return {"status": "no messages"}
+    # ✅ Control de admisión: si ya hay demasiados mensajes aceptados, 503 para que Meta reintente
+    if not admission.try_reserve(total_messages):
+        print(f"[ADMISSION] ❌ Saturado ({admission.reserved}/{admission.capacity}), rechazando {total_messages} mensaje(s)")
+        await shed_batches(batches.values(), reserved=False)
+        raise HTTPException(status_code=503, detail="Servicio saturado")
     
-    message = messages[0]
-    from_wa = message.get("from", "")
-    message_type = message.get("type", "")
+    # ✅ Modo asíncrono: encolar (un item por usuario, en su carril) y responder de inmediato
+    if WEBHOOK_ASYNC_MODE and webhook_queues["slow"].running:
+        rejected = []
+        for wa_id, items in batches.items():
+            if not submit_to_lane(wa_id, items):
+                rejected.append(items)
+        if rejected:
+            # Cola llena: no procesar inline (eso deja la concurrencia sin tope); Meta reintenta
+            # los rechazados y los ya encolados se descartan como duplicados en el reintento
+            print(f"[WEBHOOK] ⚠️ Cola llena, rechazando {len(rejected)} usuario(s)")
+            admission.shed += sum(len(items) for items in rejected)
+            await shed_batches(rejected)
+            raise HTTPException(status_code=503, detail="Cola llena")
+        return {"status": "queued", "messages": total_messages, "users": len(batches)}
     
-    print(f"{config['prefix']} [WEBHOOK] Mensaje de {from_wa}, tipo: {message_type}")
+    # Usuarios distintos en paralelo, mensajes de un mismo usuario en orden
+    await asyncio.gather(*(process_user_messages(wa_id, items) for wa_id, items in batches.items()))
     
-    if message_type == "text":
-        text = message.get("text", {}).get("body", "").strip()
-        await handle_text_message(from_wa, text, phone_number_id)
+    return {"status": "processed", "messages": total_messages, "users": len(batches)}
+
+
+async def shed_batches(batches, reserved: bool = True):
+    """
+    Olvida los ids de mensajes rechazados para que el reintento de Meta no se descarte,
+    y libera su reserva si se llegó a tomar (reserved).
+    """
+    message_ids = []
+    for items in batches:
+        if reserved:
+            admission.release(len(items))
+        message_ids.extend(message.message_id for message in items)
+    await message_dedup.forget(message_ids)
+
+
+def group_webhook_messages(data: dict) -> Dict[str, List[IncomingMessage]]:
+    """
+    Aplana entry → changes → messages y agrupa por usuario (wa_id),
+    conservando el orden de llegada de cada usuario.
+    Retorna: {wa_id: [IncomingMessage, ...]}
+    """
+    batches: Dict[str, List[IncomingMessage]] = {}
+    
+    for message in webhook_parser.iter_messages(data):
+        webhook_events.count_message(message.type)
+        
+        # Reacciones, stickers, imágenes, etc. no se procesan: no crear mailbox ni sesión
+        if message.type not in webhook_events.SUPPORTED_MESSAGE_TYPES:
+            print(f"[WEBHOOK] Tipo de mensaje no soportado: {message.type}")
+            continue
         
-    elif message_type == "location":
-        location = message.get("location", {})
-        lat = location.get("latitude")
-        lng = location.get("longitude") 
-        if lat and lng:
-            await handle_location_message(from_wa, float(lat), float(lng), phone_number_id)
+        batches.setdefault(message.wa_id, []).append(message)
+    
+    return batches
+
+
+async def drop_duplicate_messages(batches: Dict[str, List[IncomingMessage]]) -> Dict[str, List[IncomingMessage]]:
+    """Quita del batch los mensajes cuyo id ya se procesó."""
+    result: Dict[str, List[IncomingMessage]] = {}
+    
+    for wa_id, items in batches.items():
+        fresh = []
+        for message in items:
+            if await message_dedup.is_duplicate(message.message_id):
+                print(f"[DEDUP] ♻️ Mensaje duplicado descartado: {message.message_id} de {wa_id}")
+                continue
+            fresh.append(message)
+        if fresh:
+            result[wa_id] = fresh
+    
+    return result
+
+
+async def process_user_messages(wa_id: str, items: List[IncomingMessage]):
+    """
+    Procesa en orden los mensajes de un mismo usuario.
+    Pasan por el mailbox del usuario, así que también quedan en orden respecto
+    a mensajes que llegaron en otros webhooks (y no compiten por su sesión).
+    """
+    try:
+        await user_mailboxes.submit(wa_id, items)
+    finally:
+        admission.release(len(items))
+
+
+async def _handle_mailbox_item(wa_id: str, message: IncomingMessage):
+    """Handler del actor de cada usuario (limitado por los slots de su carril)."""
+    async with admission.slot(message_lane(message)):
+        await process_webhook_message(message)
+
+
+async def process_webhook_message(message: IncomingMessage):
+    """Despacha un mensaje individual del webhook según su tipo."""
+    phone_number_id = message.phone_number_id
+    config = get_environment_config(phone_number_id)
+    
+    print(f"{config['prefix']} [WEBHOOK] Mensaje de {message.wa_id}, tipo: {message.type}")
+    
+    # ✅ Si la sesión sigue en el snapshot por restaurar, restaurarla ya
+    if session_snapshots:
+        session_snapshots.claim(message.wa_id)
+    
+    # ✅ Traer la sesión más reciente (otro worker pudo haberla modificado) y guardarla al final
+    await user_sessions.load(message.wa_id)
+    session = user_sessions.get(message.wa_id)
+    prefetched = []
+    if session is not None:
+        # Los resultados guardados se resuelven del caché de lugares: traer los que falten
+        # (quedan fijos en el caché hasta terminar el mensaje)
+        prefetched = await place_cache.prefetch(session.result_ids())
+    try:
+        await dispatch_webhook_message(message, phone_number_id, config)
+    finally:
+        place_cache.release(prefetched)
+        await user_sessions.save(message.wa_id)
+
+
+async def dispatch_webhook_message(message: IncomingMessage, phone_number_id: str, config: dict):
+    if message.type == "text":
+        await handle_text_message(message.wa_id, message.text, phone_number_id)
+        
+    elif message.type == "location":
+        if message.lat and message.lng:
+            await handle_location_message(message.wa_id, message.lat, message.lng, phone_number_id)
     
     # ✅ NUEVO: Manejo de botones de templates (Quick Reply)
-    elif message_type == "button":
-        button_text = message.get("button", {}).get("text", "").strip()
-        print(f"{config['prefix']} [WEBHOOK] Botón presionado: '{button_text}'")
+    elif message.type == "button":
+        print(f"{config['prefix']} [WEBHOOK] Botón presionado: '{message.text}'")
         # Tratar el botón como si fuera texto
-        await handle_text_message(from_wa, button_text, phone_number_id)
+        await handle_text_message(message.wa_id, message.text, phone_number_id)
         
     else:
-        print(f"{config['prefix']} [WEBHOOK] Tipo de mensaje no soportado: {message_type}")
+        print(f"{config['prefix']} [WEBHOOK] Tipo de mensaje no soportado: {message.type}")
+
+
+async def _process_queued_message(item: dict):
+    """Handler de los workers de la cola del webhook (un item = mensajes de un usuario)."""
+    try:
+        await process_user_messages(item["wa_id"], item["items"])
+    finally:
+        wa_id = item["wa_id"]
+        lane, pending = _queued_lanes[wa_id]
+        if pending <= 1:
+            del _queued_lanes[wa_id]
+        else:
+            _queued_lanes[wa_id] = (lane, pending - 1)
+
+
+# wa_id -> (carril, batches en cola): mientras un usuario tenga algo en cola, sus
+# siguientes batches van al mismo carril para no alterar el orden de sus mensajes
+_queued_lanes: Dict[str, Tuple[str, int]] = {}
+
+
+def submit_to_lane(wa_id: str, items: List[IncomingMessage]) -> bool:
+    """Encola el batch de un usuario en la cola de su carril. Retorna False si está llena."""
+    queued = _queued_lanes.get(wa_id)
+    if queued:
+        lane = queued[0]
+    else:
+        lane = "fast" if all(message_lane(message) == "fast" for message in items) else "slow"
+    
+    if not webhook_queues[lane].submit({"wa_id": wa_id, "items": items}):
+        print(f"[WEBHOOK] ⚠️ Cola '{lane}' llena ({webhook_queues[lane].depth()})")
+        return False
     
-    return {"status": "processed"}
+    _queued_lanes[wa_id] = (lane, queued[1] + 1 if queued else 1)
+    return True
+
+
+message_dedup = MessageDeduplicator(
+    ttl_seconds=DEDUP_TTL_SECONDS,
+    max_entries=DEDUP_MAX_ENTRIES,
+    backend=DEDUP_BACKEND,
+    pool_getter=get_pool
+)
+
+def is_command_text(text: str) -> bool:
+    """Mensajes que son comandos directos (no deben juntarse con otros)."""
+    text_stripped = text.strip().lower()
+    return (
+        text_stripped in MORE_OPTIONS_WORDS
+        or text_stripped in NO_MORE_OPTIONS_WORDS
+        or text_stripped == "obtener mi acceso"
+        or bool(re.match(r'^\s*\d+\s*$', text_stripped))
+        or loyalty.is_loyalty_query(text_stripped)[0]
+    )
+
+
+def message_lane(message: IncomingMessage) -> str:
+    """Carril de prioridad: "fast" para comandos baratos (sin IA), "slow" para todo lo demás."""
+    if message.type in ("text", "button") and message.merged_count == 1 and is_command_text(message.text):
+        return "fast"
+    return "slow"
+
+
+def coalesce_text_messages(first: IncomingMessage, second: Optional[IncomingMessage]) -> Optional[IncomingMessage]:
+    """
+    Junta dos mensajes de texto consecutivos del mismo usuario en uno solo.
+    Retorna None si no se pueden juntar (no son texto, son comandos o vienen de otro número).
+    """
+    if first.type != "text" or is_command_text(first.text):
+        return None
+    if second is None:
+        return first
+    
+    if second.phone_number_id != first.phone_number_id or second.type != "text" or is_command_text(second.text):
+        return None
+    
+    merged = dataclasses.replace(
+        first,
+        text=f"{first.text} {second.text}".strip(),
+        merged_count=first.merged_count + second.merged_count
+    )
+    print(f"[COALESCE] {first.wa_id}: {merged.merged_count} mensajes → '{merged.text}'")
+    return merged
+
+
+webhook_recorder = WebhookRecorder(WEBHOOK_CAPTURE_FILE) if WEBHOOK_CAPTURE_FILE else None
+
+
+admission = AdmissionController(
+    max_in_flight=WEBHOOK_MAX_IN_FLIGHT,
+    max_pending=WEBHOOK_MAX_PENDING,
+    degrade_at=WEBHOOK_DEGRADE_AT,
+    fast_in_flight=WEBHOOK_FAST_IN_FLIGHT
+)
+
+
+user_mailboxes = MailboxRegistry(
+    _handle_mailbox_item,
+    idle_seconds=MAILBOX_IDLE_SECONDS,
+    coalesce=coalesce_text_messages,
+    coalesce_window=COALESCE_WINDOW_MS / 1000,
+    coalesce_max=COALESCE_MAX_MS / 1000
+)
+
+webhook_queues: Dict[str, WorkQueue] = {
+    "fast": WorkQueue("webhook-fast", _process_queued_message, max_size=WEBHOOK_QUEUE_SIZE, workers=WEBHOOK_FAST_WORKERS),
+    "slow": WorkQueue("webhook", _process_queued_message, max_size=WEBHOOK_QUEUE_SIZE, workers=WEBHOOK_WORKERS),
+}
+
+
+@app.on_event("startup")
+async def start_webhook_queue():
+    if WEBHOOK_ASYNC_MODE:
+        for queue in webhook_queues.values():
+            queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_webhook_queue():
+    for queue in webhook_queues.values():
+        await queue.stop()
+    if webhook_recorder:
+        webhook_recorder.close()
+
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas internas del pipeline (JSON)."""
+    return {
+        "time": local_now().isoformat(),
+        "webhook_async_mode": WEBHOOK_ASYNC_MODE,
+        "json_backend": webhook_parser.JSON_BACKEND,
+        "webhook_queues": {lane: queue.stats() for lane, queue in webhook_queues.items()},
+        "admission": admission.stats(),
+        "capture": webhook_recorder.stats() if webhook_recorder else None,
+        "dedup": message_dedup.stats(),
+        "mailboxes": user_mailboxes.stats(),
+        "sessions": user_sessions.stats(),
+        "place_cache": place_cache.stats(),
+        "place_catalog": place_catalog.stats(),
+        "idle_timers": idle_timers.stats(),
+        "session_snapshots": session_snapshots.stats() if session_snapshots else None,
+        "webhook_events": webhook_events.stats(),
+        "db": db.stats(),
+    }
+
+
+@app.get("/metrics/db-pool")
+async def metrics_db_pool():
+    """Estado del pool de BD: conexiones en uso, peticiones esperando y tiempo de espera acumulado."""
+    return {
+        "time": local_now().isoformat(),
+        "pool": db.pool_stats(),
+    }
 
 
 @app.get("/debug/test-hours/{place_id}")
@@ -2640,9 +2870,9 @@ async def test_place_hours(place_id: int):
         WHERE id = %s;
         """
         
-        with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, (place_id,))
-            row = cur.fetchone()
+        async with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+            await cur.execute(sql, (place_id,))
+            row = await cur.fetchone()
             
             if not row:
                 return {"status": "not_found", "id": place_id}
@@ -2754,10 +2984,10 @@ async def handle_text_message(wa_id: str, text: str, phone_number_id: str = None
             await loyalty.handle_loyalty_qr_query(wa_id, phone_number_id)
             return
     
-    if text_stripped in ['más', 'mas', 'dame más', 'dame mas', 'ver más', 'ver mas', 'siguiente', 'otra', 'otras']:
+    if text_stripped in MORE_OPTIONS_WORDS:
         intent_data = {"intent": "more_options", "craving": None, "needs_location": False, "business_name": None}
         print(f"[HARDCODED] Detectado paginación: '{text}' → more_options")
-    elif text_stripped in ['no', 'ya no', 'ya', 'suficiente', 'no más', 'no mas', 'está bien', 'esta bien']:
+    elif text_stripped in NO_MORE_OPTIONS_WORDS:
         intent_data = {"intent": "no_more_options", "craving": None, "needs_location": False, "business_name": None}
         print(f"[HARDCODED] Detectado rechazo: '{text}' → no_more_options")
     else:
@@ -2767,7 +2997,8 @@ async def handle_text_message(wa_id: str, text: str, phone_number_id: str = None
         # Intentar buscar el texto EXACTO del usuario en categories
         # Si encuentra resultados, usar esos directamente sin llamar a la IA
         
-        exact_results_raw = search_exact_user_text(text, limit=10)
+        with db.measure() as exact_db_time:
+            exact_results_raw = await search_exact_user_text(text, limit=10)
         
         if exact_results_raw:
             # ✅ Encontró resultados exactos - crear intent artificial
@@ -2778,8 +3009,12 @@ async def handle_text_message(wa_id: str, text: str, phone_number_id: str = None
                 "needs_location": False, 
                 "business_name": None,
                 "_exact_results": exact_results_raw,  # Guardar resultados para usar después
-                "_skip_search": True  # Flag para saltar la búsqueda normal
+                "_skip_search": True,  # Flag para saltar la búsqueda normal
+                "_db_time_ms": round(exact_db_time.ms),
             }
+        elif admission.should_degrade("intención IA"):
+            # Saturado: intención por heurística, sin llamar a la IA
+            intent_data = extract_intent_heuristic(text)
         else:
             # No encontró exacto, usar IA normal
             intent_data = await extract_intent_with_ai(text, session["language"], session["name"], wa_id)
@@ -2818,7 +3053,7 @@ async def handle_text_message(wa_id: str, text: str, phone_number_id: str = None
         # ══════════════════════════════════════════════════════════════
         # PASO 1: Buscar por NOMBRE EXACTO del negocio
         # ══════════════════════════════════════════════════════════════
-        place = search_place_by_name(business_name)
+        place = await search_place_by_name(business_name)
         
         if place:
             # ✅ Enviar detalles completos (format_place_details ya muestra 🟢 ABIERTO o 🔴 CERRADO)
@@ -2856,9 +3091,9 @@ async def handle_text_message(wa_id: str, text: str, phone_number_id: str = None
         if session.get("user_location"):
             user_lat = session["user_location"]["lat"]
             user_lng = session["user_location"]["lng"]
-            fallback_results = search_places_with_location(business_name, user_lat, user_lng, limit=10)
+            fallback_results = await search_places_with_location(business_name, user_lat, user_lng, limit=10)
         else:
-            fallback_results = search_places_without_location(business_name, limit=10)
+            fallback_results = await search_places_without_location(business_name, limit=10)
         
         if fallback_results:
             # ✅ Encontró en categories - Filtrar solo ABIERTOS
@@ -3037,7 +3272,7 @@ async def handle_text_message(wa_id: str, text: str, phone_number_id: str = None
     # ✅ NUEVO: VERIFICAR SI EL CRAVING ES UN NOMBRE DE NEGOCIO PRIMERO
     # Esto captura casos como "mándame info de dos tapas" donde la IA no detectó business_search
     if craving and not business_name:
-        place_by_name = search_place_by_name(craving)
+        place_by_name = await search_place_by_name(craving)
         if place_by_name:
             print(f"[SMART-SEARCH] '{craving}' es un nombre de negocio, no comida")
             session["is_new"] = False
@@ -3067,13 +3302,17 @@ async def handle_text_message(wa_id: str, text: str, phone_number_id: str = None
         if intent_data.get("_skip_search") and intent_data.get("_exact_results"):
             results = intent_data["_exact_results"]
             used_expansion = False
+            db_time_ms = intent_data.get("_db_time_ms", 0)
             print(f"[SEARCH] Usando {len(results)} resultados exactos pre-calculados para '{craving}'")
-        elif session.get("user_location"):
-            user_lat = session["user_location"]["lat"]
-            user_lng = session["user_location"]["lng"] 
-            results, used_expansion = await search_places_with_location_ai(craving, user_lat, user_lng, session["language"], wa_id, 10)
         else:
-            results, used_expansion = await search_places_without_location_ai(craving, session["language"], wa_id, 10)
+            with db.measure() as db_time:
+                if session.get("user_location"):
+                    user_lat = session["user_location"]["lat"]
+                    user_lng = session["user_location"]["lng"] 
+                    results, used_expansion = await search_places_with_location_ai(craving, user_lat, user_lng, session["language"], wa_id, 10)
+                else:
+                    results, used_expansion = await search_places_without_location_ai(craving, session["language"], wa_id, 10)
+            db_time_ms = round(db_time.ms)
         
         # ✅ NUEVO: FILTRAR para mostrar SOLO lugares abiertos
         open_results = [place for place in results if place.get("is_open_now", False)]
@@ -3095,7 +3334,7 @@ async def handle_text_message(wa_id: str, text: str, phone_number_id: str = None
                 shown_count=len(display_results),
                 used_expansion=used_expansion,
                 expanded_terms=[craving],
-                db_query_time_ms=0,
+                db_query_time_ms=db_time_ms,
                 pool=get_pool()
             ))
         except Exception as e:
@@ -3191,13 +3430,17 @@ async def handle_text_message(wa_id: str, text: str, phone_number_id: str = None
         if intent_data.get("_skip_search") and intent_data.get("_exact_results"):
             results = intent_data["_exact_results"]
             used_expansion = False
+            db_time_ms = intent_data.get("_db_time_ms", 0)
             print(f"[SEARCH-REGULAR] Usando {len(results)} resultados exactos pre-calculados para '{craving}'")
-        elif session.get("user_location"):
-            user_lat = session["user_location"]["lat"]
-            user_lng = session["user_location"]["lng"] 
-            results, used_expansion = await search_places_with_location_ai(craving, user_lat, user_lng, session["language"], wa_id, 10)
         else:
-            results, used_expansion = await search_places_without_location_ai(craving, session["language"], wa_id, 10)
+            with db.measure() as db_time:
+                if session.get("user_location"):
+                    user_lat = session["user_location"]["lat"]
+                    user_lng = session["user_location"]["lng"] 
+                    results, used_expansion = await search_places_with_location_ai(craving, user_lat, user_lng, session["language"], wa_id, 10)
+                else:
+                    results, used_expansion = await search_places_without_location_ai(craving, session["language"], wa_id, 10)
+            db_time_ms = round(db_time.ms)
         
         # ✅ NUEVO: FILTRAR para mostrar SOLO lugares abiertos
         open_results = [place for place in results if place.get("is_open_now", False)]
@@ -3219,7 +3462,7 @@ async def handle_text_message(wa_id: str, text: str, phone_number_id: str = None
                 shown_count=len(display_results),
                 used_expansion=used_expansion,
                 expanded_terms=[craving],
-                db_query_time_ms=0,
+                db_query_time_ms=db_time_ms,
                 pool=get_pool()
             ))
         except Exception as e:
@@ -3395,7 +3638,8 @@ async def handle_location_message(wa_id: str, lat: float, lng: float, phone_numb
     
     if session.get("last_search") and session["last_search"].get("craving"):
         craving = session["last_search"]["craving"]
-        results, used_expansion = await search_places_with_location_ai(craving, lat, lng, session["language"], wa_id, 10)
+        with db.measure() as db_time:
+            results, used_expansion = await search_places_with_location_ai(craving, lat, lng, session["language"], wa_id, 10)
 
         # ✅ NUEVO: FILTRAR para mostrar SOLO lugares abiertos
         open_results = [place for place in results if place.get("is_open_now", False)]
@@ -3417,7 +3661,7 @@ async def handle_location_message(wa_id: str, lat: float, lng: float, phone_numb
                 shown_count=len(display_results),
                 used_expansion=used_expansion,
                 expanded_terms=[craving],
-                db_query_time_ms=0,
+                db_query_time_ms=round(db_time.ms),
                 pool=get_pool()
             ))
         except Exception as e:
@@ -3462,6 +3706,13 @@ async def handle_location_message(wa_id: str, lat: float, lng: float, phone_numb
             # Buscar lugares cercanos SIN filtro de craving, solo abiertos
             try:
                 print(f"[UBICACIÓN-DEBUG] Iniciando búsqueda de lugares cercanos abiertos")
+                # Catálogo: los N más cercanos que están abiertos (rejilla espacial, sin cortar en 20 cercanos)
+                rows = None
+                if PLACE_CATALOG_ENABLED:
+                    rows = place_catalog.nearest_places(
+                        lat, lng, NEARBY_OPEN_LIMIT, accept=is_open_now_by_day, max_km=NEARBY_OPEN_MAX_KM,
+                        open_only=True
+                    )
                 sql = """
                 SELECT id, name, category, products, priority, cashback, hours, 
                        address, phone, url_order, imagen_url, url_extra, afiliado,
@@ -3475,64 +3726,65 @@ async def handle_location_message(wa_id: str, lat: float, lng: float, phone_numb
                 FROM public.places
                 WHERE lat IS NOT NULL AND lng IS NOT NULL
                 ORDER BY distance_km ASC
-                LIMIT 20;
+                LIMIT %s;
                 """
                 
-                print(f"[UBICACIÓN-DEBUG] Ejecutando query con lat={lat}, lng={lng}")
-                with get_pool().connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-                    cur.execute(sql, (lat, lng, lat))
-                    rows = cur.fetchall()
+                if rows is None:
+                    print(f"[UBICACIÓN-DEBUG] Ejecutando query con lat={lat}, lng={lng}")
+                    rows = await db.fetch_all("search.open_nearby", sql, (lat, lng, lat, NEARBY_OPEN_LIMIT))
                     print(f"[UBICACIÓN-DEBUG] Query retornó {len(rows)} lugares cercanos")
+                else:
+                    print(f"[UBICACIÓN-DEBUG] Catálogo retornó {len(rows)} lugares abiertos cercanos")
+                
+                nearby_results = []
+                for row in rows:
+                    place = dict(row)
+                    place["products"] = list(place.get("products") or [])
+                    place["distance_meters"] = place["distance_km"] * 1000
+                    place["distance_text"] = format_distance(place["distance_meters"])
+                    place["is_open_now"] = is_open_now_by_day(place)
                     
-                    nearby_results = []
-                    for row in rows:
-                        place = dict(row)
-                        place["products"] = list(place.get("products") or [])
-                        place["distance_meters"] = place["distance_km"] * 1000
-                        place["distance_text"] = format_distance(place["distance_meters"])
-                        place["is_open_now"] = is_open_now_by_day(place)
-                        
-                        # Solo agregar si está abierto
-                        if place["is_open_now"]:
-                            nearby_results.append(place)
-                            print(f"[UBICACIÓN-DEBUG] ✅ {place['name']} está ABIERTO")
-                        else:
-                            print(f"[UBICACIÓN-DEBUG] ❌ {place['name']} está CERRADO")
+                    # Solo agregar si está abierto
+                    if place["is_open_now"]:
+                        nearby_results.append(place)
+                        print(f"[UBICACIÓN-DEBUG] ✅ {place['name']} está ABIERTO")
+                    else:
+                        print(f"[UBICACIÓN-DEBUG] ❌ {place['name']} está CERRADO")
+                
+                print(f"[UBICACIÓN-DEBUG] Total lugares abiertos encontrados: {len(nearby_results)}")
+                
+                # Limitar a 3 para primera página
+                nearby_display = nearby_results[:PAGINATION_SIZE]
+                
+                if nearby_display:
+                    print(f"[UBICACIÓN-DEBUG] Mostrando {len(nearby_display)} lugares")
+                    # Guardar resultados
+                    session["last_search"] = {
+                        "craving": "lugares abiertos",  # Genérico
+                        "needs_location": False,
+                        "all_results": nearby_results,
+                        "shown_count": len(nearby_display),
+                        "timestamp": time.time()
+                    }
+                    session["last_results"] = nearby_display
                     
-                    print(f"[UBICACIÓN-DEBUG] Total lugares abiertos encontrados: {len(nearby_results)}")
+                    intro_message = f"No hay {craving} abierto cerca de ti ahorita, pero te conseguí {len(nearby_display)} lugares que sí están abiertos cerca:"
+                    results_list = format_results_list(nearby_display, session["language"])
                     
-                    # Limitar a 3 para primera página
-                    nearby_display = nearby_results[:PAGINATION_SIZE]
+                    response = f"{intro_message}\n\n{results_list}\n\nMándame el número del que te guste 📍"
                     
-                    if nearby_display:
-                        print(f"[UBICACIÓN-DEBUG] Mostrando {len(nearby_display)} lugares")
-                        # Guardar resultados
-                        session["last_search"] = {
-                            "craving": "lugares abiertos",  # Genérico
-                            "needs_location": False,
-                            "all_results": nearby_results,
-                            "shown_count": len(nearby_display),
-                            "timestamp": time.time()
-                        }
-                        session["last_results"] = nearby_display
-                        
-                        intro_message = f"No hay {craving} abierto cerca de ti ahorita, pero te conseguí {len(nearby_display)} lugares que sí están abiertos cerca:"
-                        results_list = format_results_list(nearby_display, session["language"])
-                        
-                        response = f"{intro_message}\n\n{results_list}\n\nMándame el número del que te guste 📍"
-                        
-                        remaining = len(nearby_results) - len(nearby_display)
-                        if remaining > 0:
-                            response += f"\n\n💬 Tengo {remaining} opciones más. Escribe 'más' para verlas 😊"
-                        
-                        print(f"[UBICACIÓN-DEBUG] Enviando respuesta con {len(nearby_display)} lugares")
-                        await send_whatsapp_message(wa_id, response, phone_number_id)
-                        print(f"[UBICACIÓN-DEBUG] Respuesta enviada exitosamente")
-                    else:
-                        print(f"[UBICACIÓN-DEBUG] No hay lugares abiertos cerca")
-                        # No hay NADA abierto cerca
-                        response = f"No encontré lugares abiertos cerca de ti ahorita 😕 ¿Quieres buscar algo específico?"
-                        await send_whatsapp_message(wa_id, response, phone_number_id)
+                    remaining = len(nearby_results) - len(nearby_display)
+                    if remaining > 0:
+                        response += f"\n\n💬 Tengo {remaining} opciones más. Escribe 'más' para verlas 😊"
+                    
+                    print(f"[UBICACIÓN-DEBUG] Enviando respuesta con {len(nearby_display)} lugares")
+                    await send_whatsapp_message(wa_id, response, phone_number_id)
+                    print(f"[UBICACIÓN-DEBUG] Respuesta enviada exitosamente")
+                else:
+                    print(f"[UBICACIÓN-DEBUG] No hay lugares abiertos cerca")
+                    # No hay NADA abierto cerca
+                    response = f"No encontré lugares abiertos cerca de ti ahorita 😕 ¿Quieres buscar algo específico?"
+                    await send_whatsapp_message(wa_id, response, phone_number_id)
                     
             except Exception as e:
                 print(f"[UBICACIÓN] ❌ ERROR buscando lugares abiertos: {e}")
@@ -3871,6 +4123,14 @@ def _ss_build_insert(keys):
         RETURNING id;
     """
 
+def publish_place_change(place_id: int):
+    """
+    Publica un lugar cambiado por /sheet/sync: lo saca del caché de lugares (páginas
+    de "más") y programa su recarga en el catálogo en memoria (agrupada, sin esperarla).
+    """
+    place_cache.invalidate(place_id)
+    place_catalog.reload_place(place_id)
+
 @app.post("/sheet/sync")
 async def sheet_sync(payload: Dict[str, Any] = Body(...)):
     if not SHEET_SYNC_SECRET:
@@ -3898,26 +4158,31 @@ async def sheet_sync(payload: Dict[str, Any] = Body(...)):
     keys = [k for k in mapped.keys() if k != "id"]
 
     try:
-        with get_pool().connection() as conn, conn.cursor() as cur:
+        async with get_pool().connection() as conn, conn.cursor() as cur:
             # UPDATE si cambia algo
             upd = _ss_build_update(["id"] + keys)
-            cur.execute(upd, mapped)
-            updated = (cur.fetchone() is not None) if cur.description else False
+            await cur.execute(upd, mapped)
+            updated = (await cur.fetchone() is not None) if cur.description else False
             if updated:
                 print(f"[sheet-sync] updated id={mapped['id']}")
-                return {"status": "updated", "id": mapped["id"]}
-
-            # INSERT si no existe
-            ins = _ss_build_insert(["id"] + keys)
-            cur.execute(ins, mapped)
-            inserted = (cur.fetchone() is not None) if cur.description else False
-            if inserted:
-                print(f"[sheet-sync] inserted id={mapped['id']}")
-                return {"status": "inserted", "id": mapped["id"]}
-
-            # Sin cambios
-            print(f"[sheet-sync] unchanged id={mapped['id']}")
-            return {"status": "unchanged", "id": mapped["id"]}
+                status = "updated"
+            else:
+                # INSERT si no existe
+                ins = _ss_build_insert(["id"] + keys)
+                await cur.execute(ins, mapped)
+                inserted = (await cur.fetchone() is not None) if cur.description else False
+                if inserted:
+                    print(f"[sheet-sync] inserted id={mapped['id']}")
+                    status = "inserted"
+                else:
+                    # Sin cambios
+                    print(f"[sheet-sync] unchanged id={mapped['id']}")
+                    status = "unchanged"
     except Exception as e:
         print(f"[sheet-sync] ERROR id={mapped.get('id')}: {e}")
-        raise HTTPException(status_code=500, detail="sync_failed")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="sync_failed")
+
+    # Ya con la conexión devuelta al pool
+    if status != "unchanged":
+        publish_place_change(mapped["id"])
+    return {"status": status, "id": mapped["id"]}
\ No newline at end of file
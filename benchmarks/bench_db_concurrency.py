@@ -0,0 +1,113 @@
+"""
+Benchmark de concurrencia contra PostgreSQL: pool síncrono (antes) vs AsyncConnectionPool (después).
+Simula N handlers `async def` en vuelo que hacen cada uno una consulta, como
+las búsquedas del webhook, y mide throughput, latencia por consulta y el
+retraso del event loop (cuánto tiempo se quedó bloqueado el proceso).
+
+Uso (mismas variables DB_* que app.py):
+    python benchmarks/bench_db_concurrency.py --requests 200 --concurrency 8 16 32
+    python benchmarks/bench_db_concurrency.py --query "SELECT id FROM public.places WHERE 'tacos' = ANY(categories) LIMIT 10"
+
+Por default la consulta es `SELECT pg_sleep(--sleep)`, que aísla la espera de
+red/BD del costo de la consulta en sí.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from psycopg_pool import ConnectionPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from services import db  # noqa: E402
+from services.metrics import LatencyWindow  # noqa: E402
+
+
+def conninfo() -> str:
+    return (
+        f"host={os.getenv('DB_HOST', '')} port={os.getenv('DB_PORT', '5432')} dbname={os.getenv('DB_NAME', '')} "
+        f"user={os.getenv('DB_USER', '')} password={os.getenv('DB_PASSWORD', '')} "
+        f"sslmode={os.getenv('DB_SSLMODE', 'require')}"
+    )
+
+
+async def loop_lag(stop: asyncio.Event, window: LatencyWindow, tick: float = 0.005):
+    """Mide cuánto se atrasa un sleep corto: con el pool síncrono el loop queda bloqueado."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        window.observe(max(0.0, (time.perf_counter() - started - tick) * 1000))
+
+
+async def run(mode: str, sync_pool: ConnectionPool, query: str, params, requests: int, concurrency: int):
+    latencies = LatencyWindow(size=requests)
+    lag = LatencyWindow(size=100_000)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handler_sync():
+        # Antes: consulta síncrona dentro de un handler async (bloquea el event loop)
+        with sync_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            cur.fetchall()
+
+    async def handler_async():
+        async with db.get_pool().connection() as conn, conn.cursor() as cur:
+            await cur.execute(query, params)
+            await cur.fetchall()
+
+    handler = handler_sync if mode == "sync" else handler_async
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await handler()
+            latencies.observe((time.perf_counter() - started) * 1000)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(loop_lag(stop, lag))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+    return elapsed, latencies.snapshot(), lag.snapshot()
+
+
+async def main_async(args):
+    params = (args.sleep,) if "%s" in args.query else None
+    db.init(conninfo(), min_size=args.pool_size, max_size=args.pool_size)
+    await db.open_pool()
+    await db.get_pool().wait()
+    sync_pool = ConnectionPool(conninfo(), min_size=args.pool_size, max_size=args.pool_size,
+                               kwargs={"autocommit": True}, open=True)
+    sync_pool.wait()
+
+    print(f"{args.requests} consultas, pool de {args.pool_size} conexiones: {args.query!r}\n")
+    print(f"{'modo':>6} {'concurrencia':>13} {'q/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'lag loop p99':>13} {'lag max':>9}")
+    try:
+        for concurrency in args.concurrency:
+            for mode in ("sync", "async"):
+                elapsed, latency, lag = await run(mode, sync_pool, args.query, params, args.requests, concurrency)
+                print(
+                    f"{mode:>6} {concurrency:>13} {args.requests / elapsed:>9,.1f} {latency['p50_ms']:>9} "
+                    f"{latency['p99_ms']:>9} {lag['p99_ms']!s:>13} {lag['max_ms']!s:>9}"
+                )
+    finally:
+        sync_pool.close()
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pool síncrono vs AsyncConnectionPool dentro de handlers async")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--query", default="SELECT pg_sleep(%s)")
+    parser.add_argument("--sleep", type=float, default=0.02, help="Segundos de pg_sleep por consulta")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
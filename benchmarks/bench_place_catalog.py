@@ -0,0 +1,186 @@
+"""
+Benchmark de búsquedas: catálogo en memoria (services/place_catalog) vs las
+sentencias SQL de services/search_sql.
+
+1. Sin BD: catálogo sintético de --places lugares; mide p50/p99 de cada tipo de
+   búsqueda en memoria para un corpus de antojos (con y sin ubicación).
+2. Con BD (--db, variables DB_* de app.py): carga el catálogo real, corre el
+   mismo corpus en SQL y en memoria, reporta p50/p99 de ambos y cuántas
+   búsquedas regresaron ids distintos (deberían ser 0).
+
+Uso:
+    PYTHONPATH=. python benchmarks/bench_place_catalog.py --places 5000
+    PYTHONPATH=. python benchmarks/bench_place_catalog.py --db --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import time as dt_time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from services import place_catalog, search_sql  # noqa: E402
+from services.metrics import LatencyWindow  # noqa: E402
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+CATEGORIES = ["tacos", "pizza", "hamburguesas", "sushi", "café", "pan", "pozole", "mariscos", "tortas",
+              "helado", "ramen", "alitas", "tamales", "comida mexicana", "antojitos", "postres"]
+PRODUCTS = ["tacos al pastor", "tacos de suadero", "gringas", "quesadillas", "agua de horchata", "pizza hawaiana",
+            "hamburguesa doble", "rollo california", "café de olla", "concha", "pozole rojo", "ceviche"]
+CRAVINGS = ["tacos", "taco", "pizza", "hamburguesas", "sushi", "café", "pan", "pozole", "mariscos",
+            "tortas", "helado", "ramen", "alitas", "tamales", "pastor", "horchata", "ceviche", "birria"]
+
+# (nombre, sentencia, usa términos exactos, con ubicación)
+STATEMENTS = [
+    ("exact_categories", search_sql.EXACT_IN_CATEGORIES, True, False),
+    ("broad_like", search_sql.BROAD, False, False),
+    ("expanded", search_sql.EXPANDED, False, False),
+    ("exact_categories_near", search_sql.EXACT_IN_CATEGORIES_NEAR, True, True),
+    ("broad_like_near", search_sql.BROAD_NEAR, False, True),
+    ("expanded_near", search_sql.EXPANDED_NEAR, False, True),
+]
+
+
+def variations(term: str) -> list:
+    """Misma regla singular/plural que normalize_search_term en app.py."""
+    term = term.lower().strip()
+    result = [term]
+    if term.endswith("s") and len(term) > 2:
+        result.append(term[:-1])
+        if term.endswith("es") and len(term) > 3:
+            result.append(term[:-2] + "a")
+    if not term.endswith("s"):
+        result.append(term + "s")
+        if not term.endswith(("a", "e", "i", "o", "u")):
+            result.append(term + "es")
+    return list(dict.fromkeys(result))
+
+
+def make_place(place_id: int) -> dict:
+    rng = random.Random(place_id)
+    place = {
+        "id": place_id,
+        "name": f"Lugar Ejemplo {place_id}",
+        "category": rng.choice(CATEGORIES),
+        "products": rng.sample(PRODUCTS, 5),
+        "categories": rng.sample(CATEGORIES, 3),
+        "priority": rng.choice([None, 0, 1, 5, 10]),
+        "cashback": rng.random() < 0.3,
+        "hours": {},
+        "lat": 19.2 + rng.random() * 0.5,
+        "lng": -99.3 + rng.random() * 0.4,
+        "is_active": rng.random() < 0.95,
+        "plan_activo": rng.random() < 0.1,
+        "plan_fecha_vencimiento": None,
+    }
+    for day in DAYS:
+        closed = rng.random() < 0.1
+        place[f"{day}_open"] = None if closed else dt_time(9, 0)
+        place[f"{day}_close"] = None if closed else dt_time(22, 0)
+    return place
+
+
+def params_for(craving: str, weekday: int, exact: bool, near: bool, rng: random.Random, limit: int) -> dict:
+    terms = variations(craving)
+    params = {"weekday": weekday, "limit": limit}
+    if exact:
+        params["terms"] = terms
+    else:
+        params["patterns"] = search_sql.like_patterns(terms)
+    if near:
+        params["user_lat"] = 19.2 + rng.random() * 0.5
+        params["user_lng"] = -99.3 + rng.random() * 0.4
+    return params
+
+
+def corpus(limit: int):
+    rng = random.Random(7)
+    return [
+        (name, sql, params_for(craving, weekday, exact, near, rng, limit))
+        for name, sql, exact, near in STATEMENTS
+        for weekday in range(7)
+        for craving in CRAVINGS
+    ]
+
+
+def bench_memory(cases, rounds: int) -> dict:
+    windows = {name: LatencyWindow(size=len(cases) * rounds) for name, *_ in STATEMENTS}
+    for _ in range(rounds):
+        for name, sql, params in cases:
+            started = time.perf_counter()
+            place_catalog.search(sql, params)
+            windows[name].observe((time.perf_counter() - started) * 1000)
+    return windows
+
+
+def print_table(title: str, columns: dict):
+    print(title)
+    header = "".join(f"{label:>22}" for label in columns)
+    print(f"{'búsqueda':>24}{header}")
+    for name, *_ in STATEMENTS:
+        cells = ""
+        for windows in columns.values():
+            snap = windows[name].snapshot()
+            cells += f"{snap['p50_ms']!s:>11} /{snap['p99_ms']!s:>9}"
+        print(f"{name:>24}{cells}")
+    print()
+
+
+async def run_db(args, cases):
+    from services import db
+
+    db.init(
+        f"host={os.getenv('DB_HOST', '')} port={os.getenv('DB_PORT', '5432')} dbname={os.getenv('DB_NAME', '')} "
+        f"user={os.getenv('DB_USER', '')} password={os.getenv('DB_PASSWORD', '')} "
+        f"sslmode={os.getenv('DB_SSLMODE', 'require')}",
+        min_size=1, max_size=2,
+    )
+    await db.open_pool()
+    try:
+        place_catalog.init(lambda ids: db.fetch_all("catalog.load", search_sql.CATALOG_ALL))
+        await place_catalog.refresh()
+
+        sql_windows = {name: LatencyWindow(size=len(cases) * args.rounds) for name, *_ in STATEMENTS}
+        mismatches = 0
+        for round_num in range(args.rounds):
+            for name, sql, params in cases:
+                started = time.perf_counter()
+                rows = await db.fetch_all(f"search.{name}", sql, search_sql.fold_params(params))
+                sql_windows[name].observe((time.perf_counter() - started) * 1000)
+                if round_num == 0:
+                    memory_ids = [row["id"] for row in place_catalog.search(sql, params)]
+                    mismatches += memory_ids != [row["id"] for row in rows]
+        mem_windows = bench_memory(cases, args.rounds)
+        print_table(f"Catálogo real ({len(place_catalog.current())} lugares), p50 / p99 ms:",
+                    {"SQL": sql_windows, "memoria": mem_windows})
+        print(f"Búsquedas con resultados distintos SQL vs memoria: {mismatches} de {len(cases)}")
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Búsquedas en memoria vs SQL")
+    parser.add_argument("--places", type=int, default=5000, help="Lugares del catálogo sintético")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--db", action="store_true", help="Comparar contra la BD (DB_*)")
+    args = parser.parse_args()
+
+    cases = corpus(args.limit)
+    if args.db:
+        asyncio.run(run_db(args, cases))
+        return
+
+    async def load(ids):
+        return [make_place(i) for i in range(1, args.places + 1)]
+
+    place_catalog.init(load)
+    asyncio.run(place_catalog.refresh())
+    print_table(f"Catálogo sintético ({args.places} lugares), {len(cases)} búsquedas × {args.rounds}, p50 / p99 ms:",
+                {"memoria": bench_memory(cases, args.rounds)})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark de planeación: SQL armado con f-strings (antes) vs SQL canónico con
+parámetros array (services/search_sql).
+
+1. Sin BD: cuenta cuántas sentencias DISTINTAS ve el servidor para un corpus de
+   antojos a lo largo de la semana. Antes cada número de variaciones (OR) y cada
+   día (columnas mon_open/tue_open/...) era un texto nuevo que el servidor
+   re-planea y que psycopg no llega a preparar; ahora es una sola sentencia.
+2. Con BD (--db, variables DB_* de app.py): ejecuta el corpus con ambos estilos
+   en una conexión y reporta latencia por consulta, Planning Time de
+   EXPLAIN ANALYZE y cuántas sentencias quedaron preparadas.
+
+Uso:
+    python benchmarks/bench_search_planning.py
+    python benchmarks/bench_search_planning.py --db --rounds 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from services import search_sql  # noqa: E402
+
+CRAVINGS = ["tacos", "taco", "pizza", "hamburguesas", "sushi", "café", "pan", "pozole", "mariscos",
+            "tortas", "enchiladas", "helado", "ramen", "alitas", "elote", "tamales", "chilaquiles", "pollo"]
+DAY_COLUMNS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def normalize(term: str) -> list:
+    """Misma regla singular/plural que normalize_search_term en app.py."""
+    term = term.lower().strip()
+    variations = [term]
+    if term.endswith("s") and len(term) > 2:
+        variations.append(term[:-1])
+        if term.endswith("es") and len(term) > 3:
+            variations.append(term[:-2] + "a")
+    if not term.endswith("s"):
+        variations.append(term + "s")
+        if not term.endswith(("a", "e", "i", "o", "u")):
+            variations.append(term + "es")
+    return list(dict.fromkeys(variations))
+
+
+def legacy_broad(variations: list, weekday: int, limit: int):
+    """Reproduce el PASO 3 anterior: N condiciones OR por columna y las columnas del día en el texto."""
+    day = DAY_COLUMNS[weekday]
+    cond_item = " OR ".join(["LOWER(item) LIKE %s" for _ in variations])
+    cond_category = " OR ".join(["LOWER(category) LIKE %s" for _ in variations])
+    sql = f"""
+        SELECT {search_sql.PLACE_COLUMNS}
+        FROM public.places
+        WHERE is_active = TRUE
+        AND (
+            EXISTS (SELECT 1 FROM jsonb_array_elements_text(categories) as item WHERE {cond_item})
+            OR EXISTS (SELECT 1 FROM jsonb_array_elements_text(products) as item WHERE {cond_item})
+            OR ({cond_category})
+        )
+        AND {day}_open IS NOT NULL AND {day}_close IS NOT NULL
+        ORDER BY
+            {search_sql.PLAN_FIRST},
+            id ASC
+        LIMIT %s;
+    """
+    patterns = search_sql.like_patterns(variations)
+    return sql, tuple(patterns * 3 + [limit])
+
+
+def canonical_broad(variations: list, weekday: int, limit: int):
+    return search_sql.BROAD, {"patterns": search_sql.like_patterns(variations), "weekday": weekday, "limit": limit}
+
+
+def corpus():
+    """(variaciones, día) para cada antojo en cada día, más expansiones de IA de 3 a 8 términos."""
+    cases = [(normalize(craving), weekday) for weekday in range(7) for craving in CRAVINGS]
+    for size in range(3, 9):
+        terms = [CRAVINGS[(size + i) % len(CRAVINGS)] for i in range(size)]
+        cases.extend((terms, weekday) for weekday in range(7))
+    return cases
+
+
+def count_statements(limit: int = 10):
+    cases = corpus()
+    legacy = {legacy_broad(v, d, limit)[0] for v, d in cases}
+    canonical = {canonical_broad(v, d, limit)[0] for v, d in cases}
+    print(f"Corpus: {len(cases)} búsquedas ({len(CRAVINGS)} antojos × 7 días + expansiones de IA)")
+    print(f"  sentencias distintas (antes):  {len(legacy)}")
+    print(f"  sentencias distintas (ahora):  {len(canonical)}\n")
+
+
+def planning_time(cur, sql, params) -> float:
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Planning Time"]
+
+
+def run_db(rounds: int, limit: int):
+    import psycopg
+
+    conninfo = (
+        f"host={os.getenv('DB_HOST', '')} port={os.getenv('DB_PORT', '5432')} dbname={os.getenv('DB_NAME', '')} "
+        f"user={os.getenv('DB_USER', '')} password={os.getenv('DB_PASSWORD', '')} "
+        f"sslmode={os.getenv('DB_SSLMODE', 'require')}"
+    )
+    cases = corpus()
+    print(f"{'estilo':>10} {'ms/consulta p50':>16} {'p95':>8} {'planning ms p50':>16} {'preparadas':>11}")
+    for name, build in (("antes", legacy_broad), ("canónico", canonical_broad)):
+        # Conexión nueva por estilo: el caché de sentencias preparadas empieza vacío
+        with psycopg.connect(conninfo, autocommit=True) as conn, conn.cursor() as cur:
+            timings = []
+            for _ in range(rounds):
+                for variations, weekday in cases:
+                    sql, params = build(variations, weekday, limit)
+                    started = time.perf_counter()
+                    cur.execute(sql, params)
+                    cur.fetchall()
+                    timings.append((time.perf_counter() - started) * 1000)
+            planning = [planning_time(cur, *build(v, d, limit)) for v, d in cases[:: max(1, len(cases) // 30)]]
+            cur.execute("SELECT count(*) FROM pg_prepared_statements;")
+            prepared = cur.fetchone()[0]
+        timings.sort()
+        print(
+            f"{name:>10} {statistics.median(timings):>16.2f} {timings[int(len(timings) * 0.95) - 1]:>8.2f} "
+            f"{statistics.median(planning):>16.3f} {prepared:>11}"
+        )
+    print("\nplanning ms = lo que cuesta planear cada vez que la sentencia NO está preparada.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentencias distintas y tiempo de planeación de las búsquedas")
+    parser.add_argument("--db", action="store_true", help="Medir también contra la BD (DB_*)")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    count_statements(args.limit)
+    if args.db:
+        run_db(args.rounds, args.limit)
+
+
+if __name__ == "__main__":
+    main()
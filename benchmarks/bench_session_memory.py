@@ -0,0 +1,160 @@
+"""
+Benchmark de memoria por sesión.
+Compara la sesión anterior (dict libre con los dicts completos de cada lugar
+en last_search.all_results / last_results) contra Session (slots) + ResultRefs
+(ids y distancias en array) + caché compartido de lugares.
+
+Uso:
+    PYTHONPATH=. python benchmarks/bench_session_memory.py [--sessions 10000 100000] [--results 10] [--places 2000]
+
+Nota: con la sesión anterior cada búsqueda crea dicts nuevos desde las filas
+de la BD, así que los lugares NO se comparten entre sesiones (igual aquí).
+"""
+import argparse
+import gc
+import multiprocessing
+import random
+import resource
+import time
+import uuid
+from datetime import time as dt_time
+
+from services import place_cache
+from services.session import Session
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+PRODUCTS = ["tacos al pastor", "tacos de suadero", "gringas", "quesadillas", "agua de horchata",
+            "tortas", "pozole", "enchiladas", "chilaquiles", "café de olla", "flautas", "sopes"]
+
+
+def make_place(place_id: int) -> dict:
+    """Fila de places como la regresan las búsquedas (mismas columnas)."""
+    rng = random.Random(place_id)
+    place = {
+        "id": place_id,
+        "name": f"Taquería Ejemplo {place_id}",
+        "category": "Restaurante mexicano",
+        "products": rng.sample(PRODUCTS, 8),
+        "categories": ["tacos", "comida mexicana", "antojitos"],
+        "priority": rng.randint(0, 10),
+        "cashback": rng.random() < 0.3,
+        "hours": {},
+        "address": f"Av. Insurgentes Sur {place_id}, Col. Roma Norte, CDMX",
+        "phone": "5512345678",
+        "url_order": f"https://turicanje.com/p/{place_id}",
+        "imagen_url": f"https://cdn.turicanje.com/img/{place_id}.jpg",
+        "url_extra": None,
+        "afiliado": rng.random() < 0.5,
+        "lat": 19.4 + rng.random() / 10,
+        "lng": -99.1 - rng.random() / 10,
+        "timezone": "America/Mexico_City",
+        "delivery": rng.random() < 0.5,
+    }
+    for day in DAYS:
+        place[f"{day}_open"] = dt_time(9, 0)
+        place[f"{day}_close"] = dt_time(22, 0)
+    return place
+
+
+def search_results(rng: random.Random, num_places: int, num_results: int) -> list:
+    results = []
+    for place_id in rng.sample(range(1, num_places + 1), num_results):
+        place = make_place(place_id)
+        place["distance_meters"] = rng.uniform(100, 5000)
+        place["distance_text"] = f"{place['distance_meters'] / 1000:.1f} km"
+        place["is_open_now"] = True
+        results.append(place)
+    return results
+
+
+def legacy_session(rng, num_places, num_results) -> dict:
+    results = search_results(rng, num_places, num_results)
+    now = time.time()
+    return {
+        "session_id": str(uuid.uuid4()),
+        "name": "Sofía",
+        "language": "es",
+        "last_seen": now,
+        "session_start": now,
+        "is_new": False,
+        "last_search": {
+            "craving": "tacos",
+            "needs_location": False,
+            "all_results": results,
+            "shown_count": 3,
+            "timestamp": now,
+        },
+        "last_results": results[:3],
+        "user_location": {"lat": 19.42, "lng": -99.16},
+        "goodbye_sent": False,
+        "message_count": 3,
+        "search_count": 1,
+        "shown_count": 3,
+        "clicked_link": False,
+    }
+
+
+def slotted_session(rng, num_places, num_results) -> Session:
+    results = search_results(rng, num_places, num_results)
+    now = time.time()
+    session = Session(name="Sofía", last_seen=now, session_start=now, is_new=False,
+                      message_count=3, search_count=1, shown_count=3)
+    session["user_location"] = {"lat": 19.42, "lng": -99.16}
+    session["last_search"] = {"craving": "tacos", "needs_location": False, "all_results": results,
+                              "shown_count": 3, "timestamp": now}
+    session["last_results"] = results[:3]
+    return session
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Sin /proc (macOS): pico de RSS, en bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure_in_process(factory, count, num_places, num_results, queue):
+    rng = random.Random(42)
+    # El caché compartido se mide junto con las sesiones (se llena durante la corrida)
+    place_cache.init(lambda ids: [], lambda meters: f"{meters:.0f} m", max_entries=num_places)
+    gc.collect()
+    before = _rss_bytes()
+    sessions = {f"52155{i:08d}": factory(rng, num_places, num_results) for i in range(count)}
+    gc.collect()
+    queue.put(_rss_bytes() - before)
+    del sessions
+
+
+def measure(factory, count: int, num_places: int, num_results: int) -> int:
+    """RSS que agregan `count` sesiones, medido en un proceso nuevo para no arrastrar memoria."""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure_in_process, args=(factory, count, num_places, num_results, queue))
+    process.start()
+    used = queue.get()
+    process.join()
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--results", type=int, default=10, help="Resultados guardados por sesión")
+    parser.add_argument("--places", type=int, default=2000, help="Lugares distintos en el catálogo")
+    args = parser.parse_args()
+
+    print(f"{args.results} resultados por sesión, catálogo de {args.places} lugares\n")
+    print(f"{'sesiones':>10} {'dict (bytes/sesión)':>22} {'Session (bytes/sesión)':>24} {'total dict':>12} {'total Session':>14}")
+
+    for count in args.sessions:
+        legacy = measure(legacy_session, count, args.places, args.results)
+        slotted = measure(slotted_session, count, args.places, args.results)
+        print(
+            f"{count:>10,} {legacy / count:>22,.0f} {slotted / count:>24,.0f} "
+            f"{legacy / 1e6:>10,.1f}MB {slotted / 1e6:>12,.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark del parseo del webhook.
+Compara el camino anterior (json.loads + cadenas de .get()) contra
+webhook_parser (backend JSON configurable + IncomingMessage), con el mismo
+trabajo en ambos (todos los mensajes, mismos campos) y costo por mensaje; mide el
+clasificador de webhook_events sobre un callback de statuses real (antes
+verifica que un payload de mensajes y uno de statuses se clasifiquen bien).
+
+Uso:
+    PYTHONPATH=. python benchmarks/bench_webhook_parse.py [iteraciones]
+    JSON_BACKEND=json PYTHONPATH=. python benchmarks/bench_webhook_parse.py
+"""
+import json
+import sys
+import time
+
+from services import webhook_events, webhook_parser
+
+
+def build_payload(messages_per_change: int = 1) -> bytes:
+    messages = []
+    for i in range(messages_per_change):
+        messages.append({
+            "from": f"52155{i:08d}",
+            "id": f"wamid.HBgMNTIxNTU{i:020d}",
+            "timestamp": "1700000000",
+            "type": "text",
+            "text": {"body": "quiero unos tacos al pastor cerca"},
+        })
+    payload = {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "1234567890",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550000000", "phone_number_id": "111111111"},
+                    "contacts": [{"profile": {"name": "Cliente"}, "wa_id": m["from"]} for m in messages],
+                    "messages": messages,
+                },
+            }],
+        }],
+    }
+    return json.dumps(payload).encode()
+
+
+def build_status_payload(status: str = "delivered") -> bytes:
+    """Callback de entrega/lectura tal como lo manda Meta (también con field=messages)."""
+    payload = {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "1234567890",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550000000", "phone_number_id": "111111111"},
+                    "statuses": [{
+                        "id": "wamid.HBgMNTIxNTUwMDAwMDAwFQIAERgSQjY1",
+                        "status": status,
+                        "timestamp": "1700000000",
+                        "recipient_id": "5215500000000",
+                        "conversation": {"id": "c0ffee", "origin": {"type": "service"}},
+                        "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"},
+                    }],
+                },
+            }],
+        }],
+    }
+    return json.dumps(payload).encode()
+
+
+def check_classifier():
+    """Los callbacks de statuses NO deben clasificarse como mensajes (traen field=messages)."""
+    for status in ("sent", "delivered", "read"):
+        kind = webhook_events.classify_payload(build_status_payload(status))
+        assert kind == "statuses", f"status {status} clasificado como {kind!r}"
+    kind = webhook_events.classify_payload(build_payload(1))
+    assert kind == "messages", f"mensaje clasificado como {kind!r}"
+    kind = webhook_events.classify_payload(json.dumps({"entry": [{"changes": [{"field": "messages", "value": {}}]}]}).encode())
+    assert kind == "other", f"evento vacío clasificado como {kind!r}"
+    print("Clasificador: ✅ messages / statuses / other")
+
+
+def parse_legacy(body: bytes) -> list:
+    """Camino anterior: json.loads + .get() anidados (sobre TODOS los mensajes, igual que el nuevo)."""
+    data = json.loads(body)
+    result = []
+    for entry in data.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            phone_number_id = value.get("metadata", {}).get("phone_number_id")
+            for message in value.get("messages", []):
+                message_type = message.get("type")
+                text = ""
+                lat = lng = None
+                if message_type == "text":
+                    text = message.get("text", {}).get("body", "").strip()
+                elif message_type == "button":
+                    text = message.get("button", {}).get("text", "").strip()
+                elif message_type == "location":
+                    location = message.get("location", {})
+                    lat, lng = location.get("latitude"), location.get("longitude")
+                result.append({
+                    "wa_id": message.get("from"), "message_id": message.get("id"), "type": message_type,
+                    "phone_number_id": phone_number_id, "text": text, "lat": lat, "lng": lng,
+                })
+    return result
+
+
+def parse_typed(body: bytes) -> list:
+    return list(webhook_parser.iter_messages(webhook_parser.loads(body)))
+
+
+def run(name: str, fn, body: bytes, iterations: int, messages: int = 0):
+    fn(body)  # calentamiento
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(body)
+    elapsed = time.perf_counter() - started
+    per_message = f"  {elapsed / iterations / messages * 1e6:6.2f} µs/mensaje" if messages else ""
+    print(f"  {name:<28} {elapsed / iterations * 1e6:8.2f} µs/payload{per_message}  ({iterations / elapsed:,.0f} payloads/s)")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    check_classifier()
+    print(f"Backend JSON: {webhook_parser.JSON_BACKEND}")
+    for size in (1, 10):
+        body = build_payload(size)
+        print(f"\nPayload con {size} mensaje(s), {len(body)} bytes:")
+        assert len(parse_legacy(body)) == len(parse_typed(body)) == size
+        run("json + .get() (anterior)", parse_legacy, body, iterations, size)
+        run(f"{webhook_parser.JSON_BACKEND} + IncomingMessage", parse_typed, body, iterations, size)
+
+    body = build_status_payload()
+    print(f"\nCallback de statuses, {len(body)} bytes:")
+    run(f"{webhook_parser.JSON_BACKEND} (decodificar)", webhook_parser.loads, body, iterations)
+    run("classify_payload (bytes)", webhook_events.classify_payload, body, iterations)
+
+
+if __name__ == "__main__":
+    main()
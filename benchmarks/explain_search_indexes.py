@@ -0,0 +1,165 @@
+"""
+EXPLAIN ANALYZE de las búsquedas antes/después de la migración de
+services/search_schema (columnas plegadas + GIN pg_trgm / array).
+
+Crea bench_search.places con --rows lugares sintéticos (100k por default),
+corre cada sentencia de services/search_sql sobre el JSONB (antes), aplica la
+migración a esa tabla y corre las sentencias INDEXED (después); las sentencias
+con ubicación se corren además con radio (BOUNDED, --radius-km). Reporta tiempo
+de ejecución, nodo principal del plan y buffers leídos; --plans imprime los
+planes completos. Al final borra el schema (salvo --keep).
+
+Nota: las funciones search_fold* se crean en public (igual que en producción).
+
+Uso (mismas variables DB_* que app.py):
+    python benchmarks/explain_search_indexes.py
+    python benchmarks/explain_search_indexes.py --rows 100000 --plans --keep
+    python benchmarks/explain_search_indexes.py --radius-km 5
+"""
+import argparse
+import os
+import re
+import sys
+
+import psycopg
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from services import search_schema, search_sql  # noqa: E402
+
+TABLE = "bench_search.places"
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+FOODS = ["tacos", "pizza", "hamburguesas", "sushi", "café", "pan", "pozole", "mariscos", "tortas", "helado",
+         "ramen", "alitas", "tamales", "enchiladas", "chilaquiles", "birria", "ceviche", "crepas", "pastes",
+         "tlayudas", "elotes", "churros", "paletas", "jugos", "licuados", "barbacoa", "carnitas", "mole",
+         "gorditas", "quesadillas", "pollo rostizado", "cochinita pibil", "comida china", "comida tailandesa"]
+STYLES = ["", " al pastor", " de la casa", " gourmet", " veganos", " artesanales", " caseros", " a domicilio",
+          " económicos", " para llevar"]
+
+CREATE_SQL = f"""
+DROP SCHEMA IF EXISTS bench_search CASCADE;
+CREATE SCHEMA bench_search;
+CREATE TABLE {TABLE} (
+    id bigint PRIMARY KEY,
+    name text, category text, products jsonb, categories jsonb,
+    priority int, cashback boolean, hours jsonb,
+    address text, phone text, url_order text, imagen_url text, url_extra text, afiliado boolean,
+    lat double precision, lng double precision, timezone text, delivery boolean,
+    {", ".join(f"{day}_open time, {day}_close time" for day in DAYS)},
+    is_active boolean, plan_activo boolean, plan_fecha_vencimiento date
+);
+"""
+
+INSERT_SQL = f"""
+INSERT INTO {TABLE}
+SELECT g,
+       'Lugar ' || g,
+       v[1 + g % n],
+       jsonb_build_array(v[1 + (g * 7) % n], v[1 + (g * 11) % n] || ' especial', v[1 + (g * 17) % n]),
+       jsonb_build_array(v[1 + (g * 3) % n], v[1 + (g * 5) % n]),
+       (g % 10), random() < 0.3, '{{}}'::jsonb,
+       'Calle ' || g, '5500000000', NULL, NULL, NULL, random() < 0.5,
+       14.5 + random() * 18, -117 + random() * 30, 'America/Mexico_City', random() < 0.5,
+       {", ".join("CASE WHEN random() < 0.9 THEN '09:00'::time END, '22:00'::time" for _ in DAYS)},
+       random() < 0.95, random() < 0.05, CURRENT_DATE + 30
+FROM generate_series(1, %(rows)s) AS g,
+     (SELECT %(vocab)s::text[] AS v, cardinality(%(vocab)s::text[]) AS n) AS vocab;
+"""
+
+CASES = [
+    ("exact_categories", search_sql.EXACT_IN_CATEGORIES, {"terms": ["tacos", "taco"]}),
+    ("exact_user_text", search_sql.EXACT_IN_CATEGORIES, {"terms": ["tacos de la casa"]}),
+    ("broad_like", search_sql.BROAD, {"patterns": ["%birria%"]}),
+    ("expanded", search_sql.EXPANDED, {"patterns": ["%taco%", "%pastor%", "%carnitas%", "%gringa%"]}),
+    ("exact_categories_near", search_sql.EXACT_IN_CATEGORIES_NEAR, {"terms": ["sushi"]}),
+    ("broad_like_near", search_sql.BROAD_NEAR, {"patterns": ["%cafe%", "%café%"]}),
+    ("expanded_near", search_sql.EXPANDED_NEAR, {"patterns": ["%ramen%", "%tailandesa%"]}),
+]
+
+
+def vocabulary() -> list:
+    return [food + style for food in FOODS for style in STYLES]
+
+
+def on_bench_table(sql: str) -> str:
+    return sql.replace("public.places", TABLE)
+
+
+def explain(cur, sql: str, params: dict):
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + on_bench_table(sql), params)
+    lines = [row[0] for row in cur.fetchall()]
+    execution = next((l for l in lines if l.startswith("Execution Time")), "")
+    ms = float(re.search(r"([\d.]+) ms", execution).group(1)) if execution else float("nan")
+    scans = sorted({m.group(0) for l in lines for m in [re.search(r"(Seq Scan|Bitmap Index Scan|Index Scan)[^(]*", l)] if m})
+    buffers = next((l.strip() for l in lines if "Buffers:" in l), "")
+    return ms, scans, buffers, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN ANALYZE de las búsquedas con y sin índices de búsqueda")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--plans", action="store_true", help="Imprimir los planes completos")
+    parser.add_argument("--keep", action="store_true", help="No borrar el schema bench_search al terminar")
+    parser.add_argument("--radius-km", type=float, default=10.0, help="Radio de las sentencias BOUNDED")
+    args = parser.parse_args()
+
+    conninfo = (
+        f"host={os.getenv('DB_HOST', '')} port={os.getenv('DB_PORT', '5432')} dbname={os.getenv('DB_NAME', '')} "
+        f"user={os.getenv('DB_USER', '')} password={os.getenv('DB_PASSWORD', '')} "
+        f"sslmode={os.getenv('DB_SSLMODE', 'require')}"
+    )
+    base = {"weekday": search_sql.today_weekday(), "limit": 10, "user_lat": 19.43, "user_lng": -99.13}
+
+    with psycopg.connect(conninfo, autocommit=True) as conn, conn.cursor() as cur:
+        print(f"Creando {TABLE} con {args.rows:,} lugares...")
+        cur.execute(CREATE_SQL)
+        try:
+            # Con parámetros psycopg no admite varias sentencias en un execute: ANALYZE aparte
+            cur.execute(INSERT_SQL, {"rows": args.rows, "vocab": vocabulary()})
+            cur.execute(f"ANALYZE {TABLE};")
+            before = {name: explain(cur, sql, search_sql.fold_params({**base, **params})) for name, sql, params in CASES}
+
+            print("Aplicando migración de search_schema...")
+            for statement in search_schema.migration_sql(TABLE):
+                cur.execute(statement)
+            after = {
+                name: explain(cur, search_sql.INDEXED[sql], search_sql.fold_params({**base, **params}))
+                for name, sql, params in CASES
+            }
+            # Con ubicación y radio: rectángulo sobre el índice (lat, lng) + círculo exacto
+            bounded = {
+                name: explain(cur, search_sql.BOUNDED[search_sql.INDEXED[sql]],
+                              search_sql.radius_params(search_sql.fold_params({**base, **params}), args.radius_km))
+                for name, sql, params in CASES if sql in search_sql.NEAR
+            }
+
+            print(f"\n{'búsqueda':>24} {'antes ms':>10} {'después ms':>11}  plan antes → después")
+            for name, *_ in CASES:
+                ms_before, scans_before, _, _ = before[name]
+                ms_after, scans_after, _, _ = after[name]
+                print(f"{name:>24} {ms_before:>10.2f} {ms_after:>11.2f}  "
+                      f"{', '.join(scans_before)} → {', '.join(scans_after)}")
+            print(f"\nCon radio de {args.radius_km:g} km (después → con radio):")
+            for name, (ms_bounded, scans_bounded, _, _) in bounded.items():
+                print(f"{name:>24} {after[name][0]:>10.2f} {ms_bounded:>11.2f}  {', '.join(scans_bounded)}")
+            print("\nBuffers (antes / después):")
+            for name, *_ in CASES:
+                print(f"  {name}: {before[name][2]}  /  {after[name][2]}")
+            for name in bounded:
+                print(f"  {name} con radio: {bounded[name][2]}")
+
+            if args.plans:
+                for name, *_ in CASES:
+                    print(f"\n===== {name} (antes) =====")
+                    print("\n".join(before[name][3]))
+                    print(f"===== {name} (después) =====")
+                    print("\n".join(after[name][3]))
+                    if name in bounded:
+                        print(f"===== {name} (con radio) =====")
+                        print("\n".join(bounded[name][3]))
+        finally:
+            if not args.keep:
+                cur.execute("DROP SCHEMA IF EXISTS bench_search CASCADE;")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Reproduce una captura de webhooks (WEBHOOK_CAPTURE_FILE) contra una instancia local
+y reporta throughput y percentiles de latencia.
+
+Uso:
+    python benchmarks/replay_webhooks.py captura.jsonl --speed 1
+    python benchmarks/replay_webhooks.py captura.jsonl --speed 10
+    python benchmarks/replay_webhooks.py captura.jsonl --speed max --concurrency 64
+
+- --speed N respeta el espaciado original entre requests dividido entre N;
+  --speed max los dispara lo más rápido posible (acotado por --concurrency).
+- Si APP_SECRET está definido, cada body se firma con X-Hub-Signature-256.
+- Antes de empezar consulta /health de la instancia y se niega a correr si no
+  reporta dry_run: true (SEND_VIA_WHATSAPP=false): con credenciales reales de
+  Meta el bot le contestaría a los números de la captura. --allow-live lo
+  salta (sólo contra una instancia sin credenciales reales).
+- Por default a cada message id se le agrega un sufijo por corrida para que la
+  de-duplicación no descarte los mensajes al repetir la misma captura
+  (--keep-ids para reproducir tal cual, ej. para medir duplicados).
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from services.metrics import LatencyWindow  # noqa: E402
+
+
+def load_capture(path: str) -> list:
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    records.sort(key=lambda r: r.get("ts", 0))
+    return records
+
+
+def refresh_message_ids(payload: dict, suffix: str) -> dict:
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            for message in (change.get("value") or {}).get("messages") or []:
+                if message.get("id"):
+                    message["id"] = f"{message['id']}-{suffix}"
+    return payload
+
+
+def target_is_dry_run(url: str) -> bool:
+    """Pregunta a /health de la instancia si está en dry_run (no manda mensajes por WhatsApp)."""
+    health_url = url.rsplit("/webhook", 1)[0] + "/health"
+    try:
+        response = httpx.get(health_url, timeout=10)
+        return response.json().get("dry_run") is True
+    except (httpx.HTTPError, ValueError, AttributeError) as e:
+        print(f"⚠️ No se pudo consultar {health_url}: {e}")
+        return False
+
+
+def sign(body: bytes, secret: str) -> dict:
+    if not secret:
+        return {}
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return {"X-Hub-Signature-256": f"sha256={digest}"}
+
+
+async def replay(records: list, url: str, speed: str, concurrency: int, secret: str, keep_ids: bool):
+    run_id = uuid.uuid4().hex[:8]
+    latencies = LatencyWindow(size=max(len(records), 1))
+    status_counts: Counter = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    first_ts = records[0].get("ts", 0)
+    factor = None if speed == "max" else float(speed)
+
+    async def fire(client: httpx.AsyncClient, i: int, record: dict):
+        payload = record["payload"]
+        if not keep_ids:
+            payload = refresh_message_ids(payload, f"{run_id}-{i}")
+        body = json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json", **sign(body, secret)}
+
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, content=body, headers=headers)
+                status_counts[response.status_code] += 1
+            except httpx.HTTPError as e:
+                status_counts[type(e).__name__] += 1
+            latencies.observe((time.perf_counter() - started) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        started = time.perf_counter()
+        tasks = []
+        for i, record in enumerate(records):
+            if factor:
+                # Respetar el espaciado original (escalado por la velocidad)
+                delay = (record.get("ts", first_ts) - first_ts) / factor - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(client, i, record)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return elapsed, status_counts, latencies.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce webhooks capturados contra una instancia local")
+    parser.add_argument("capture", help="Archivo JSONL generado con WEBHOOK_CAPTURE_FILE")
+    parser.add_argument("--url", default="http://localhost:8000/webhook")
+    parser.add_argument("--speed", default="1", help="1, 10, ... o max")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--keep-ids", action="store_true", help="No cambiar los message ids")
+    parser.add_argument("--allow-live", action="store_true",
+                        help="Correr aunque la instancia no reporte dry_run (puede mandar mensajes reales)")
+    args = parser.parse_args()
+
+    if not target_is_dry_run(args.url):
+        if not args.allow_live:
+            print("❌ La instancia no reporta dry_run: true en /health. Levántala con SEND_VIA_WHATSAPP=false "
+                  "(o usa --allow-live si de verdad no tiene credenciales de Meta).")
+            sys.exit(1)
+        print("⚠️" * 10)
+        print("⚠️ --allow-live: la instancia NO está en dry_run; si tiene credenciales reales, "
+              "el bot le mandará mensajes a los números de la captura")
+        print("⚠️" * 10)
+
+    records = load_capture(args.capture)
+    if not records:
+        print("Captura vacía")
+        return
+
+    kinds = Counter(r.get("kind", "?") for r in records)
+    span = records[-1].get("ts", 0) - records[0].get("ts", 0)
+    print(f"Reproduciendo {len(records)} requests ({dict(kinds)}), duración original {span:.1f}s, velocidad {args.speed}")
+
+    elapsed, status_counts, latency = asyncio.run(
+        replay(records, args.url, args.speed, args.concurrency, os.getenv("APP_SECRET", ""), args.keep_ids)
+    )
+
+    print(f"\nTiempo total: {elapsed:.2f}s")
+    print(f"Throughput:   {len(records) / elapsed:,.1f} req/s")
+    print(f"Respuestas:   {dict(status_counts)}")
+    print(
+        f"Latencia ms:  avg={latency['avg_ms']}  p50={latency['p50_ms']}  "
+        f"p95={latency['p95_ms']}  p99={latency['p99_ms']}  max={latency['max_ms']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
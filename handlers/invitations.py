@@ -2,8 +2,12 @@
 Handler de Invitaciones Comerciales.
 Maneja cuando un comercio hace click en "Obtener mi acceso".
 """
+import time
+
 import psycopg.rows
 
+from services import db
+
 # Dependencias (se inicializan desde app.py)
 pool_getter = None
 send_message = None
@@ -56,10 +60,12 @@ async def handle_invitation_button_click(wa_id: str, phone_number_id: str = None
         
         print(f"[INVITACION-BOT] Buscando teléfono en variaciones: {variaciones}")
         
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-                cur.execute(sql, tuple(variaciones))
-                invitacion = cur.fetchone()
+        started = time.perf_counter()
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+                await cur.execute(sql, tuple(variaciones))
+                invitacion = await cur.fetchone()
+        db.record("invitations.pending_by_phone", (time.perf_counter() - started) * 1000, 1 if invitacion else 0)
         
         if invitacion:
             codigo = invitacion['codigo']
@@ -1,9 +1,13 @@
 """
 Handler de Loyalty - Consulta de puntos y código QR.
 """
+import time
 from typing import Optional, Tuple
+
 import psycopg.rows
 
+from services import db
+
 # Estas se importarán desde app.py
 pool_getter = None
 send_message = None
@@ -62,10 +66,12 @@ async def get_loyalty_user_by_phone(wa_id: str) -> Optional[dict]:
         
         print(f"[LOYALTY] Buscando teléfono en variaciones: {variaciones[:3]}...")
         
-        with pool.connection() as conn:
-            with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-                cur.execute(sql, tuple(variaciones))
-                user = cur.fetchone()
+        started = time.perf_counter()
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+                await cur.execute(sql, tuple(variaciones))
+                user = await cur.fetchone()
+        db.record("loyalty.user_by_phone", (time.perf_counter() - started) * 1000, 1 if user else 0)
         
         if user:
             print(f"[LOYALTY] ✅ Usuario encontrado: {user.get('nombre', 'Sin nombre')} - {user.get('saldo_puntos', 0)} puntos")
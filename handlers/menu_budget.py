@@ -2,9 +2,13 @@
 Handler de Menú con Presupuesto.
 Búsqueda en capas: exacto > amplio inteligente > solo categoría
 """
+import time
 from typing import Optional, List, Dict, Any, Union
+
 import psycopg.rows
 
+from services import db
+
 pool_getter = None
 send_message = None
 
@@ -75,7 +79,7 @@ def obtener_palabra_especifica(producto: str) -> str:
     return None
 
 
-def buscar_producto_en_db(pool, producto: str, presupuesto: int, modo: str = 'exacto') -> List[Dict]:
+async def buscar_producto_en_db(pool, producto: str, presupuesto: int, modo: str = 'exacto') -> List[Dict]:
     """
     Busca producto en la BD.
     modo='exacto': busca el término completo
@@ -148,10 +152,17 @@ def buscar_producto_en_db(pool, producto: str, presupuesto: int, modo: str = 'ex
     LIMIT 30;
     """
     
-    with pool.connection() as conn:
-        with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(sql, tuple(params))
-            return cur.fetchall()
+    started = time.perf_counter()
+    try:
+        async with pool.connection() as conn:
+            async with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+                await cur.execute(sql, tuple(params))
+                rows = await cur.fetchall()
+    except Exception:
+        db.record(f"budget.{modo}", (time.perf_counter() - started) * 1000, error=True)
+        raise
+    db.record(f"budget.{modo}", (time.perf_counter() - started) * 1000, len(rows))
+    return rows
 
 
 async def search_menu_by_negocio(
@@ -177,20 +188,20 @@ async def search_menu_by_negocio(
             palabra_especifica = obtener_palabra_especifica(producto)
             
             # CAPA 1: Búsqueda exacta
-            rows = buscar_producto_en_db(pool, producto, presupuesto, modo='exacto')
+            rows = await buscar_producto_en_db(pool, producto, presupuesto, modo='exacto')
             modo_usado = 'exacto'
             
             # CAPA 2: Búsqueda amplia con palabra específica
             if not rows and palabra_especifica:
                 print(f"[MENU-BUDGET] No exacto, buscando amplio con '{palabra_especifica}'...")
-                rows = buscar_producto_en_db(pool, producto, presupuesto, modo='amplio')
+                rows = await buscar_producto_en_db(pool, producto, presupuesto, modo='amplio')
                 modo_usado = 'amplio_especifico'
             
             # CAPA 3: Solo palabra base (último recurso, sin palabra específica)
             if not rows:
                 palabra_base = producto.lower().split()[0] if producto.split() else producto
                 print(f"[MENU-BUDGET] No encontrado, buscando solo '{palabra_base}'...")
-                rows = buscar_producto_en_db(pool, producto, presupuesto, modo='solo_base')
+                rows = await buscar_producto_en_db(pool, producto, presupuesto, modo='solo_base')
                 modo_usado = 'solo_base'
                 if rows:
                     avisos.append(f"No encontré \"{producto}\" exacto, mostrando opciones de \"{palabra_base}\"")
@@ -0,0 +1,176 @@
+"""
+Control de admisión (load shedding) para el webhook.
+- max_in_flight: cuántos mensajes se procesan a la vez (BD + IA + envíos).
+- max_pending: cuántos mensajes aceptados pueden esperar turno; arriba de
+  eso el webhook responde 503 y Meta reintenta más tarde.
+- Modo degradado: cuando todos los slots están ocupados (o hay mensajes
+  esperando), las partes caras opcionales (expansión con IA, saludo con IA,
+  intención con IA) se saltan y se responde sólo con BD/caché, para que el
+  p99 se mantenga acotado mientras estamos saturados. Sólo se loguea al
+  entrar y al salir del modo degradado; lo saltado se cuenta en stats().
+
+Carriles (lanes): los comandos baratos (puntos/QR, invitación, "más", selección
+por número) tienen su propio presupuesto de slots ("fast"), así nunca esperan
+detrás de búsquedas con IA ("slow"). Cada carril reporta su propia latencia.
+"""
+import asyncio
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from services.metrics import LatencyWindow
+
+
+class _Lane:
+    """Slots de un carril con sus propias métricas."""
+
+    def __init__(self, name: str, budget: int):
+        self.name = name
+        self.budget = budget
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.processed = 0
+        self.slot_wait = LatencyWindow()
+        self.run_time = LatencyWindow()
+
+    def stats(self) -> dict:
+        return {
+            "budget": self.budget,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "processed": self.processed,
+            "slot_wait": self.slot_wait.snapshot(),
+            "run_time": self.run_time.snapshot(),
+        }
+
+
+class AdmissionController:
+    """Semáforos por carril + reservas acotadas de mensajes aceptados."""
+
+    def __init__(self, max_in_flight: int = 16, max_pending: int = 200, degrade_at: Optional[int] = None,
+                 fast_in_flight: int = 8):
+        """
+        max_in_flight: slots del carril lento (IA + búsquedas).
+        fast_in_flight: slots del carril rápido (comandos baratos).
+        """
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self.degrade_at = degrade_at or max_in_flight
+        self.lanes: Dict[str, _Lane] = {
+            "fast": _Lane("fast", fast_in_flight),
+            "slow": _Lane("slow", max_in_flight),
+        }
+        self.reserved = 0       # mensajes aceptados y aún no terminados (esperando + en proceso)
+        self.admitted = 0
+        self.shed = 0
+        self.degraded = 0
+        self.degraded_by_feature: Counter = Counter()
+        self.degraded_periods = 0
+        self._degraded_since: Optional[float] = None
+        self._degraded_at_start = 0
+
+    @property
+    def capacity(self) -> int:
+        return sum(lane.budget for lane in self.lanes.values()) + self.max_pending
+
+    @property
+    def in_flight(self) -> int:
+        return sum(lane.in_flight for lane in self.lanes.values())
+
+    @property
+    def waiting(self) -> int:
+        return sum(lane.waiting for lane in self.lanes.values())
+
+    @property
+    def overloaded(self) -> bool:
+        # Sólo el carril lento degrada: es el que usa IA
+        slow = self.lanes["slow"]
+        return slow.waiting > 0 or slow.in_flight >= self.degrade_at
+
+    def try_reserve(self, count: int = 1) -> bool:
+        """
+        Reserva lugar para `count` mensajes nuevos.
+        Retorna False (y cuenta como shed) si se rebasaría la capacidad.
+        """
+        if self.reserved + count > self.capacity:
+            self.shed += count
+            return False
+        self.reserved += count
+        self.admitted += count
+        return True
+
+    def release(self, count: int = 1):
+        """Libera la reserva de mensajes que ya terminaron (o que no se llegaron a encolar)."""
+        self.reserved = max(0, self.reserved - count)
+
+    @asynccontextmanager
+    async def slot(self, lane_name: str = "slow"):
+        """Espera un slot de procesamiento en el carril indicado."""
+        lane = self.lanes[lane_name]
+        if lane.semaphore is None:
+            # Se crea perezosamente para quedar ligado al event loop que lo usa
+            lane.semaphore = asyncio.Semaphore(lane.budget)
+
+        started = time.monotonic()
+        lane.waiting += 1
+        try:
+            await lane.semaphore.acquire()
+        finally:
+            lane.waiting -= 1
+        acquired = time.monotonic()
+        lane.slot_wait.observe((acquired - started) * 1000)
+
+        lane.in_flight += 1
+        try:
+            yield
+        finally:
+            lane.in_flight -= 1
+            lane.processed += 1
+            lane.run_time.observe((time.monotonic() - acquired) * 1000)
+            lane.semaphore.release()
+            if self._degraded_since is not None:
+                self._update_degraded_mode()
+
+    def _update_degraded_mode(self) -> bool:
+        """Registra la entrada/salida del modo degradado (un log por transición, no por chequeo)."""
+        overloaded = self.overloaded
+        if overloaded and self._degraded_since is None:
+            self._degraded_since = time.monotonic()
+            self._degraded_at_start = self.degraded
+            self.degraded_periods += 1
+            slow = self.lanes["slow"]
+            print(f"[ADMISSION] ⚠️ Saturado ({slow.in_flight} en proceso, {slow.waiting} esperando): entra a modo degradado")
+        elif not overloaded and self._degraded_since is not None:
+            seconds = time.monotonic() - self._degraded_since
+            skipped = self.degraded - self._degraded_at_start
+            self._degraded_since = None
+            print(f"[ADMISSION] ✅ Sale de modo degradado tras {seconds:.1f}s ({skipped} llamadas opcionales saltadas)")
+        return overloaded
+
+    def should_degrade(self, feature: str) -> bool:
+        """True si hay que saltarse `feature` (IA opcional) por saturación."""
+        if not self._update_degraded_mode():
+            return False
+        self.degraded += 1
+        self.degraded_by_feature[feature] += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_pending": self.max_pending,
+            "degrade_at": self.degrade_at,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "reserved": self.reserved,
+            "overloaded": self.overloaded,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "degraded": self.degraded,
+            "degraded_by_feature": dict(self.degraded_by_feature),
+            "degraded_mode": self._degraded_since is not None,
+            "degraded_periods": self.degraded_periods,
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()},
+        }
@@ -0,0 +1,235 @@
+"""
+Acceso asíncrono a PostgreSQL (psycopg AsyncConnectionPool).
+Las consultas ceden el event loop mientras esperan a la BD, así que varias
+búsquedas/handlers pueden estar en vuelo a la vez (hasta max_size conexiones)
+en lugar de bloquear todo el proceso una consulta a la vez.
+
+Se configura desde app.py con init(conninfo, ...) y se abre en el startup con
+warm_up() (AsyncConnectionPool necesita un event loop corriendo):
+
+    rows = await db.fetch_all("search.exact_categories", sql, params)
+    async with db.get_pool().connection() as conn, conn.cursor() as cur: ...
+
+Cada consulta de los atajos lleva un nombre ("search.broad_like", "budget.exacto"):
+por nombre se registran latencia (percentiles + histograma) y filas, y las que
+pasan de slow_query_ms van al log de consultas lentas. Con measure() se suma el
+tiempo de BD de un bloque (ej. una búsqueda completa) para analytics.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence
+
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from services.metrics import Histogram, LatencyWindow
+
+_pool: Optional[AsyncConnectionPool] = None
+_conninfo = ""
+_min_size = 0
+_max_size = 8
+_max_idle = 600.0
+_slow_query_ms = 500.0
+
+
+def init(conninfo: str, min_size: int = 0, max_size: int = 8, slow_query_ms: float = 500.0,
+         max_idle: float = 600.0):
+    global _conninfo, _min_size, _max_size, _slow_query_ms, _max_idle
+    _conninfo = conninfo
+    _min_size = min_size
+    _max_size = max(max_size, min_size)
+    _slow_query_ms = slow_query_ms
+    _max_idle = max_idle
+
+
+def get_pool() -> AsyncConnectionPool:
+    """Pool compartido (se crea cerrado; open_pool() lo abre dentro del event loop)."""
+    global _pool
+    if _pool is None:
+        _pool = AsyncConnectionPool(
+            conninfo=_conninfo,
+            min_size=_min_size,
+            max_size=_max_size,
+            max_idle=_max_idle,
+            kwargs={"autocommit": True},
+            # Tras periodos sin tráfico la conexión pudo morir del lado del servidor/proxy:
+            # se verifica al prestarla en lugar de fallar la primera consulta del usuario
+            check=AsyncConnectionPool.check_connection,
+            open=False,
+        )
+    return _pool
+
+
+async def open_pool():
+    pool = get_pool()
+    if pool.closed:
+        await pool.open()
+
+
+async def warm_up(timeout: float = 10.0) -> float:
+    """
+    Abre el pool y espera (hasta timeout) a tener min_size conexiones listas
+    (TLS + auth hechos), para que las primeras peticiones tras un deploy no
+    paguen el handshake. Retorna los ms que tardó.
+    No usa pool.wait(): si la BD tarda, ese cierra el pool; aquí el pool sigue
+    abierto y termina de conectar en segundo plano.
+    """
+    started = time.perf_counter()
+    await open_pool()
+    pool = get_pool()
+    deadline = started + timeout
+    while pool.get_stats().get("pool_available", 0) < _min_size and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    ready = pool.get_stats().get("pool_available", 0)
+    if ready < _min_size:
+        print(f"[DB] ⚠️ Pool sin pre-calentar: {ready}/{_min_size} conexiones tras {timeout:.0f}s")
+    else:
+        await execute("health.ping", "SELECT 1;")
+    return (time.perf_counter() - started) * 1000
+
+
+async def close():
+    if _pool is not None and not _pool.closed:
+        await _pool.close()
+
+
+def pool_stats() -> dict:
+    """get_stats() de psycopg_pool (acumulado desde el arranque) + derivados para detectar falta de conexiones."""
+    if _pool is None or _pool.closed:
+        return {"open": False, "pool_min": _min_size, "pool_max": _max_size}
+    raw = _pool.get_stats()
+    size = raw.get("pool_size", 0)
+    available = raw.get("pool_available", 0)
+    queued = raw.get("requests_queued", 0)
+    return {
+        "open": True,
+        **raw,
+        # Prestadas a una consulta o aún conectándose
+        "connections_in_use": size - available,
+        "avg_wait_ms": round(raw.get("requests_wait_ms", 0) / queued, 1) if queued else 0,
+    }
+
+
+# ---- Métricas por consulta ----
+class _QueryStats:
+    __slots__ = ("calls", "errors", "rows", "slow", "latency", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.slow = 0
+        self.latency = LatencyWindow(size=500)
+        self.histogram = Histogram()
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "avg_rows": round(self.rows / self.calls, 2) if self.calls else 0,
+            "slow": self.slow,
+            "latency": self.latency.snapshot(),
+            "histogram": self.histogram.snapshot(),
+        }
+
+
+class QueryTimer:
+    """Tiempo de BD acumulado dentro de un measure() (incluye los measure() anidados)."""
+
+    __slots__ = ("ms", "queries", "_parent")
+
+    def __init__(self, parent: Optional["QueryTimer"] = None):
+        self.ms = 0.0
+        self.queries = 0
+        self._parent = parent
+
+    def _add(self, elapsed_ms: float):
+        timer = self
+        while timer is not None:
+            timer.ms += elapsed_ms
+            timer.queries += 1
+            timer = timer._parent
+
+
+_stats: Dict[str, _QueryStats] = {}
+_slow_log: deque = deque(maxlen=50)
+_current_timer: ContextVar[Optional[QueryTimer]] = ContextVar("db_query_timer", default=None)
+
+
+@contextmanager
+def measure():
+    """`with db.measure() as t: ...` → t.ms = tiempo de BD de las consultas hechas en el bloque."""
+    timer = QueryTimer(_current_timer.get())
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+def record(name: str, elapsed_ms: float, rows: int = 0, error: bool = False):
+    """Registra una consulta (los atajos lo hacen solos; útil para consultas con cursor propio)."""
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = _QueryStats()
+    stats.calls += 1
+    stats.rows += rows
+    stats.latency.observe(elapsed_ms)
+    stats.histogram.observe(elapsed_ms)
+    if error:
+        stats.errors += 1
+
+    timer = _current_timer.get()
+    if timer is not None:
+        timer._add(elapsed_ms)
+
+    if elapsed_ms >= _slow_query_ms:
+        stats.slow += 1
+        _slow_log.append({"name": name, "ms": round(elapsed_ms, 1), "rows": rows, "at": time.time()})
+        print(f"[DB-SLOW] ⚠️ {name}: {elapsed_ms:.0f}ms ({rows} filas)")
+
+
+# ---- Atajos ----
+async def fetch_all(name: str, sql: str, params: Optional[Sequence[Any]] = None) -> List[Dict[str, Any]]:
+    started = time.perf_counter()
+    try:
+        async with get_pool().connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(sql, params)
+            rows = await cur.fetchall()
+    except Exception:
+        record(name, (time.perf_counter() - started) * 1000, error=True)
+        raise
+    record(name, (time.perf_counter() - started) * 1000, len(rows))
+    return rows
+
+
+async def fetch_one(name: str, sql: str, params: Optional[Sequence[Any]] = None) -> Optional[Dict[str, Any]]:
+    rows = await fetch_all(name, sql, params)
+    return rows[0] if rows else None
+
+
+async def execute(name: str, sql: str, params: Optional[Sequence[Any]] = None) -> int:
+    """Ejecuta sin traer filas; retorna filas afectadas."""
+    started = time.perf_counter()
+    try:
+        async with get_pool().connection() as conn, conn.cursor() as cur:
+            await cur.execute(sql, params)
+            rowcount = max(cur.rowcount, 0)
+    except Exception:
+        record(name, (time.perf_counter() - started) * 1000, error=True)
+        raise
+    record(name, (time.perf_counter() - started) * 1000, rowcount)
+    return rowcount
+
+
+def stats() -> dict:
+    return {
+        "slow_query_ms": _slow_query_ms,
+        "pool": pool_stats(),
+        "queries": {name: s.snapshot() for name, s in sorted(_stats.items())},
+        "slow_queries": list(_slow_log),
+    }
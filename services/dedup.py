@@ -0,0 +1,148 @@
+"""
+De-duplicación de mensajes del webhook por WhatsApp message id.
+Meta re-entrega webhooks cuando respondemos lento; los duplicados
+se descartan en O(1) antes de cualquier trabajo caro (BD, IA, envíos).
+
+Backends:
+- memory: set con TTL + LRU en memoria (por proceso)
+- postgres: además registra el id en una tabla compartida (multi-worker)
+"""
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS processed_webhook_messages (
+    message_id TEXT PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+"""
+
+# Cada cuántas inserciones se purgan ids viejos de la tabla
+_PURGE_EVERY = 500
+
+
+class MessageDeduplicator:
+    """Set de message ids vistos con expiración (TTL) y tope de tamaño (LRU)."""
+
+    def __init__(self, ttl_seconds: int = 86400, max_entries: int = 100_000,
+                 backend: str = "memory", pool_getter: Optional[Callable] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.backend = backend
+        self.pool_getter = pool_getter
+        # message_id -> expira_en (orden de inserción = orden de expiración)
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self.checks = 0
+        self.hits = 0
+        self.db_hits = 0
+        self.db_errors = 0
+        self._inserts = 0
+
+    def _evict(self, now: float):
+        while self._seen:
+            oldest_id, expires_at = next(iter(self._seen.items()))
+            if expires_at > now and len(self._seen) <= self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def seen_locally(self, message_id: str) -> bool:
+        """Revisa y marca el id en memoria. Retorna True si es duplicado."""
+        now = time.monotonic()
+        expires_at = self._seen.get(message_id)
+        if expires_at is not None and expires_at > now:
+            return True
+        self._seen[message_id] = now + self.ttl_seconds
+        self._seen.move_to_end(message_id)
+        self._evict(now)
+        return False
+
+    async def forget(self, message_ids: Iterable[Optional[str]]):
+        """
+        Quita ids (ej. mensajes que no se pudieron aceptar y Meta debe reintentar),
+        también de la tabla compartida: si no, el reintento se descartaría como duplicado.
+        """
+        ids = [message_id for message_id in message_ids if message_id]
+        for message_id in ids:
+            self._seen.pop(message_id, None)
+        if not ids or self.backend != "postgres":
+            return
+        try:
+            pool = self.pool_getter() if self.pool_getter else None
+            if not pool:
+                return
+            async with pool.connection() as conn, conn.cursor() as cur:
+                await cur.execute("DELETE FROM processed_webhook_messages WHERE message_id = ANY(%s);", (ids,))
+        except Exception as e:
+            self.db_errors += 1
+            print(f"[DEDUP] ⚠️ Error olvidando {len(ids)} id(s) en BD: {e}")
+
+    async def is_duplicate(self, message_id: Optional[str]) -> bool:
+        """Retorna True si el mensaje ya se recibió antes (y lo marca como visto)."""
+        if not message_id:
+            return False
+
+        self.checks += 1
+        if self.seen_locally(message_id):
+            self.hits += 1
+            return True
+
+        if self.backend == "postgres" and await self._seen_in_db(message_id):
+            self.hits += 1
+            self.db_hits += 1
+            return True
+
+        return False
+
+    async def _seen_in_db(self, message_id: str) -> bool:
+        # ⚠️ Si la BD falla, NO descartamos el mensaje (mejor duplicar que perder)
+        try:
+            pool = self.pool_getter() if self.pool_getter else None
+            if not pool:
+                return False
+            async with pool.connection() as conn, conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    INSERT INTO processed_webhook_messages (message_id)
+                    VALUES (%s)
+                    ON CONFLICT (message_id) DO NOTHING
+                    RETURNING message_id;
+                    """,
+                    (message_id,)
+                )
+                inserted = await cur.fetchone() is not None
+
+                self._inserts += 1
+                if self._inserts % _PURGE_EVERY == 0:
+                    await cur.execute(
+                        "DELETE FROM processed_webhook_messages WHERE created_at < NOW() - make_interval(secs => %s);",
+                        (self.ttl_seconds,)
+                    )
+            return not inserted
+        except Exception as e:
+            self.db_errors += 1
+            print(f"[DEDUP] ⚠️ Error consultando BD (no crítico): {e}")
+            return False
+
+    async def ensure_table(self):
+        if self.backend != "postgres":
+            return
+        try:
+            async with self.pool_getter().connection() as conn, conn.cursor() as cur:
+                await cur.execute(CREATE_TABLE_SQL)
+            print("[DEDUP] ✅ Tabla processed_webhook_messages lista")
+        except Exception as e:
+            print(f"[DEDUP] ⚠️ No se pudo crear tabla de de-duplicación: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "entries": len(self._seen),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "checks": self.checks,
+            "duplicates_dropped": self.hits,
+            "db_hits": self.db_hits,
+            "db_errors": self.db_errors,
+            "hit_rate": round(self.hits / self.checks, 4) if self.checks else 0.0,
+        }
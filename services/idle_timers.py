@@ -0,0 +1,61 @@
+"""
+Deadlines de inactividad por usuario, ordenados en un heap.
+En vez de recorrer todas las sesiones en cada tick, sólo se sacan las que
+ya vencieron: touch() es O(log N) y pop_expired() es O(vencidas · log N).
+
+Las entradas viejas (el usuario volvió a escribir y su deadline se movió)
+se descartan al salir del heap (lazy deletion); si el heap crece demasiado
+respecto a los usuarios vivos se compacta.
+"""
+import heapq
+from typing import Dict, List, Tuple
+
+
+class IdleTimers:
+    """Heap de (deadline, wa_id) con el deadline vigente de cada usuario."""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._deadlines: Dict[str, float] = {}
+        self.expired = 0
+
+    def touch(self, wa_id: str, deadline: float):
+        """Programa (o reprograma) el vencimiento de un usuario."""
+        if self._deadlines.get(wa_id) == deadline:
+            return
+        self._deadlines[wa_id] = deadline
+        heapq.heappush(self._heap, (deadline, wa_id))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._compact()
+
+    def discard(self, wa_id: str):
+        self._deadlines.pop(wa_id, None)
+
+    def pop_expired(self, now: float) -> List[str]:
+        """Saca y retorna los usuarios cuyo deadline vigente ya pasó."""
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, wa_id = heapq.heappop(self._heap)
+            if self._deadlines.get(wa_id) != deadline:
+                continue  # Entrada vieja: el usuario tuvo actividad después
+            del self._deadlines[wa_id]
+            expired.append(wa_id)
+        self.expired += len(expired)
+        return expired
+
+    def next_deadline(self):
+        return self._heap[0][0] if self._heap else None
+
+    def _compact(self):
+        self._heap = [(deadline, wa_id) for wa_id, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self._deadlines),
+            "heap_size": len(self._heap),
+            "expired": self.expired,
+        }
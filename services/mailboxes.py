@@ -0,0 +1,147 @@
+"""
+Mailboxes por usuario (modelo actor).
+Cada wa_id tiene su propia cola y una tarea que la procesa en orden estricto;
+usuarios distintos se procesan en paralelo. Los mailboxes inactivos se
+liberan solos para que la memoria no crezca con el número de usuarios.
+
+Opcionalmente el actor junta (coalesce) mensajes consecutivos que llegan
+dentro de una ventana corta, ej. "hola" + "quiero tacos" → un solo proceso.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class _Mailbox:
+    __slots__ = ("queue", "task")
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = None
+
+
+class MailboxRegistry:
+    """Registro de actores por llave (wa_id)."""
+
+    def __init__(self, handler: Callable[[str, Any], Awaitable[None]], idle_seconds: float = 30.0,
+                 coalesce: Optional[Callable[[Any, Any], Optional[Any]]] = None,
+                 coalesce_window: float = 0.0, coalesce_max: float = 2.0):
+        """
+        coalesce(a, b) → item combinado, o None si a y b no se pueden juntar.
+                         coalesce(a, None) indica si `a` es combinable (None = no).
+        coalesce_window: segundos a esperar otro mensaje tras el último (debounce).
+        coalesce_max: tope total de espera desde el primer mensaje.
+        """
+        self.handler = handler
+        self.idle_seconds = idle_seconds
+        self.coalesce = coalesce
+        self.coalesce_window = coalesce_window
+        self.coalesce_max = coalesce_max
+        self.coalesced = 0
+        self._boxes: Dict[str, _Mailbox] = {}
+        self.created = 0
+        self.reclaimed = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+
+    def post(self, key: str, item: Any) -> asyncio.Future:
+        """
+        Deja un item en el mailbox del usuario (sin bloquear).
+        Retorna un future que se resuelve cuando el item terminó de procesarse.
+        """
+        box = self._boxes.get(key)
+        if box is None:
+            box = _Mailbox()
+            self._boxes[key] = box
+            box.task = asyncio.create_task(self._run(key, box), name=f"mailbox-{key}")
+            self.created += 1
+
+        future = asyncio.get_running_loop().create_future()
+        box.queue.put_nowait((item, future))
+        depth = box.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return future
+
+    async def submit(self, key: str, items: List[Any]):
+        """Encola varios items del mismo usuario (en orden) y espera a que terminen."""
+        futures = [self.post(key, item) for item in items]
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _run(self, key: str, box: _Mailbox):
+        carry = None  # item que llegó durante la ventana y no se pudo juntar
+        while True:
+            if carry is not None:
+                (item, future), carry = carry, None
+            else:
+                try:
+                    item, future = await asyncio.wait_for(box.queue.get(), timeout=self.idle_seconds)
+                except asyncio.TimeoutError:
+                    # ✅ Sin mensajes en idle_seconds → liberar el mailbox
+                    # (no hay await entre la revisión y el borrado, así que no hay carrera)
+                    if box.queue.empty():
+                        if self._boxes.get(key) is box:
+                            del self._boxes[key]
+                        self.reclaimed += 1
+                        return
+                    continue
+
+            futures = [future]
+            if self.coalesce and self.coalesce_window > 0:
+                item, carry = await self._collect(box, item, futures)
+
+            try:
+                await self.handler(key, item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[MAILBOX] ❌ Error procesando mensaje de {key}: {e}")
+            finally:
+                for f in futures:
+                    if not f.done():
+                        f.set_result(None)
+
+    async def _collect(self, box: _Mailbox, item: Any, futures: list):
+        """
+        Espera más mensajes dentro de la ventana y los combina con `item`.
+        Retorna (item_combinado, carry) donde carry es el primer mensaje que no se pudo juntar.
+        """
+        # Si el primer mensaje no es combinable, no vale la pena esperar
+        if self.coalesce(item, None) is None:
+            return item, None
+
+        deadline = time.monotonic() + self.coalesce_max
+        while True:
+            timeout = min(self.coalesce_window, deadline - time.monotonic())
+            if timeout <= 0:
+                return item, None
+            try:
+                next_item, next_future = await asyncio.wait_for(box.queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return item, None
+
+            merged = self.coalesce(item, next_item)
+            if merged is None:
+                return item, (next_item, next_future)
+
+            item = merged
+            futures.append(next_future)
+            self.coalesced += 1
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def stats(self) -> dict:
+        return {
+            "live": len(self._boxes),
+            "pending": sum(box.queue.qsize() for box in self._boxes.values()),
+            "created": self.created,
+            "reclaimed": self.reclaimed,
+            "processed": self.processed,
+            "failed": self.failed,
+            "max_depth": self.max_depth,
+            "idle_seconds": self.idle_seconds,
+            "coalesce_window_ms": int(self.coalesce_window * 1000),
+            "coalesced_messages": self.coalesced,
+        }
@@ -0,0 +1,63 @@
+"""
+Métricas en memoria para el bot (contadores y ventanas de latencia).
+Se exponen en /metrics como JSON.
+"""
+import math
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Optional
+
+
+class LatencyWindow:
+    """Guarda las últimas N mediciones (en ms) y calcula percentiles."""
+
+    def __init__(self, size: int = 1000):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float):
+        self.samples.append(value_ms)
+        self.count += 1
+        self.total_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        return ordered[idx]
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        def _round(v):
+            return round(v, 2) if v is not None else None
+
+        return {
+            "count": self.count,
+            "avg_ms": _round(self.total_ms / self.count) if self.count else None,
+            "p50_ms": _round(self.percentile(50)),
+            "p95_ms": _round(self.percentile(95)),
+            "p99_ms": _round(self.percentile(99)),
+            "max_ms": _round(self.max_ms) if self.count else None,
+        }
+
+
+class Histogram:
+    """Conteo por buckets fijos (en ms) desde el arranque; complementa los percentiles de LatencyWindow."""
+
+    DEFAULT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value_ms: float):
+        self.counts[bisect_left(self.buckets, value_ms)] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        data = {f"<={bound}ms": count for bound, count in zip(self.buckets, self.counts)}
+        data[f">{self.buckets[-1]}ms"] = self.counts[-1]
+        return data
@@ -0,0 +1,221 @@
+"""
+Caché compartido de lugares (id → datos del lugar).
+Las sesiones guardan sólo ids + distancias de sus resultados; los datos
+completos (productos, horarios, etc.) viven una sola vez aquí y se
+reconstruyen al momento de mostrarlos.
+
+Se inicializa desde app.py con init(fetcher, distance_formatter):
+- fetcher(ids) → corrutina que trae de la BD los lugares que no estén en caché
+  (ej. sesión cargada de otro worker, lugar expulsado por LRU o invalidado
+  por /sheet/sync con invalidate())
+- distance_formatter(metros) → texto de distancia ("350 m", "1.2 km")
+
+La BD es asíncrona: antes de atender un mensaje se llama prefetch() con los ids
+de la sesión, y resolve() (síncrono, usado vía session["last_results"]) lee del
+caché. Los ids del prefetch quedan fijos (la LRU no los expulsa) hasta release()
+al terminar el mensaje; si aun así falta alguno, resolve() lo busca con
+lookup(ids) (síncrono, ej. el catálogo en memoria) para no recorrer la lista:
+la selección por número y la paginación dependen de la posición.
+"""
+import math
+from array import array
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+# Campos que dependen de la búsqueda (no del lugar) y se guardan aparte en la sesión
+PER_RESULT_KEYS = ("distance_meters", "distance_text", "distance_km", "is_open_now")
+
+_places: "OrderedDict[int, dict]" = OrderedDict()
+_fetcher: Optional[Callable[[List[int]], Awaitable[List[dict]]]] = None
+_distance_formatter: Optional[Callable[[float], str]] = None
+_lookup: Optional[Callable[[List[int]], Dict[int, dict]]] = None
+_max_entries = 5000
+# place_id → mensajes en proceso que lo prefetchearon (no se expulsa)
+_pinned: Dict[int, int] = {}
+
+hits = 0
+misses = 0
+fetched = 0
+invalidations = 0
+lookups = 0
+dropped = 0
+
+
+def init(fetcher: Callable[[List[int]], Awaitable[List[dict]]], distance_formatter: Callable[[float], str], max_entries: int = 5000,
+         lookup: Optional[Callable[[List[int]], Dict[int, dict]]] = None):
+    global _fetcher, _distance_formatter, _max_entries, _lookup
+    _fetcher = fetcher
+    _distance_formatter = distance_formatter
+    _max_entries = max_entries
+    _lookup = lookup
+
+
+def _evict():
+    """Expulsa los menos recientes hasta el tope, saltando los fijados por un prefetch."""
+    excess = len(_places) - _max_entries
+    if excess <= 0:
+        return
+    victims = []
+    for place_id in _places:
+        if place_id not in _pinned:
+            victims.append(place_id)
+            if len(victims) == excess:
+                break
+    for place_id in victims:
+        del _places[place_id]
+
+
+def put(place: dict):
+    """Guarda (o completa) los datos base de un lugar."""
+    place_id = place.get("id")
+    if place_id is None:
+        return
+    base = {k: v for k, v in place.items() if k not in PER_RESULT_KEYS}
+    current = _places.get(place_id)
+    if current is not None:
+        # Algunas búsquedas no traen todas las columnas (ej. categories): completar
+        current.update(base)
+        _places.move_to_end(place_id)
+    else:
+        _places[place_id] = base
+        _evict()
+
+
+def invalidate(place_id: int):
+    """Descarta un lugar que cambió (/sheet/sync): el siguiente prefetch() lo trae de nuevo."""
+    global invalidations
+    if _places.pop(place_id, None) is not None:
+        invalidations += 1
+
+
+async def prefetch(ids: Iterable[int]) -> List[int]:
+    """
+    Trae de la BD los lugares que falten en caché (antes de resolver resultados) y
+    los fija hasta release(). Retorna los ids fijados (para pasarlos a release()).
+    """
+    global misses, fetched
+    ids = list(set(ids))
+    for place_id in ids:
+        _pinned[place_id] = _pinned.get(place_id, 0) + 1
+    missing = [place_id for place_id in ids if place_id not in _places]
+    if not missing or not _fetcher:
+        return ids
+    misses += len(missing)
+    try:
+        for place in await _fetcher(missing):
+            put(place)
+            fetched += 1
+    except Exception as e:
+        print(f"[PLACE-CACHE] ⚠️ Error trayendo lugares {missing}: {e}")
+    return ids
+
+
+def release(ids: Iterable[int]):
+    """Libera los ids fijados por prefetch() (al terminar el mensaje)."""
+    for place_id in ids:
+        pending = _pinned.get(place_id, 0)
+        if pending <= 1:
+            _pinned.pop(place_id, None)
+        else:
+            _pinned[place_id] = pending - 1
+    _evict()
+
+
+def get_many(ids: Iterable[int]) -> Dict[int, dict]:
+    """Lugares en caché (los que falten se omiten; prefetch() los trae antes)."""
+    global hits
+    found: Dict[int, dict] = {}
+    for place_id in ids:
+        place = _places.get(place_id)
+        if place is not None:
+            found[place_id] = place
+            _places.move_to_end(place_id)
+            hits += 1
+    return found
+
+
+class ResultRefs:
+    """Resultados de una búsqueda: ids, distancias y si estaban abiertos, en arrays compactos."""
+
+    __slots__ = ("ids", "distances", "open_flags")
+
+    def __init__(self, ids: Optional[array] = None, distances: Optional[array] = None, open_flags: Optional[array] = None):
+        self.ids = ids if ids is not None else array("q")
+        self.distances = distances if distances is not None else array("d")   # NaN = sin distancia
+        self.open_flags = open_flags if open_flags is not None else array("b")
+
+    @classmethod
+    def from_places(cls, places: Iterable[dict]) -> "ResultRefs":
+        refs = cls()
+        for place in places:
+            if place.get("id") is None:
+                continue
+            put(place)
+            distance = place.get("distance_meters")
+            refs.ids.append(int(place["id"]))
+            refs.distances.append(float(distance) if distance is not None else math.nan)
+            refs.open_flags.append(1 if place.get("is_open_now") else 0)
+        return refs
+
+    def resolve(self) -> List[dict]:
+        """Reconstruye los dicts de lugar (como los regresaba la búsqueda original)."""
+        global lookups, dropped
+        if not self.ids:
+            return []
+        places = get_many(self.ids)
+        missing = [place_id for place_id in self.ids if place_id not in places]
+        if missing and _lookup:
+            # Fuera del caché (no venía del prefetch): completar sin reordenar la lista
+            for place_id, place in _lookup(missing).items():
+                put(place)
+                places[place_id] = _places.get(place_id, place)
+                lookups += 1
+        results = []
+        for place_id, distance, is_open in zip(self.ids, self.distances, self.open_flags):
+            base = places.get(place_id)
+            if base is None:
+                # Ni en caché ni en el catálogo: el lugar ya no existe (borrado por /sheet/sync)
+                dropped += 1
+                continue
+            place = dict(base)
+            if not math.isnan(distance):
+                place["distance_meters"] = distance
+                if distance and distance < 999999 and _distance_formatter:
+                    place["distance_text"] = _distance_formatter(distance)
+                else:
+                    place["distance_text"] = ""
+            place["is_open_now"] = bool(is_open)
+            results.append(place)
+        return results
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def to_dict(self) -> dict:
+        return {
+            "ids": list(self.ids),
+            "distances": [None if math.isnan(d) else d for d in self.distances],
+            "open": list(self.open_flags),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ResultRefs":
+        return cls(
+            array("q", data.get("ids") or []),
+            array("d", [math.nan if d is None else d for d in data.get("distances") or []]),
+            array("b", data.get("open") or []),
+        )
+
+
+def stats() -> dict:
+    return {
+        "entries": len(_places),
+        "max_entries": _max_entries,
+        "hits": hits,
+        "misses": misses,
+        "fetched": fetched,
+        "invalidations": invalidations,
+        "pinned": len(_pinned),
+        "lookups": lookups,
+        "dropped": dropped,
+    }
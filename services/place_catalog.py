@@ -0,0 +1,454 @@
+"""
+Catálogo de lugares en memoria (snapshot inmutable de public.places).
+El catálogo sólo cambia con /sheet/sync, así que en lugar de ir a la BD en cada
+mensaje las búsquedas se contestan desde un snapshot del proceso:
+
+- se carga completo en el startup y se recarga cada refresh_interval
+  (por si alguien edita la tabla por fuera del sync)
+- /sheet/sync pide recargar sólo el lugar que cambió (reload_place); los
+  pedidos que llegan dentro de reload_delay se juntan en UNA reconstrucción
+- el snapshot (índices, rejilla, horarios) se arma en un hilo (to_thread),
+  no en el event loop
+- cada recarga arma un snapshot NUEVO y lo intercambia en una sola asignación:
+  las búsquedas en curso siguen leyendo el anterior, nunca uno a medias
+- si no hay snapshot o tiene más de max_age segundos, search() regresa None
+  y el llamador usa la BD (fallback)
+
+Se inicializa desde app.py con init(loader, ...):
+- loader(ids) → corrutina que trae los lugares con esos ids, o todos si ids es None
+
+search(sql, params) recibe la MISMA sentencia canónica de services/search_sql y
+sus parámetros, y la evalúa en memoria con la misma semántica (filtros, horario
+del día, orden y límite). Los dicts regresados son compartidos: sólo lectura
+(las búsquedas de app.py ya hacen dict(row) antes de modificarlos).
+
+nearest_places(lat, lng, k, accept) usa la rejilla espacial del snapshot
+(services/spatial_index) para "lo más cercano que cumpla X" sin medir a todos;
+el radio siempre tiene tope y open_only prefiltra con los horarios del día.
+"""
+import asyncio
+import heapq
+import time
+from datetime import date, datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import pytz
+
+from services import search_sql
+from services.search_index import InvertedIndex, fold
+from services.spatial_index import GridIndex, haversine_km
+from services.metrics import LatencyWindow
+
+_DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+_DEFAULT_TZ = "America/Mexico_City"
+# Tope de nearest_places cuando no se pasa max_km: el anillo nunca recorre toda la rejilla
+NEAREST_MAX_KM = 50.0
+# Mismo TRANSLATE que search_place_by_name
+_FOLD_NAME = str.maketrans("áéíóúüñÁÉÍÓÚÜÑ", "aeiouunAEIOUUN")
+_NO_DISTANCE = 999999
+# Grupos de empate más grandes que esto se resuelven con la rejilla espacial
+_GRID_MIN_GROUP = 64
+
+
+def fold_name(name: str) -> str:
+    return (name or "").translate(_FOLD_NAME).lower()
+
+
+def _folded_items(values) -> Tuple[str, ...]:
+    return tuple(fold(v) for v in (values or ()) if v is not None)
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class _Entry:
+    """Un lugar con sus campos de búsqueda ya normalizados."""
+
+    __slots__ = ("place", "id", "is_active", "lat", "lng", "categories", "products", "category", "open_days", "cashback", "priority", "plan_activo", "plan_vence", "name", "static_rank")
+
+    def __init__(self, place: dict):
+        self.place = place
+        self.id = place["id"]
+        self.is_active = place.get("is_active") is True
+        self.lat = _to_float(place.get("lat"))
+        self.lng = _to_float(place.get("lng"))
+        # Plegados (minúsculas, sin acentos) como los indexa services/search_index
+        self.categories = _folded_items(place.get("categories"))
+        self.products = _folded_items(place.get("products"))
+        self.category = fold(place["category"]) if place.get("category") is not None else None
+        self.open_days = tuple(
+            place.get(f"{day}_open") is not None and place.get(f"{day}_close") is not None for day in _DAYS
+        )
+        self.cashback = place.get("cashback") is True
+        self.priority = place.get("priority")
+        self.plan_activo = place.get("plan_activo") is True
+        self.plan_vence = place.get("plan_fecha_vencimiento")
+        self.name = fold_name(place.get("name"))
+        self.static_rank = (
+            0 if self.cashback else 1,
+            (0, 0) if self.priority is None else (1, -self.priority),
+        )
+
+    def plan_rank(self, now: datetime) -> int:
+        """PLAN_FIRST: 0 = plan vigente, 1 = sin plan."""
+        if not self.plan_activo:
+            return 1
+        vence = self.plan_vence
+        if vence is None:
+            return 0
+        if isinstance(vence, datetime):
+            return 0 if vence > (now if vence.tzinfo else now.replace(tzinfo=None)) else 1
+        if isinstance(vence, date):
+            return 0 if vence > now.date() else 1
+        return 1
+
+    def rank(self, now: datetime) -> tuple:
+        """ORDER BY de search_sql.PLAN_FIRST (priority DESC pone los NULL primero, como Postgres)."""
+        return (1 if not self.plan_activo else self.plan_rank(now),) + self.static_rank
+
+    def distance(self, user_lat: float, user_lng: float) -> float:
+        """search_sql.DISTANCE_METERS (haversine, 999999 sin coordenadas)."""
+        if self.lat is None or self.lng is None:
+            return _NO_DISTANCE
+        return haversine_km(user_lat, user_lng, self.lat, self.lng) * 1000
+
+
+class CatalogSnapshot:
+    """Lugares (ordenados por id) en un momento dado. No se modifica: se reemplaza."""
+
+    __slots__ = ("entries", "by_id", "by_name", "index", "grid", "open_ids", "timezones", "loaded_at", "version")
+
+    def __init__(self, places: Iterable[dict], version: int):
+        self.entries: Tuple[_Entry, ...] = tuple(sorted((_Entry(p) for p in places), key=lambda e: e.id))
+        self.by_id: Dict[int, _Entry] = {e.id: e for e in self.entries}
+        self.by_name: Dict[str, _Entry] = {}
+        for entry in self.entries:
+            self.by_name.setdefault(entry.name, entry)
+        self.index = InvertedIndex(
+            (e.id, e.categories, e.products + ((e.category,) if e.category is not None else ()))
+            for e in self.entries
+        )
+        self.grid = GridIndex((e.id, e.lat, e.lng) for e in self.entries if e.lat is not None and e.lng is not None)
+        # Por día de la semana: ids con horario ese día (todos / sólo activos)
+        self.open_ids = tuple(
+            (frozenset(e.id for e in self.entries if e.open_days[day]),
+             frozenset(e.id for e in self.entries if e.open_days[day] and e.is_active))
+            for day in range(7)
+        )
+        # Zonas horarias presentes (para saber qué día de la semana es "hoy" en cada lugar)
+        self.timezones = frozenset(e.place.get("timezone") or _DEFAULT_TZ for e in self.entries)
+        self.loaded_at = time.time()
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+# ---- Evaluación en memoria de las sentencias de search_sql ----
+def _select(snapshot: CatalogSnapshot, params: dict, *, exact: bool, near: bool, scored: bool,
+            active_only: bool = True) -> List[dict]:
+    # Candidatos desde el índice invertido; luego sólo el filtro de horario/activo por id
+    if exact:
+        ids = snapshot.index.exact_any(params["terms"])
+    else:
+        ids = snapshot.index.like_any(params["patterns"])
+    open_ids = snapshot.open_ids[params["weekday"]][1 if active_only else 0]
+    found = [snapshot.by_id[i] for i in ids if i in open_ids]
+    now = datetime.now(timezone.utc)
+    limit = params["limit"]
+
+    matched = snapshot.index.like_phrases(params["patterns"]) if scored else frozenset()
+
+    def score(e: _Entry) -> int:
+        """search_sql.CATEGORY_MATCH_SCORE"""
+        return sum(1 for item in e.categories if item in matched)
+
+    # Sólo se necesitan los primeros `limit`: nsmallest en lugar de ordenar todo
+    if not near:
+        if scored:
+            top = heapq.nsmallest(limit, found, key=lambda e: (e.rank(now), -score(e), e.id))
+        else:
+            top = heapq.nsmallest(limit, found, key=lambda e: (e.rank(now), e.id))
+        return [e.place for e in top]
+
+    # Con ubicación el orden es (plan/cashback/priority[, score]) y DESPUÉS distancia: se agrupa
+    # por lo primero y la distancia sólo se mide en los grupos que entran al límite. Un grupo
+    # grande usa la rejilla (los k más cercanos del grupo) en vez de medir a todos sus lugares.
+    user_lat, user_lng = float(params["user_lat"]), float(params["user_lng"])
+    if params.get("radius_m"):
+        # search_sql.BOUNDED (SEARCH_RADIUS_KM): sólo los lugares dentro del radio
+        inside = {i for _, i in snapshot.grid.within(user_lat, user_lng, params["radius_m"] / 1000)}
+        found = [e for e in found if e.id in inside]
+    groups: Dict[tuple, List[_Entry]] = {}
+    for e in found:
+        groups.setdefault((e.rank(now), -score(e)) if scored else e.rank(now), []).append(e)
+    top: List[_Entry] = []
+    for key in sorted(groups):
+        need = limit - len(top)
+        if need <= 0:
+            break
+        members = groups[key]
+        if len(members) > need and len(members) > _GRID_MIN_GROUP:
+            member_ids = {e.id for e in members}
+            chosen = [snapshot.by_id[i] for _, i in snapshot.grid.nearest(user_lat, user_lng, need, accept=member_ids.__contains__)]
+            if len(chosen) < need:
+                # Sin coordenadas (distancia 999999): al final del grupo
+                chosen += [e for e in members if e.lat is None or e.lng is None][: need - len(chosen)]
+        else:
+            chosen = heapq.nsmallest(need, members, key=lambda e: e.distance(user_lat, user_lng))
+        top.extend(chosen)
+    rows = []
+    for e in top:
+        row = dict(e.place)
+        row["distance_meters"] = e.distance(user_lat, user_lng)
+        if scored:
+            row["product_match_score"] = score(e)
+        rows.append(row)
+    return rows
+
+
+# sentencia canónica → evaluador en memoria
+_EVALUATORS: Dict[str, Callable[[CatalogSnapshot, dict], List[dict]]] = {
+    search_sql.EXACT_IN_CATEGORIES: lambda s, p: _select(s, p, exact=True, near=False, scored=False),
+    search_sql.BROAD: lambda s, p: _select(s, p, exact=False, near=False, scored=False),
+    search_sql.EXPANDED: lambda s, p: _select(s, p, exact=False, near=False, scored=True),
+    search_sql.EXACT_IN_CATEGORIES_NEAR: lambda s, p: _select(s, p, exact=True, near=True, scored=False),
+    search_sql.BROAD_NEAR: lambda s, p: _select(s, p, exact=False, near=True, scored=False),
+    # EXPANDED_NEAR no filtra is_active (igual que la sentencia SQL)
+    search_sql.EXPANDED_NEAR: lambda s, p: _select(s, p, exact=False, near=True, scored=True, active_only=False),
+}
+
+
+# ---- Estado del módulo ----
+_snapshot: Optional[CatalogSnapshot] = None
+_loader: Optional[Callable[[Optional[List[int]]], Awaitable[List[dict]]]] = None
+_max_age = 1800.0
+_refresh_interval = 300.0
+_lock: Optional[asyncio.Lock] = None
+_reload_delay = 1.0
+_pending_reloads: Set[int] = set()
+_reload_task: Optional[asyncio.Task] = None
+
+hits = 0
+fallbacks = 0
+refreshes = 0
+reloads = 0
+reloaded_places = 0
+errors = 0
+last_refresh_ms = 0.0
+_latency = LatencyWindow(size=1000)
+
+
+def init(loader: Callable[[Optional[List[int]]], Awaitable[List[dict]]], max_age: float = 1800.0,
+         refresh_interval: float = 300.0, reload_delay: float = 1.0):
+    global _loader, _max_age, _refresh_interval, _reload_delay
+    _loader = loader
+    _max_age = max_age
+    _refresh_interval = refresh_interval
+    _reload_delay = reload_delay
+
+
+def _get_lock() -> asyncio.Lock:
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    return _lock
+
+
+def current() -> Optional[CatalogSnapshot]:
+    """Snapshot vigente, o None si no hay o ya está viejo (→ usar la BD)."""
+    snapshot = _snapshot
+    if snapshot is None or time.time() - snapshot.loaded_at > _max_age:
+        return None
+    return snapshot
+
+
+async def refresh() -> bool:
+    """Recarga el catálogo completo y lo intercambia. Si falla, se queda el anterior."""
+    global _snapshot, refreshes, errors, last_refresh_ms
+    if not _loader:
+        return False
+    async with _get_lock():
+        started = time.perf_counter()
+        try:
+            places = await _loader(None)
+        except Exception as e:
+            errors += 1
+            print(f"[CATALOG] ⚠️ Error cargando catálogo: {e}")
+            return False
+        version = _snapshot.version + 1 if _snapshot else 1
+        _snapshot = await asyncio.to_thread(CatalogSnapshot, places, version)
+        refreshes += 1
+        last_refresh_ms = (time.perf_counter() - started) * 1000
+    print(f"[CATALOG] ✅ {len(_snapshot)} lugares en memoria (v{version}, {last_refresh_ms:.0f}ms)")
+    return True
+
+
+def reload_place(place_id: int) -> bool:
+    """
+    Programa la recarga de un lugar (tras /sheet/sync) sin esperarla. Los lugares
+    pedidos dentro de reload_delay se recargan juntos: un sync de N filas arma un
+    solo snapshot nuevo, no N.
+    """
+    global _reload_task
+    if not _loader or _snapshot is None:
+        return False
+    _pending_reloads.add(place_id)
+    if _reload_task is None or _reload_task.done():
+        _reload_task = asyncio.create_task(_reload_pending(), name="place-catalog-reload")
+    return True
+
+
+def cancel_reloads():
+    """Cancela las recargas pendientes (shutdown); la próxima carga completa las cubre."""
+    _pending_reloads.clear()
+    if _reload_task is not None:
+        _reload_task.cancel()
+
+
+async def _reload_pending():
+    global _snapshot, reloads, reloaded_places, errors
+    # Mientras sigan llegando pedidos (también los que llegan durante una reconstrucción)
+    while _pending_reloads:
+        await asyncio.sleep(_reload_delay)
+        async with _get_lock():
+            ids = set(_pending_reloads)
+            _pending_reloads.clear()
+            base = _snapshot
+            if not ids or base is None:
+                continue
+            try:
+                rows = await _loader(sorted(ids))
+            except Exception as e:
+                errors += 1
+                print(f"[CATALOG] ⚠️ Error recargando {len(ids)} lugar(es): {e}")
+                continue
+            # Los ids sin fila ya no existen: salen del snapshot
+            places = [e.place for e in base.entries if e.id not in ids] + list(rows)
+            snapshot = await asyncio.to_thread(CatalogSnapshot, places, base.version + 1)
+            # La edad del snapshot es la de la última carga completa
+            snapshot.loaded_at = base.loaded_at
+            _snapshot = snapshot
+            reloads += 1
+            reloaded_places += len(ids)
+
+
+async def run():
+    """Carga inicial y recarga periódica (corre como tarea de fondo desde el startup)."""
+    while True:
+        await refresh()
+        await asyncio.sleep(_refresh_interval)
+
+
+def search(sql: str, params: dict) -> Optional[List[dict]]:
+    """Evalúa una sentencia de search_sql en memoria; None = no se puede (usar la BD)."""
+    global hits, fallbacks
+    evaluator = _EVALUATORS.get(sql)
+    snapshot = current()
+    if evaluator is None or snapshot is None:
+        fallbacks += 1
+        return None
+    started = time.perf_counter()
+    rows = evaluator(snapshot, params)
+    _latency.observe((time.perf_counter() - started) * 1000)
+    hits += 1
+    return rows
+
+
+def _open_candidates(snapshot: CatalogSnapshot) -> frozenset:
+    """
+    Ids con horario hoy o ayer (en la zona de cada lugar): superconjunto de los
+    que pueden estar abiertos ahora (is_open_now_by_day revisa ayer antes de las 6 AM).
+    """
+    now = datetime.now(timezone.utc)
+    days = set()
+    for tz_name in snapshot.timezones:
+        try:
+            tz = pytz.timezone(tz_name)
+        except Exception:
+            tz = pytz.timezone(_DEFAULT_TZ)
+        weekday = now.astimezone(tz).weekday()
+        days.add(weekday)
+        days.add((weekday - 1) % 7)
+    if len(days) == 1:
+        return snapshot.open_ids[days.pop()][0]
+    return frozenset().union(*(snapshot.open_ids[day][0] for day in days))
+
+
+def nearest_places(lat: float, lng: float, k: int, accept: Optional[Callable[[dict], bool]] = None,
+                   max_km: float = 0.0, open_only: bool = False) -> Optional[List[dict]]:
+    """
+    Los k lugares con coordenadas más cercanos (copias con distance_km), sólo los que
+    cumplen accept(lugar): el radio crece hasta juntar k o llegar a max_km (0 = NEAREST_MAX_KM,
+    siempre hay tope). open_only=True descarta antes de llamar accept los lugares sin
+    horario hoy/ayer (open_ids del snapshot), así de noche no se evalúa todo el catálogo.
+    None = sin snapshot (usar la BD).
+    """
+    snapshot = current()
+    if snapshot is None:
+        return None
+    by_id = snapshot.by_id
+    if open_only:
+        candidates = _open_candidates(snapshot)
+        if accept:
+            test = lambda place_id: place_id in candidates and accept(by_id[place_id].place)
+        else:
+            test = candidates.__contains__
+    else:
+        test = (lambda place_id: accept(by_id[place_id].place)) if accept else None
+    rows = []
+    cap = max_km if max_km > 0 else NEAREST_MAX_KM
+    for km, place_id in snapshot.grid.nearest(lat, lng, k, accept=test, max_km=cap):
+        row = dict(by_id[place_id].place)
+        row["distance_km"] = km
+        rows.append(row)
+    return rows
+
+
+def find_by_name(name: str) -> Tuple[bool, Optional[dict]]:
+    """Lugar cuyo nombre coincide exacto (sin mayúsculas/acentos). (False, None) = sin snapshot."""
+    snapshot = current()
+    if snapshot is None:
+        return False, None
+    entry = snapshot.by_name.get(fold_name(name.strip()))
+    return True, entry.place if entry else None
+
+
+def get_many(ids: Iterable[int]) -> Dict[int, dict]:
+    """Lugares por id desde el snapshot (los que no estén se omiten)."""
+    snapshot = current()
+    if snapshot is None:
+        return {}
+    found = {}
+    for place_id in ids:
+        entry = snapshot.by_id.get(place_id)
+        if entry is not None:
+            found[place_id] = entry.place
+    return found
+
+
+def stats() -> dict:
+    snapshot = _snapshot
+    return {
+        "loaded": snapshot is not None,
+        "fresh": current() is not None,
+        "places": len(snapshot) if snapshot else 0,
+        "version": snapshot.version if snapshot else 0,
+        "age_s": round(time.time() - snapshot.loaded_at, 1) if snapshot else None,
+        "max_age_s": _max_age,
+        "hits": hits,
+        "fallbacks": fallbacks,
+        "refreshes": refreshes,
+        "reloads": reloads,
+        "reloaded_places": reloaded_places,
+        "pending_reloads": len(_pending_reloads),
+        "errors": errors,
+        "last_refresh_ms": round(last_refresh_ms, 1),
+        "index": snapshot.index.stats() if snapshot else None,
+        "grid": {"points": snapshot.grid.size, "cells": len(snapshot.grid.cells)} if snapshot else None,
+        "search_latency": _latency.snapshot(),
+    }
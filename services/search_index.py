@@ -0,0 +1,131 @@
+"""
+Índice invertido sobre categories / products / category de los lugares.
+Lo arma cada snapshot de services/place_catalog para que los PASOS 2 y 3 sean
+búsquedas en diccionario en lugar de recorrer todos los lugares:
+
+- exacto:    frase de categories → ids (EXACT_CATEGORY_MATCH, `= ANY(terms)`)
+- substring: LIKE '%x%' → trigramas de x → frases del vocabulario que contienen x → ids
+             (intersección de postings de trigramas; sólo se verifica `x in frase`
+             sobre los candidatos)
+- prefijo:   LIKE 'x%' → bisect sobre el vocabulario ordenado → ids
+
+Todo se indexa y consulta plegado con fold(): minúsculas y sin acentos, así
+"cafe" encuentra "Café" (las variaciones singular/plural ya vienen de
+normalize_search_term). Las postings son tuplas de ids ordenadas.
+
+fold() es la ÚNICA definición del plegado: LOWER + una tabla fija de acentos
+(FOLD_FROM → FOLD_TO) que el SQL aplica igual con TRANSLATE(LOWER(...))
+(services/search_sql y las funciones de services/search_schema). Así el
+catálogo en memoria y la BD, con o sin migración, encuentran lo mismo.
+"""
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+
+# Acentos del español (minúsculas y mayúsculas, como en el TRANSLATE del SQL)
+FOLD_FROM = "áàâäãéèêëíìîïóòôöõúùûüñçÁÀÂÄÃÉÈÊËÍÌÎÏÓÒÔÖÕÚÙÛÜÑÇ"
+FOLD_TO = "aaaaaeeeeiiiiooooouuuuncaaaaaeeeeiiiiooooouuuunc"
+_FOLD_TABLE = str.maketrans(FOLD_FROM, FOLD_TO)
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin acentos/diéresis/tilde de la ñ ("Café Olé" → "cafe ole"); = TRANSLATE(LOWER(t), ...)."""
+    return str(text).lower().translate(_FOLD_TABLE)
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class InvertedIndex:
+    """Índice inmutable; se construye una vez por snapshot del catálogo."""
+
+    def __init__(self, docs: Iterable[Tuple[int, Sequence[str], Sequence[str]]]):
+        """docs: (place_id, frases de categories, otras frases: products + category), ya plegadas."""
+        exact: Dict[str, Set[int]] = {}
+        phrases: Dict[str, Set[int]] = {}
+        for place_id, categories, others in docs:
+            for phrase in categories:
+                exact.setdefault(phrase, set()).add(place_id)
+                phrases.setdefault(phrase, set()).add(place_id)
+            for phrase in others:
+                phrases.setdefault(phrase, set()).add(place_id)
+
+        self.exact: Dict[str, Tuple[int, ...]] = {k: tuple(sorted(v)) for k, v in exact.items()}
+        # Vocabulario ordenado (para prefijos) con sus postings en paralelo
+        self.vocab: List[str] = sorted(phrases)
+        self.postings: List[Tuple[int, ...]] = [tuple(sorted(phrases[p])) for p in self.vocab]
+        grams: Dict[str, List[int]] = {}
+        for idx, phrase in enumerate(self.vocab):
+            for gram in _trigrams(phrase):
+                grams.setdefault(gram, []).append(idx)
+        self.trigrams: Dict[str, Tuple[int, ...]] = {k: tuple(v) for k, v in grams.items()}
+
+    # ---- Consultas sobre el vocabulario (regresan índices de frases) ----
+    def _substring_phrases(self, sub: str) -> List[int]:
+        if len(sub) < 3:
+            return [i for i, phrase in enumerate(self.vocab) if sub in phrase]
+        lists = []
+        for gram in _trigrams(sub):
+            posting = self.trigrams.get(gram)
+            if not posting:
+                return []
+            lists.append(posting)
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        return [i for i in candidates if sub in self.vocab[i]]
+
+    def _prefix_phrases(self, prefix: str) -> List[int]:
+        found = []
+        i = bisect_left(self.vocab, prefix)
+        while i < len(self.vocab) and self.vocab[i].startswith(prefix):
+            found.append(i)
+            i += 1
+        return found
+
+    def _like_phrases(self, pattern: str) -> List[int]:
+        """LIKE de Postgres sobre el vocabulario ('%' = cualquier cosa, '_' = un carácter)."""
+        body = pattern.strip("%")
+        if "%" not in body and "_" not in body:
+            starts, ends = pattern.startswith("%"), pattern.endswith("%")
+            if starts and ends:
+                return self._substring_phrases(body)
+            if ends and body:
+                return self._prefix_phrases(body)
+            if not starts and not ends:
+                return [i for i in [bisect_left(self.vocab, body)] if i < len(self.vocab) and self.vocab[i] == body]
+        regex = re.compile("".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern), re.DOTALL)
+        return [i for i, phrase in enumerate(self.vocab) if regex.fullmatch(phrase)]
+
+    # ---- Consultas por lugar (regresan ids) ----
+    def exact_any(self, terms: Iterable[str]) -> Set[int]:
+        """Lugares con alguna frase de categories igual a algún término."""
+        ids: Set[int] = set()
+        for term in terms:
+            ids.update(self.exact.get(fold(term), ()))
+        return ids
+
+    def like_phrases(self, patterns: Iterable[str]) -> Set[str]:
+        """Frases del vocabulario que cumplen algún patrón LIKE."""
+        return {self.vocab[i] for pattern in patterns for i in self._like_phrases(fold(pattern))}
+
+    def like_any(self, patterns: Iterable[str]) -> Set[int]:
+        """Lugares con alguna frase (categories, products o category) que cumple algún patrón LIKE."""
+        ids: Set[int] = set()
+        for pattern in patterns:
+            for i in self._like_phrases(fold(pattern)):
+                ids.update(self.postings[i])
+        return ids
+
+    def stats(self) -> dict:
+        return {
+            "phrases": len(self.vocab),
+            "category_phrases": len(self.exact),
+            "trigrams": len(self.trigrams),
+            "postings": sum(len(p) for p in self.postings),
+        }
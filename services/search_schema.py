@@ -0,0 +1,107 @@
+"""
+Columnas e índices de búsqueda en public.places (para cuando la búsqueda va a la BD).
+Las sentencias de services/search_sql desanidan el JSONB de categories/products
+en cada fila (full scan). Esta migración agrega columnas GENERADAS ya plegadas
+(minúsculas, sin acentos) con índices GIN, y search_sql.INDEXED las usa:
+
+- search_categories text[]: categories plegadas → GIN (array_ops) para `&&`
+  (EXACT_CATEGORY_MATCH)
+- search_text text: categories + products + category plegadas, una frase por
+  línea → GIN pg_trgm para `LIKE ANY('%x%')` (BROAD_MATCH); el salto de línea
+  no aparece en los patrones, así que un '%x%' sólo coincide dentro de una frase
+- índice btree (lat, lng): rectángulo de search_sql.BOUNDED cuando hay radio de
+  búsqueda (SEARCH_RADIUS_KM); no depende de las columnas generadas
+
+Generar la columna exige funciones IMMUTABLE: se pliega con TRANSLATE(LOWER())
+(unaccent() es STABLE). Todo es idempotente (IF NOT EXISTS / OR REPLACE).
+
+Se aplica en el startup con SEARCH_DB_INDEXES=migrate, o desde
+benchmarks/explain_search_indexes.py sobre una tabla sintética.
+"""
+from typing import List
+
+# Mismo plegado que services/search_index.fold (la tabla se define sólo ahí)
+from services.search_index import FOLD_FROM, FOLD_TO
+
+FUNCTIONS_SQL = f"""
+CREATE OR REPLACE FUNCTION public.search_fold(t text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT translate(lower(t), '{FOLD_FROM}', '{FOLD_TO}')
+$$;
+
+CREATE OR REPLACE FUNCTION public.search_fold_array(j jsonb) RETURNS text[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT COALESCE(array_agg(public.search_fold(item)), '{{}}')
+    FROM jsonb_array_elements_text(CASE WHEN jsonb_typeof(j) = 'array' THEN j ELSE '[]'::jsonb END) AS item
+$$;
+
+CREATE OR REPLACE FUNCTION public.search_fold_text(categories jsonb, products jsonb, category text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT array_to_string(
+        public.search_fold_array(categories) || public.search_fold_array(products)
+            || COALESCE(public.search_fold(category), ''),
+        E'\\n'
+    )
+$$;
+"""
+
+
+def migration_sql(table: str = "public.places") -> List[str]:
+    """Sentencias de la migración (en orden) para `table`."""
+    name = table.split(".")[-1]
+    return [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+        FUNCTIONS_SQL,
+        f"""ALTER TABLE {table}
+            ADD COLUMN IF NOT EXISTS search_categories text[]
+                GENERATED ALWAYS AS (public.search_fold_array(categories)) STORED;""",
+        f"""ALTER TABLE {table}
+            ADD COLUMN IF NOT EXISTS search_text text
+                GENERATED ALWAYS AS (public.search_fold_text(categories, products, category)) STORED;""",
+        f"CREATE INDEX IF NOT EXISTS {name}_search_categories_gin ON {table} USING gin (search_categories);",
+        f"CREATE INDEX IF NOT EXISTS {name}_search_text_trgm ON {table} USING gin (search_text gin_trgm_ops);",
+        f"CREATE INDEX IF NOT EXISTS {name}_lat_lng ON {table} (lat, lng) WHERE lat IS NOT NULL AND lng IS NOT NULL;",
+        f"ANALYZE {table};",
+    ]
+
+
+COLUMNS_EXIST_SQL = """
+SELECT COUNT(*) = 2 AS ready
+FROM information_schema.columns
+WHERE table_schema = %s AND table_name = %s
+  AND column_name IN ('search_categories', 'search_text');
+"""
+
+
+async def migrate(pool, table: str = "public.places"):
+    async with pool.connection() as conn, conn.cursor() as cur:
+        for statement in migration_sql(table):
+            await cur.execute(statement)
+
+
+async def columns_ready(pool, table: str = "public.places") -> bool:
+    schema, name = table.split(".") if "." in table else ("public", table)
+    async with pool.connection() as conn, conn.cursor() as cur:
+        await cur.execute(COLUMNS_EXIST_SQL, (schema, name))
+        row = await cur.fetchone()
+    return bool(row and row[0])
+
+
+async def ensure(pool, mode: str = "use") -> bool:
+    """
+    mode: "off" (no usar), "use" (usar si la migración ya está aplicada),
+    "migrate" (aplicarla si falta). Retorna si las sentencias INDEXED se pueden usar.
+    """
+    if mode == "off":
+        return False
+    try:
+        if mode == "migrate":
+            await migrate(pool)
+            print("[SEARCH-SCHEMA] ✅ Columnas e índices de búsqueda en places listos")
+        ready = await columns_ready(pool)
+    except Exception as e:
+        print(f"[SEARCH-SCHEMA] ⚠️ No se pudo preparar/verificar los índices de búsqueda: {e}")
+        return False
+    if not ready:
+        print("[SEARCH-SCHEMA] ⚠️ places sin columnas de búsqueda (SEARCH_DB_INDEXES=migrate para crearlas)")
+    return ready
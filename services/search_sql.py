@@ -0,0 +1,272 @@
+"""
+SQL canónico de las búsquedas de lugares.
+Cada consulta tiene un texto FIJO: las variaciones del término van como un
+solo parámetro array (`= ANY(%(terms)s)`, `LIKE ANY(%(patterns)s)`) y el día
+de la semana como parámetro, en lugar de armar N condiciones OR o columnas
+del día con f-strings. Así el servidor ve siempre la misma sentencia y psycopg
+la prepara (prepare_threshold) y reutiliza su plan en cada conexión del pool.
+
+Parámetros (con nombre):
+- terms:     variaciones exactas (normalize_search_term), plegadas con fold_params()
+- patterns:  patrones LIKE ("%taco%"), plegados con fold_params()
+- weekday:   día de hoy en CDMX, 0=lunes … 6=domingo (today_weekday())
+- user_lat / user_lng: ubicación del usuario (consultas con distancia)
+- min_lat / max_lat / min_lng / max_lng / radius_m: radio de búsqueda (sólo las
+  sentencias BOUNDED, ver radius_params())
+- limit
+"""
+import math
+from datetime import datetime
+from typing import List
+
+import pytz
+
+from services.search_index import FOLD_FROM, FOLD_TO, fold
+
+_CDMX = pytz.timezone("America/Mexico_City")
+
+PLACE_COLUMNS = """id, name, category, products, categories, priority, cashback, hours,
+               address, phone, url_order, imagen_url, url_extra, afiliado,
+               lat, lng, timezone, delivery,
+               mon_open, mon_close, tue_open, tue_close, wed_open, wed_close,
+               thu_open, thu_close, fri_open, fri_close, sat_open, sat_close,
+               sun_open, sun_close"""
+
+# Lugares con horario registrado HOY (el día es parámetro: mismo texto toda la semana)
+TODAY_HOURS = """CASE %(weekday)s
+            WHEN 0 THEN mon_open IS NOT NULL AND mon_close IS NOT NULL
+            WHEN 1 THEN tue_open IS NOT NULL AND tue_close IS NOT NULL
+            WHEN 2 THEN wed_open IS NOT NULL AND wed_close IS NOT NULL
+            WHEN 3 THEN thu_open IS NOT NULL AND thu_close IS NOT NULL
+            WHEN 4 THEN fri_open IS NOT NULL AND fri_close IS NOT NULL
+            WHEN 5 THEN sat_open IS NOT NULL AND sat_close IS NOT NULL
+            ELSE sun_open IS NOT NULL AND sun_close IS NOT NULL
+        END"""
+
+DISTANCE_METERS = """CASE
+                       WHEN lat IS NOT NULL AND lng IS NOT NULL THEN
+                           6371000 * 2 * ASIN(SQRT(
+                               POWER(SIN(RADIANS((lat - %(user_lat)s) / 2)), 2) +
+                               COS(RADIANS(%(user_lat)s)) * COS(RADIANS(lat)) *
+                               POWER(SIN(RADIANS((lng - %(user_lng)s) / 2)), 2)
+                           ))
+                       ELSE 999999
+                   END"""
+
+PLAN_FIRST = """CASE WHEN (plan_activo = true AND (plan_fecha_vencimiento IS NULL OR plan_fecha_vencimiento > NOW())) THEN 0 ELSE 1 END ASC,
+            CASE WHEN cashback = true THEN 1 ELSE 0 END DESC,
+            priority DESC"""
+
+
+def _fold(expr: str) -> str:
+    """Plegado en SQL: el mismo de search_index.fold (minúsculas y sin acentos)."""
+    return f"TRANSLATE(LOWER({expr}), '{FOLD_FROM}', '{FOLD_TO}')"
+
+
+EXACT_CATEGORY_MATCH = f"""EXISTS (
+            SELECT 1 FROM jsonb_array_elements_text(categories) as item
+            WHERE {_fold('item')} = ANY(%(terms)s)
+        )"""
+
+BROAD_MATCH = f"""(
+            EXISTS (
+                SELECT 1 FROM jsonb_array_elements_text(categories) as item
+                WHERE {_fold('item')} LIKE ANY(%(patterns)s)
+            )
+            OR EXISTS (
+                SELECT 1 FROM jsonb_array_elements_text(products) as item
+                WHERE {_fold('item')} LIKE ANY(%(patterns)s)
+            )
+            OR {_fold('category')} LIKE ANY(%(patterns)s)
+        )"""
+
+CATEGORY_MATCH_SCORE = f"""(SELECT COUNT(*) FROM jsonb_array_elements_text(categories) as item
+             WHERE {_fold('item')} LIKE ANY(%(patterns)s))"""
+
+
+# ---- Sin ubicación ----
+EXACT_IN_CATEGORIES = f"""
+        SELECT {PLACE_COLUMNS}
+        FROM public.places
+        WHERE is_active = TRUE
+        AND {EXACT_CATEGORY_MATCH}
+        AND {TODAY_HOURS}
+        ORDER BY
+            {PLAN_FIRST},
+            id ASC
+        LIMIT %(limit)s;
+"""
+
+BROAD = f"""
+        SELECT {PLACE_COLUMNS}
+        FROM public.places
+        WHERE is_active = TRUE
+        AND {BROAD_MATCH}
+        AND {TODAY_HOURS}
+        ORDER BY
+            {PLAN_FIRST},
+            id ASC
+        LIMIT %(limit)s;
+"""
+
+EXPANDED = f"""
+        SELECT {PLACE_COLUMNS}
+        FROM public.places
+        WHERE is_active = TRUE
+        AND {BROAD_MATCH}
+        AND {TODAY_HOURS}
+        ORDER BY
+            {PLAN_FIRST},
+            {CATEGORY_MATCH_SCORE} DESC,
+            id ASC
+        LIMIT %(limit)s;
+"""
+
+# ---- Con ubicación ----
+EXACT_IN_CATEGORIES_NEAR = f"""
+        WITH distances AS (
+            SELECT {PLACE_COLUMNS},
+                   plan_activo, plan_fecha_vencimiento,
+                   {DISTANCE_METERS} as distance_meters
+            FROM public.places
+            WHERE is_active = TRUE
+            AND {EXACT_CATEGORY_MATCH}
+            AND {TODAY_HOURS}
+        )
+        SELECT * FROM distances
+        ORDER BY
+            {PLAN_FIRST},
+            distance_meters ASC
+        LIMIT %(limit)s;
+"""
+
+BROAD_NEAR = f"""
+        WITH distances AS (
+            SELECT {PLACE_COLUMNS},
+                   plan_activo, plan_fecha_vencimiento,
+                   {DISTANCE_METERS} as distance_meters
+            FROM public.places
+            WHERE is_active = TRUE
+            AND {BROAD_MATCH}
+            AND {TODAY_HOURS}
+        )
+        SELECT * FROM distances
+        ORDER BY
+            {PLAN_FIRST},
+            distance_meters ASC
+        LIMIT %(limit)s;
+"""
+
+EXPANDED_NEAR = f"""
+        WITH distances AS (
+            SELECT {PLACE_COLUMNS},
+                   plan_activo, plan_fecha_vencimiento,
+                   {DISTANCE_METERS} as distance_meters,
+                   {CATEGORY_MATCH_SCORE} as product_match_score
+            FROM public.places
+            WHERE {BROAD_MATCH}
+            AND {TODAY_HOURS}
+        )
+        SELECT * FROM distances
+        ORDER BY
+            {PLAN_FIRST},
+            product_match_score DESC,
+            distance_meters ASC
+        LIMIT %(limit)s;
+"""
+
+# ---- Catálogo en memoria (services/place_catalog) ----
+# Todos los lugares (también inactivos: la búsqueda por nombre y EXPANDED_NEAR no filtran is_active)
+CATALOG_ALL = f"""
+        SELECT {PLACE_COLUMNS},
+               is_active, plan_activo, plan_fecha_vencimiento
+        FROM public.places
+        ORDER BY id;
+"""
+
+CATALOG_BY_IDS = f"""
+        SELECT {PLACE_COLUMNS},
+               is_active, plan_activo, plan_fecha_vencimiento
+        FROM public.places
+        WHERE id = ANY(%(ids)s);
+"""
+
+
+# ---- Con índices (services/search_schema) ----
+# Mismas sentencias sobre las columnas generadas search_categories / search_text
+# (GIN, ya plegadas): mismo orden y filtros, sin desanidar el JSONB por fila.
+INDEXED_EXACT_CATEGORY_MATCH = "search_categories && %(terms)s::text[]"
+INDEXED_BROAD_MATCH = "search_text LIKE ANY(%(patterns)s)"
+INDEXED_CATEGORY_MATCH_SCORE = """(SELECT COUNT(*) FROM unnest(search_categories) as item
+             WHERE item LIKE ANY(%(patterns)s))"""
+
+
+def _indexed(sql: str) -> str:
+    return (
+        sql.replace(EXACT_CATEGORY_MATCH, INDEXED_EXACT_CATEGORY_MATCH)
+        .replace(BROAD_MATCH, INDEXED_BROAD_MATCH)
+        .replace(CATEGORY_MATCH_SCORE, INDEXED_CATEGORY_MATCH_SCORE)
+    )
+
+
+# sentencia canónica → su versión con índices
+INDEXED = {
+    sql: _indexed(sql)
+    for sql in (EXACT_IN_CATEGORIES, BROAD, EXPANDED, EXACT_IN_CATEGORIES_NEAR, BROAD_NEAR, EXPANDED_NEAR)
+}
+
+
+def fold_params(params: dict) -> dict:
+    """Términos y patrones plegados (fold), como los compara cualquier sentencia de búsqueda."""
+    folded = dict(params)
+    for key in ("terms", "patterns"):
+        if key in folded:
+            folded[key] = [fold(v) for v in folded[key]]
+    return folded
+
+
+# ---- Radio de búsqueda (SEARCH_RADIUS_KM) ----
+# Las sentencias con ubicación calculan la distancia de TODOS los lugares que
+# pasan el filtro. Con radio, el CTE primero filtra por un rectángulo lat/lng
+# (índice btree de search_schema) y afuera se corta al círculo exacto.
+GEO_BOX = """lat BETWEEN %(min_lat)s AND %(max_lat)s
+            AND lng BETWEEN %(min_lng)s AND %(max_lng)s"""
+_NEAR_WHERE = "FROM public.places\n            WHERE "
+_NEAR_OUTER = "SELECT * FROM distances\n"
+_KM_PER_DEG = math.pi * 6371 / 180
+NEAR = (EXACT_IN_CATEGORIES_NEAR, BROAD_NEAR, EXPANDED_NEAR)
+
+
+def _bounded(sql: str) -> str:
+    return (
+        sql.replace(_NEAR_WHERE, f"{_NEAR_WHERE}{GEO_BOX}\n            AND ")
+        .replace(_NEAR_OUTER, f"{_NEAR_OUTER}        WHERE distance_meters <= %(radius_m)s\n")
+    )
+
+
+# sentencia con ubicación (canónica o INDEXED) → su versión con radio
+BOUNDED = {sql: _bounded(sql) for sql in NEAR + tuple(INDEXED[sql] for sql in NEAR)}
+
+
+def radius_params(params: dict, radius_km: float) -> dict:
+    """Parámetros de las sentencias BOUNDED: rectángulo que contiene el círculo de radius_km."""
+    lat, lng = float(params["user_lat"]), float(params["user_lng"])
+    d_lat = radius_km / _KM_PER_DEG
+    # Un grado de longitud mide menos lejos del ecuador: usar el borde más alejado
+    far_lat = min(89.9, abs(lat) + d_lat)
+    d_lng = min(180.0, d_lat / math.cos(math.radians(far_lat)))
+    return {
+        **params,
+        "min_lat": lat - d_lat, "max_lat": lat + d_lat,
+        "min_lng": lng - d_lng, "max_lng": lng + d_lng,
+        "radius_m": radius_km * 1000,
+    }
+
+
+def today_weekday() -> int:
+    """Día de hoy en CDMX (0=lunes, 6=domingo), parámetro `weekday` de TODAY_HOURS."""
+    return datetime.now(_CDMX).weekday()
+
+
+def like_patterns(terms: List[str]) -> List[str]:
+    return [f"%{term}%" for term in terms]
@@ -0,0 +1,186 @@
+"""
+Sesión de usuario compacta.
+Dataclass con __slots__ y campos tipados en lugar de un dict libre por usuario.
+Los resultados de búsqueda se guardan como ids + distancias (ResultRefs) y los
+datos del lugar se resuelven desde el caché compartido (services/place_cache).
+
+Conserva el acceso tipo dict (session["last_search"], session.get("name"))
+para que los handlers existentes no cambien.
+"""
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field, fields
+from typing import Any, Optional
+
+from services.place_cache import ResultRefs
+
+
+def _refs_size(refs: Optional[ResultRefs]) -> int:
+    if refs is None:
+        return 0
+    return sys.getsizeof(refs) + sys.getsizeof(refs.ids) + sys.getsizeof(refs.distances) + sys.getsizeof(refs.open_flags)
+
+
+class _MappingAccess:
+    """session["campo"] / session.get("campo") / session["campo"] = valor sobre atributos."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key: str):
+        if key not in self._keys:
+            raise KeyError(key)
+        return self._read(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in self._keys:
+            raise KeyError(key)
+        self._write(key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def get(self, key: str, default: Any = None):
+        return self._read(key) if key in self._keys else default
+
+    def _read(self, key: str):
+        return getattr(self, key)
+
+    def _write(self, key: str, value: Any):
+        setattr(self, key, value)
+
+
+@dataclass(slots=True)
+class LastSearch(_MappingAccess):
+    craving: Optional[str] = None
+    needs_location: bool = False
+    results: Optional[ResultRefs] = None     # "all_results" (None = la búsqueda no guardó resultados)
+    shown_count: int = 0
+    timestamp: Optional[float] = None
+
+    _keys = frozenset({"craving", "needs_location", "all_results", "shown_count", "timestamp"})
+
+    def __getitem__(self, key: str):
+        if key == "all_results" and self.results is None:
+            raise KeyError(key)
+        return _MappingAccess.__getitem__(self, key)
+
+    def get(self, key: str, default: Any = None):
+        # Igual que el dict original: sin resultados guardados, "all_results" no existe
+        if key == "all_results" and self.results is None:
+            return default
+        return _MappingAccess.get(self, key, default)
+
+    def _read(self, key: str):
+        if key == "all_results":
+            return self.results.resolve()
+        return getattr(self, key)
+
+    def _write(self, key: str, value: Any):
+        if key == "all_results":
+            self.results = ResultRefs.from_places(value) if value is not None else None
+        else:
+            setattr(self, key, value)
+
+    @classmethod
+    def from_value(cls, value) -> Optional["LastSearch"]:
+        """Acepta un LastSearch, un dict (como lo arma handle_text_message) o None."""
+        if value is None or isinstance(value, LastSearch):
+            return value
+        search = cls()
+        for key, item in value.items():
+            if key in cls._keys:
+                search._write(key, item)
+        return search
+
+    def to_dict(self) -> dict:
+        return {
+            "craving": self.craving,
+            "needs_location": self.needs_location,
+            "results": self.results.to_dict() if self.results is not None else None,
+            "shown_count": self.shown_count,
+            "timestamp": self.timestamp,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LastSearch":
+        results = data.get("results")
+        return cls(
+            craving=data.get("craving"),
+            needs_location=data.get("needs_location", False),
+            results=ResultRefs.from_dict(results) if results is not None else None,
+            shown_count=data.get("shown_count", 0),
+            timestamp=data.get("timestamp"),
+        )
+
+
+@dataclass(slots=True)
+class Session(_MappingAccess):
+    name: str
+    session_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    language: str = "es"
+    last_seen: float = field(default_factory=time.time)
+    session_start: float = field(default_factory=time.time)
+    is_new: bool = True
+    last_search: Optional[LastSearch] = None
+    results: ResultRefs = field(default_factory=ResultRefs)     # "last_results"
+    user_location: Optional[dict] = None                        # {"lat": float, "lng": float}
+    goodbye_sent: bool = False
+    message_count: int = 0
+    search_count: int = 0
+    shown_count: int = 0
+    clicked_link: bool = False
+
+    _keys = frozenset({
+        "name", "session_id", "language", "last_seen", "session_start", "is_new", "last_search",
+        "last_results", "user_location", "goodbye_sent", "message_count", "search_count",
+        "shown_count", "clicked_link",
+    })
+
+    def _read(self, key: str):
+        if key == "last_results":
+            return self.results.resolve()
+        return getattr(self, key)
+
+    def _write(self, key: str, value: Any):
+        if key == "last_results":
+            self.results = ResultRefs.from_places(value or [])
+        elif key == "last_search":
+            self.last_search = LastSearch.from_value(value)
+        else:
+            setattr(self, key, value)
+
+    def result_ids(self) -> list:
+        """Ids de lugares referenciados por la sesión (para place_cache.prefetch)."""
+        ids = list(self.results.ids)
+        if self.last_search is not None and self.last_search.results is not None:
+            ids.extend(self.last_search.results.ids)
+        return ids
+
+    def approx_size(self) -> int:
+        """Bytes aproximados de la sesión (sin contar los lugares del caché compartido)."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.name) + sys.getsizeof(self.session_id)
+        size += _refs_size(self.results)
+        if self.last_search is not None:
+            size += sys.getsizeof(self.last_search) + sys.getsizeof(self.last_search.craving)
+            size += _refs_size(self.last_search.results)
+        if self.user_location is not None:
+            size += sys.getsizeof(self.user_location)
+        return size
+
+    def to_dict(self) -> dict:
+        data = {f.name: getattr(self, f.name) for f in fields(self)}
+        data["last_search"] = self.last_search.to_dict() if self.last_search is not None else None
+        data["results"] = self.results.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Session":
+        data = dict(data)
+        last_search = data.pop("last_search", None)
+        results = data.pop("results", None)
+        known = {f.name for f in fields(cls)}
+        session = cls(**{k: v for k, v in data.items() if k in known})
+        session.last_search = LastSearch.from_dict(last_search) if last_search else None
+        session.results = ResultRefs.from_dict(results) if results else ResultRefs()
+        return session
@@ -0,0 +1,218 @@
+"""
+Snapshots incrementales de sesiones (warm restart).
+Con SESSION_STORE=memory un deploy o crash borra todas las sesiones; aquí se
+guardan periódicamente SÓLO las sesiones que cambiaron desde el último
+snapshot, y al arrancar se restauran en segundo plano sin bloquear el webhook.
+
+Backends:
+- file:     JSONL append-only ({"wa_id", "data"} o {"wa_id", "deleted": true}),
+            compactado de vez en cuando (se reescribe con las sesiones vivas)
+- postgres: tabla bot_session_snapshots (upsert/delete por wa_id)
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from services.session import Session
+from services.session_store import MemorySessionStore, dump_session
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS bot_session_snapshots (
+    wa_id TEXT PRIMARY KEY,
+    data JSONB NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+"""
+
+# Sesiones restauradas por vuelta antes de ceder el event loop
+_RESTORE_CHUNK = 500
+
+
+class SessionSnapshotter:
+    """Guarda y restaura las sesiones de un MemorySessionStore."""
+
+    def __init__(self, store: MemorySessionStore, backend: str = "file", path: str = "sessions_snapshot.jsonl",
+                 pool_getter: Optional[Callable] = None, interval: float = 10.0, max_age: float = 120.0,
+                 on_restore: Optional[Callable[[str, Session], None]] = None):
+        """
+        max_age: sesiones con last_seen más viejo que esto no se restauran (ya habrían expirado).
+        on_restore(wa_id, session): hook por sesión restaurada (ej. reprogramar su despedida).
+        """
+        self.store = store
+        self.backend = backend
+        self.path = path
+        self.pool_getter = pool_getter
+        self.interval = interval
+        self.max_age = max_age
+        self.on_restore = on_restore
+        self._pending: Dict[str, dict] = {}
+        self._lines = 0
+        self.restoring = False
+        self.snapshots = 0
+        self.written = 0
+        self.deleted = 0
+        self.restored = 0
+        self.claimed = 0
+        self.errors = 0
+        self.last_snapshot_ms = 0.0
+
+    # ---- Snapshots ----
+    async def run(self):
+        """Tarea de fondo: snapshot incremental cada `interval` segundos."""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        dirty, deleted = self.store.take_changes()
+        if not dirty and not deleted:
+            return
+
+        started = time.perf_counter()
+        # Serializar en el event loop (las sesiones sólo se modifican aquí); el archivo se escribe en un hilo
+        upserts = [(wa_id, dump_session(self.store[wa_id])) for wa_id in dirty if wa_id in self.store]
+        compact = None
+        if self.backend == "file" and self._lines + len(upserts) + len(deleted) > 2 * len(self.store) + 1000:
+            compact = [(wa_id, dump_session(session)) for wa_id, session in self.store.items()]
+
+        try:
+            if self.backend == "postgres":
+                await self._write_postgres(upserts, deleted)
+            elif compact is not None:
+                await asyncio.to_thread(self._rewrite_file, compact)
+            else:
+                await asyncio.to_thread(self._append_file, upserts, deleted)
+        except Exception as e:
+            # ⚠️ No perder los cambios: se reintentan en el siguiente snapshot
+            self.errors += 1
+            self.store.dirty.update(dirty)
+            self.store.deleted.update(deleted)
+            print(f"[SNAPSHOT] ⚠️ Error guardando snapshot: {e}")
+            return
+
+        self.snapshots += 1
+        self.written += len(upserts)
+        self.deleted += len(deleted)
+        self.last_snapshot_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def _append_file(self, upserts, deleted):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for wa_id in deleted:
+                f.write(json.dumps({"wa_id": wa_id, "deleted": True}) + "\n")
+            for wa_id, data in upserts:
+                f.write(f'{{"wa_id": {json.dumps(wa_id)}, "data": {data}}}\n')
+        self._lines += len(upserts) + len(deleted)
+
+    def _rewrite_file(self, sessions):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for wa_id, data in sessions:
+                f.write(f'{{"wa_id": {json.dumps(wa_id)}, "data": {data}}}\n')
+        os.replace(tmp_path, self.path)
+        self._lines = len(sessions)
+        print(f"[SNAPSHOT] Archivo compactado ({len(sessions)} sesiones)")
+
+    async def _write_postgres(self, upserts, deleted):
+        async with self.pool_getter().connection() as conn, conn.cursor() as cur:
+            if deleted:
+                await cur.execute("DELETE FROM bot_session_snapshots WHERE wa_id = ANY(%s);", (list(deleted),))
+            if upserts:
+                await cur.executemany(
+                    """
+                    INSERT INTO bot_session_snapshots (wa_id, data) VALUES (%s, %s::jsonb)
+                    ON CONFLICT (wa_id) DO UPDATE SET data = EXCLUDED.data, updated_at = NOW();
+                    """,
+                    upserts
+                )
+
+    # ---- Restauración ----
+    async def restore(self):
+        """Carga el último snapshot en segundo plano, por bloques, sin bloquear el webhook."""
+        self.restoring = True
+        started = time.perf_counter()
+        try:
+            if self.backend == "postgres":
+                self._pending = await self._read_postgres()
+            else:
+                self._pending = await asyncio.to_thread(self._read_file)
+        except Exception as e:
+            self.errors += 1
+            self.restoring = False
+            print(f"[SNAPSHOT] ⚠️ No se pudo leer el snapshot: {e}")
+            return
+
+        total = len(self._pending)
+        while self._pending:
+            for _ in range(min(_RESTORE_CHUNK, len(self._pending))):
+                wa_id, data = self._pending.popitem()
+                self._install(wa_id, data)
+            await asyncio.sleep(0)
+
+        self.restoring = False
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"[SNAPSHOT] ✅ {self.restored} sesiones restauradas de {total} en el snapshot ({elapsed:.0f}ms)")
+
+    def claim(self, wa_id: str):
+        """Si llega un mensaje antes de que se restaure su sesión, restaurarla ya."""
+        data = self._pending.pop(wa_id, None) if self._pending else None
+        if data is not None:
+            self.claimed += 1
+            self._install(wa_id, data)
+
+    def _install(self, wa_id: str, data: dict):
+        if wa_id in self.store:
+            return  # El usuario ya escribió después del arranque: su sesión nueva gana
+        try:
+            session = Session.from_dict(data)
+        except Exception as e:
+            self.errors += 1
+            print(f"[SNAPSHOT] ⚠️ Sesión inválida para {wa_id}: {e}")
+            return
+        if time.time() - session.last_seen > self.max_age:
+            return
+        self.store[wa_id] = session
+        self.restored += 1
+        if self.on_restore:
+            self.on_restore(wa_id, session)
+
+    async def _read_postgres(self) -> Dict[str, dict]:
+        async with self.pool_getter().connection() as conn, conn.cursor() as cur:
+            await cur.execute(CREATE_TABLE_SQL)
+            await cur.execute(
+                "SELECT wa_id, data FROM bot_session_snapshots WHERE updated_at > NOW() - make_interval(secs => %s);",
+                (self.max_age,)
+            )
+            return {wa_id: data for wa_id, data in await cur.fetchall()}
+
+    def _read_file(self) -> Dict[str, dict]:
+        records: Dict[str, dict] = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Línea truncada (crash a media escritura)
+                self._lines += 1
+                if record.get("deleted"):
+                    records.pop(record["wa_id"], None)
+                else:
+                    records[record["wa_id"]] = record["data"]
+        return records
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "interval_seconds": self.interval,
+            "restoring": self.restoring,
+            "snapshots": self.snapshots,
+            "sessions_written": self.written,
+            "sessions_deleted": self.deleted,
+            "restored": self.restored,
+            "claimed_early": self.claimed,
+            "errors": self.errors,
+            "last_snapshot_ms": self.last_snapshot_ms,
+        }
@@ -0,0 +1,467 @@
+"""
+Almacén de sesiones de usuario.
+Interfaz tipo dict (user_sessions[wa_id], `in`, del, items(), len) para que el
+código existente no cambie, más load()/save() asíncronos alrededor de cada mensaje.
+La API tipo dict nunca hace I/O: un `del` se aplica en el backend en el save()
+que cierra el mensaje.
+
+Backends (SESSION_STORE):
+- memory:   dict en el proceso (un solo worker, comportamiento original)
+- postgres: tabla compartida por todos los workers/réplicas
+- sqlite:   archivo compartido por los workers de un mismo nodo
+
+Los backends compartidos mantienen un caché local de lectura: load() sólo trae
+el JSON de la sesión si otro worker la modificó (versión más nueva que la local).
+save() es condicional a la versión cargada: si otro worker la escribió mientras
+tanto, gana la primera escritura, se cuenta el conflicto y se adopta esa versión
+(los mailboxes por usuario sólo serializan dentro de un proceso).
+
+Tope de memoria: con max_sessions / max_bytes las sesiones menos recientes (LRU
+por actividad del usuario) se expulsan. En memory la sesión se pierde (el usuario
+empieza de nuevo); en los compartidos sólo sale del caché local. Una sesión entre
+load() y save() (mensaje en proceso) nunca se expulsa: el tope puede excederse
+mientras tanto y se vuelve a aplicar en el save().
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from services.session import Session
+
+# Cada cuántos save() se purgan sesiones viejas del backend compartido
+_PURGE_EVERY = 500
+# Sesiones muestreadas para estimar bytes por sesión (y cada cuántas altas se re-estima)
+_SIZE_SAMPLE = 256
+_RESAMPLE_EVERY = 1000
+
+
+def _json_default(value: Any):
+    # Las filas de la BD traen Decimal (lat/lng/distancias) y tipos de fecha/hora
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    return str(value)
+
+
+def dump_session(session: Session) -> str:
+    return json.dumps(session.to_dict(), default=_json_default, ensure_ascii=False)
+
+
+class SessionStore:
+    """Interfaz común. Las subclases compartidas implementan _fetch/_upsert/_delete."""
+
+    backend = "memory"
+
+    def __init__(self, max_sessions: int = 0, max_bytes: int = 0):
+        """max_sessions / max_bytes: topes del caché local (0 = sin tope)."""
+        # Orden = recencia de actividad (el más viejo primero)
+        self._cache: "OrderedDict[str, Session]" = OrderedDict()
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.on_evict: Optional[Callable[[str], None]] = None
+        self.evictions = 0
+        self._avg_bytes = 0
+        self._inserts = 0
+        # wa_id → mensajes en proceso (entre load() y save()/release())
+        self._in_flight: Dict[str, int] = {}
+
+    # ---- API tipo dict (sólo caché local, sin I/O) ----
+    def __contains__(self, wa_id: str) -> bool:
+        return wa_id in self._cache
+
+    def __getitem__(self, wa_id: str) -> Session:
+        return self._cache[wa_id]
+
+    def __setitem__(self, wa_id: str, session: Session):
+        self._cache[wa_id] = session
+        self._cache.move_to_end(wa_id)
+        self._inserts += 1
+        self._enforce_cap()
+
+    def __delitem__(self, wa_id: str):
+        del self._cache[wa_id]
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get(self, wa_id: str, default=None):
+        return self._cache.get(wa_id, default)
+
+    def items(self):
+        return self._cache.items()
+
+    def touch(self, wa_id: str):
+        """Marca actividad del usuario (lo aleja de la expulsión LRU)."""
+        if wa_id in self._cache:
+            self._cache.move_to_end(wa_id)
+
+    # ---- Tope de memoria (LRU) ----
+    def _limit(self) -> Optional[int]:
+        limit = self.max_sessions or None
+        if self.max_bytes:
+            if not self._avg_bytes or self._inserts % _RESAMPLE_EVERY == 0:
+                self._avg_bytes = self._sample_avg_bytes()
+            if self._avg_bytes:
+                by_bytes = max(1, self.max_bytes // self._avg_bytes)
+                limit = min(limit, by_bytes) if limit else by_bytes
+        return limit
+
+    def _enforce_cap(self):
+        limit = self._limit()
+        if not limit or len(self._cache) <= limit:
+            return
+        excess = len(self._cache) - limit
+        victims = []
+        # Del más viejo al más nuevo, saltando las sesiones con un mensaje en proceso
+        for wa_id in self._cache:
+            if wa_id not in self._in_flight:
+                victims.append(wa_id)
+                if len(victims) == excess:
+                    break
+        for wa_id in victims:
+            del self._cache[wa_id]
+            self.evictions += 1
+            self._evicted(wa_id)
+            if self.on_evict:
+                self.on_evict(wa_id)
+
+    def _evicted(self, wa_id: str):
+        """Hook por backend al expulsar una sesión del caché local."""
+
+    def _sample_avg_bytes(self) -> int:
+        sample = [session.approx_size() for _, session in zip(range(_SIZE_SAMPLE), reversed(self._cache.values()))]
+        return sum(sample) // len(sample) if sample else 0
+
+    def approx_bytes(self) -> int:
+        """Bytes aproximados de las sesiones en memoria (promedio de una muestra × sesiones)."""
+        return self._sample_avg_bytes() * len(self._cache)
+
+    # ---- Sincronización con el backend ----
+    async def load(self, wa_id: str):
+        """
+        Trae la versión más reciente de la sesión al caché local (si cambió) y la
+        fija ahí hasta el save()/release() que cierra el mensaje.
+        """
+        self._in_flight[wa_id] = self._in_flight.get(wa_id, 0) + 1
+        await self._load(wa_id)
+
+    async def save(self, wa_id: str) -> bool:
+        """
+        Escribe la sesión del caché local al backend y la libera.
+        Retorna False si otro worker la escribió primero (la escritura perdió y el
+        caché local ya tiene la versión del backend). Un error del backend no es
+        conflicto: se sigue con el caché local y retorna True.
+        """
+        try:
+            return await self._save(wa_id)
+        finally:
+            self.release(wa_id)
+
+    def release(self, wa_id: str):
+        """Libera una sesión cargada con load() sin escribirla."""
+        pending = self._in_flight.get(wa_id, 0)
+        if pending <= 1:
+            self._in_flight.pop(wa_id, None)
+            self._enforce_cap()
+        else:
+            self._in_flight[wa_id] = pending - 1
+
+    async def _load(self, wa_id: str):
+        pass
+
+    async def _save(self, wa_id: str) -> bool:
+        return True
+
+    async def ensure_table(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "cached": len(self._cache),
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "in_flight": len(self._in_flight),
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Sesiones sólo en memoria del proceso.
+    save() no hace I/O: sólo marca la sesión como cambiada para el siguiente
+    snapshot incremental (services/session_snapshots).
+    """
+
+    def __init__(self, max_sessions: int = 0, max_bytes: int = 0):
+        super().__init__(max_sessions, max_bytes)
+        self.dirty = set()
+        self.deleted = set()
+
+    def __delitem__(self, wa_id: str):
+        super().__delitem__(wa_id)
+        self._evicted(wa_id)
+
+    def _evicted(self, wa_id: str):
+        # La sesión ya no existe: que el snapshot tampoco la conserve
+        self.dirty.discard(wa_id)
+        self.deleted.add(wa_id)
+
+    async def _save(self, wa_id: str) -> bool:
+        if wa_id in self._cache:
+            self.dirty.add(wa_id)
+        return True
+
+    def take_changes(self):
+        """Retorna (cambiadas, borradas) desde la última llamada."""
+        dirty, deleted = self.dirty, self.deleted
+        self.dirty, self.deleted = set(), set()
+        return dirty, deleted
+
+
+class SharedSessionStore(SessionStore):
+    """Sesiones en una tabla compartida con caché local versionado (read-through)."""
+
+    def __init__(self, ttl_seconds: float, max_sessions: int = 0, max_bytes: int = 0):
+        super().__init__(max_sessions, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self._versions: Dict[str, int] = {}
+        # wa_id → versión que tenía la sesión borrada (reset) durante el mensaje
+        self._pending_deletes: Dict[str, int] = {}
+        self.loads = 0
+        self.fetched = 0
+        self.saves = 0
+        self.errors = 0
+        self.conflicts = 0
+
+    def _evicted(self, wa_id: str):
+        # Sólo sale del caché local; la sesión sigue en el backend
+        self._versions.pop(wa_id, None)
+
+    def __delitem__(self, wa_id: str):
+        super().__delitem__(wa_id)
+        self._pending_deletes[wa_id] = self._versions.pop(wa_id, 0)
+
+    async def _load(self, wa_id: str):
+        self.loads += 1
+        # ⚠️ Si el backend falla, se sigue con el caché local (mejor que perder el mensaje)
+        try:
+            row = await self._fetch(wa_id, self._versions.get(wa_id, 0))
+        except Exception as e:
+            self.errors += 1
+            print(f"[SESSION-STORE] ⚠️ Error cargando sesión {wa_id}: {e}")
+            return
+
+        if row is None:
+            # Otro worker la borró (reset) o nunca existió
+            if wa_id in self._cache and wa_id in self._versions:
+                self._cache.pop(wa_id, None)
+                self._versions.pop(wa_id, None)
+            return
+
+        version, data = row
+        if data is not None:
+            self._versions[wa_id] = version
+            self[wa_id] = Session.from_dict(json.loads(data) if isinstance(data, (str, bytes)) else data)
+            self.fetched += 1
+
+    async def _save(self, wa_id: str) -> bool:
+        session = self._cache.get(wa_id)
+        try:
+            if session is None:
+                # Reset durante el mensaje: borrar también en el backend
+                if wa_id in self._pending_deletes:
+                    self._pending_deletes.pop(wa_id)
+                    await self._delete(wa_id)
+                return True
+            # Si hubo reset y sesión nueva, el upsert la reemplaza (sobre la versión borrada)
+            if wa_id in self._pending_deletes:
+                expected = self._pending_deletes.pop(wa_id)
+            else:
+                expected = self._versions.get(wa_id, 0)
+            version = await self._upsert(wa_id, dump_session(session), expected)
+            if version is None:
+                # Otro worker la escribió después de nuestro load(): gana su versión
+                self.conflicts += 1
+                print(f"[SESSION-STORE] ⚠️ Conflicto de versión en {wa_id} (esperada {expected}): se adopta la del backend")
+                self._cache.pop(wa_id, None)
+                self._versions.pop(wa_id, None)
+                await self._load(wa_id)
+                return False
+            self._versions[wa_id] = version
+            self.saves += 1
+            if self.saves % _PURGE_EVERY == 0:
+                await self._purge()
+        except Exception as e:
+            self.errors += 1
+            print(f"[SESSION-STORE] ⚠️ Error guardando sesión {wa_id}: {e}")
+        return True
+
+    # ---- Implementación por backend ----
+    async def _fetch(self, wa_id: str, known_version: int) -> Optional[Tuple[int, Any]]:
+        """(version, data) — data es None si la versión local ya es la más reciente."""
+        raise NotImplementedError
+
+    async def _upsert(self, wa_id: str, data: str, expected: int) -> Optional[int]:
+        """Nueva versión, o None si en el backend ya no está la versión `expected` (0 = no existía)."""
+        raise NotImplementedError
+
+    async def _delete(self, wa_id: str):
+        raise NotImplementedError
+
+    async def _purge(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "loads": self.loads,
+            "fetched": self.fetched,
+            "saves": self.saves,
+            "errors": self.errors,
+            "conflicts": self.conflicts,
+        }
+
+
+class PostgresSessionStore(SharedSessionStore):
+    backend = "postgres"
+
+    CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS bot_sessions (
+        wa_id TEXT PRIMARY KEY,
+        data JSONB NOT NULL,
+        version BIGINT NOT NULL DEFAULT 1,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """
+
+    def __init__(self, pool_getter: Callable, ttl_seconds: float, max_sessions: int = 0, max_bytes: int = 0):
+        super().__init__(ttl_seconds, max_sessions, max_bytes)
+        self.pool_getter = pool_getter
+
+    async def ensure_table(self):
+        try:
+            async with self.pool_getter().connection() as conn, conn.cursor() as cur:
+                await cur.execute(self.CREATE_TABLE_SQL)
+            print("[SESSION-STORE] ✅ Tabla bot_sessions lista")
+        except Exception as e:
+            print(f"[SESSION-STORE] ⚠️ No se pudo crear tabla de sesiones: {e}")
+
+    async def _fetch(self, wa_id, known_version):
+        async with self.pool_getter().connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                "SELECT version, CASE WHEN version <> %s THEN data END FROM bot_sessions WHERE wa_id = %s;",
+                (known_version, wa_id)
+            )
+            return await cur.fetchone()
+
+    async def _upsert(self, wa_id, data, expected):
+        async with self.pool_getter().connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                """
+                INSERT INTO bot_sessions (wa_id, data) VALUES (%s, %s::jsonb)
+                ON CONFLICT (wa_id) DO UPDATE
+                SET data = EXCLUDED.data, version = bot_sessions.version + 1, updated_at = NOW()
+                WHERE bot_sessions.version = %s
+                RETURNING version;
+                """,
+                (wa_id, data, expected)
+            )
+            row = await cur.fetchone()
+            return row[0] if row else None
+
+    async def _delete(self, wa_id):
+        async with self.pool_getter().connection() as conn, conn.cursor() as cur:
+            await cur.execute("DELETE FROM bot_sessions WHERE wa_id = %s;", (wa_id,))
+
+    async def _purge(self):
+        async with self.pool_getter().connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                "DELETE FROM bot_sessions WHERE updated_at < NOW() - make_interval(secs => %s);",
+                (self.ttl_seconds,)
+            )
+
+
+class SqliteSessionStore(SharedSessionStore):
+    backend = "sqlite"
+
+    CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS bot_sessions (
+        wa_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 1,
+        updated_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_sessions: int = 0, max_bytes: int = 0):
+        super().__init__(ttl_seconds, max_sessions, max_bytes)
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo (las consultas corren en el threadpool)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql: str, params: tuple = ()):
+        return self._conn().execute(sql, params).fetchone()
+
+    def create_table(self):
+        try:
+            self._conn().execute(self.CREATE_TABLE_SQL)
+            print(f"[SESSION-STORE] ✅ SQLite listo en {self.path}")
+        except Exception as e:
+            print(f"[SESSION-STORE] ⚠️ No se pudo crear tabla de sesiones: {e}")
+
+    async def _fetch(self, wa_id, known_version):
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT version, CASE WHEN version <> ? THEN data END FROM bot_sessions WHERE wa_id = ?;",
+            (known_version, wa_id)
+        )
+
+    async def _upsert(self, wa_id, data, expected):
+        row = await asyncio.to_thread(
+            self._query,
+            """
+            INSERT INTO bot_sessions (wa_id, data, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (wa_id) DO UPDATE
+            SET data = excluded.data, version = bot_sessions.version + 1, updated_at = excluded.updated_at
+            WHERE bot_sessions.version = ?
+            RETURNING version;
+            """,
+            (wa_id, data, time.time(), expected)
+        )
+        return row[0] if row else None
+
+    async def _delete(self, wa_id):
+        await asyncio.to_thread(self._query, "DELETE FROM bot_sessions WHERE wa_id = ?;", (wa_id,))
+
+    async def _purge(self):
+        await asyncio.to_thread(
+            self._query, "DELETE FROM bot_sessions WHERE updated_at < ?;", (time.time() - self.ttl_seconds,)
+        )
+
+
+def create_session_store(backend: str, pool_getter: Callable = None, sqlite_path: str = "sessions.db",
+                         ttl_seconds: float = 86400, max_sessions: int = 0, max_bytes: int = 0) -> SessionStore:
+    if backend == "postgres":
+        return PostgresSessionStore(pool_getter, ttl_seconds, max_sessions, max_bytes)
+    if backend == "sqlite":
+        store = SqliteSessionStore(sqlite_path, ttl_seconds, max_sessions, max_bytes)
+        # SQLite no depende de la BD principal: se puede preparar de inmediato
+        store.create_table()
+        return store
+    return MemorySessionStore(max_sessions, max_bytes)
@@ -0,0 +1,127 @@
+"""
+Índice espacial en memoria (rejilla lat/lng) para "lugares más cercanos".
+Cada snapshot de services/place_catalog arma uno con los lugares que tienen
+coordenadas. En lugar de calcular haversine contra todo el catálogo y ordenar:
+
+- nearest(k):  recorre anillos de celdas alrededor del usuario y se detiene en
+               cuanto los k mejores están más cerca que cualquier celda sin
+               visitar; con accept(id) sólo cuenta los que pasan el filtro (ej.
+               abiertos), así que el radio crece solo hasta juntar k
+- within(r):   sólo las celdas que tocan el círculo de radio r
+
+Haversine se calcula únicamente sobre los puntos de las celdas visitadas.
+Con celdas de 0.05° (~5.5 km) una ciudad cabe en unas pocas decenas de celdas.
+"""
+import heapq
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+_KM_PER_DEG = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    d_lat = math.radians((lat2 - lat1) / 2)
+    d_lng = math.radians((lng2 - lng1) / 2)
+    a = math.sin(d_lat) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lng) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+class GridIndex:
+    """Rejilla inmutable de puntos (id, lat, lng)."""
+
+    def __init__(self, points: Iterable[Tuple[int, float, float]], cell_deg: float = 0.05):
+        self.cell_deg = cell_deg
+        cells: Dict[Tuple[int, int], List[Tuple[int, float, float]]] = {}
+        for point in points:
+            cells.setdefault(self._cell(point[1], point[2]), []).append(point)
+        self.cells: Dict[Tuple[int, int], Tuple[Tuple[int, float, float], ...]] = {k: tuple(v) for k, v in cells.items()}
+        self.size = sum(len(v) for v in self.cells.values())
+        if self.cells:
+            rows = [k[0] for k in self.cells]
+            cols = [k[1] for k in self.cells]
+            self._bounds = (min(rows), max(rows), min(cols), max(cols))
+        else:
+            self._bounds = (0, -1, 0, -1)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def _ring(self, center: Tuple[int, int], r: int):
+        """Celdas a distancia de Chebyshev exactamente r del centro."""
+        ci, cj = center
+        if r == 0:
+            yield center
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield ci - r, j
+            yield ci + r, j
+        for i in range(ci - r + 1, ci + r):
+            yield i, cj - r
+            yield i, cj + r
+
+    def _max_ring(self, center: Tuple[int, int]) -> int:
+        """Anillo a partir del cual ya no hay celdas con puntos."""
+        min_i, max_i, min_j, max_j = self._bounds
+        ci, cj = center
+        return max(abs(ci - min_i), abs(ci - max_i), abs(cj - min_j), abs(cj - max_j))
+
+    def _ring_min_km(self, lat: float, r: int) -> float:
+        """Cota inferior de la distancia a cualquier punto fuera de los anillos 0..r-1."""
+        if r <= 0:
+            return 0.0
+        # El ancho de una celda en km se encoge con la latitud: usar la más lejana del ecuador
+        far_lat = min(89.9, abs(lat) + (r + 1) * self.cell_deg)
+        return (r - 1) * self.cell_deg * _KM_PER_DEG * math.cos(math.radians(far_lat))
+
+    def nearest(self, lat: float, lng: float, k: int, accept: Optional[Callable[[int], bool]] = None,
+                max_km: float = 0.0) -> List[Tuple[float, int]]:
+        """
+        Los k puntos más cercanos (km, id) en orden, sólo los que cumplen accept(id).
+        max_km > 0 limita el radio de búsqueda.
+        """
+        if k <= 0 or not self.cells:
+            return []
+        center = self._cell(lat, lng)
+        last_ring = self._max_ring(center)
+        best: List[Tuple[float, int]] = []   # heap de (-km, id) con los k mejores
+        r = 0
+        while r <= last_ring:
+            bound = self._ring_min_km(lat, r)
+            if max_km and bound > max_km:
+                break
+            if len(best) == k and -best[0][0] <= bound:
+                break
+            for cell in self._ring(center, r):
+                for place_id, p_lat, p_lng in self.cells.get(cell, ()):
+                    km = haversine_km(lat, lng, p_lat, p_lng)
+                    if max_km and km > max_km:
+                        continue
+                    if len(best) == k and km >= -best[0][0]:
+                        continue
+                    if accept is not None and not accept(place_id):
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-km, place_id))
+                    else:
+                        heapq.heapreplace(best, (-km, place_id))
+            r += 1
+        return sorted((-neg_km, place_id) for neg_km, place_id in best)
+
+    def within(self, lat: float, lng: float, radius_km: float) -> List[Tuple[float, int]]:
+        """Todos los puntos a radius_km o menos, ordenados por distancia."""
+        if not self.cells:
+            return []
+        center = self._cell(lat, lng)
+        found = []
+        r = 0
+        last_ring = self._max_ring(center)
+        while r <= last_ring and self._ring_min_km(lat, r) <= radius_km:
+            for cell in self._ring(center, r):
+                for place_id, p_lat, p_lng in self.cells.get(cell, ()):
+                    km = haversine_km(lat, lng, p_lat, p_lng)
+                    if km <= radius_km:
+                        found.append((km, place_id))
+            r += 1
+        found.sort()
+        return found
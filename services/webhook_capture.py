@@ -0,0 +1,165 @@
+"""
+Captura de tráfico del webhook para reproducirlo después (benchmarks/replay_webhooks.py).
+Cada payload recibido se guarda como una línea JSONL con su timestamp:
+
+    {"ts": 1700000000.123, "kind": "messages", "payload": {...}}
+
+Los datos personales se sanitizan antes de escribir:
+- teléfonos / wa_id → pseudónimo estable (el mismo usuario sigue siendo el
+  mismo usuario en la captura) con prefijo 000, que no es un código de país:
+  reproducir la captura nunca puede mandarle mensajes a un número real;
+  nombres de perfil → "Cliente"
+- texto libre (text.body, captions, button.text/payload, títulos de respuestas
+  interactivas, nombre/dirección de una ubicación) → placeholder del mismo
+  largo que conserva los espacios (la forma del mensaje, no su contenido)
+- coordenadas de ubicación → redondeadas a COORD_DECIMALS (~1 km)
+
+record() sólo encola los bytes: decodificar, sanitizar y escribir se hace en
+un hilo aparte, así el webhook no paga I/O de disco en el event loop. Si la
+cola se llena (disco lento) los payloads se descartan y se cuentan.
+"""
+import hashlib
+import json
+import queue
+import threading
+import time
+from typing import Any, Optional
+
+from services import webhook_parser
+
+# Llaves con números de teléfono del usuario
+_PHONE_KEYS = {"from", "wa_id", "recipient_id"}
+# Texto libre del usuario, por objeto que lo contiene
+_TEXT_KEYS = {
+    "text": {"body"},
+    "image": {"caption"},
+    "video": {"caption"},
+    "document": {"caption", "filename"},
+    "button": {"text", "payload"},
+    "button_reply": {"title"},
+    "list_reply": {"title", "description"},
+    "location": {"name", "address", "url"},
+}
+_COORD_KEYS = {"latitude", "longitude"}
+COORD_DECIMALS = 2
+_QUEUE_MAX = 10_000
+_STOP = object()
+
+
+# Prefijo de los pseudónimos: ningún código de país empieza con 0 (no enrutable)
+PSEUDONYM_PREFIX = "000"
+
+
+def pseudonymize_phone(value: str) -> str:
+    """Número falso pero estable (mismo input → mismo output), del largo de un wa_id y no enrutable."""
+    digest = hashlib.sha256(str(value).encode()).hexdigest()
+    return PSEUDONYM_PREFIX + str(int(digest[:12], 16))[-10:].zfill(10)
+
+
+def redact_text(value: str) -> str:
+    """Mismo largo y mismos espacios, sin contenido ("tacos al pastor" → "xxxxx xx xxxxxx")."""
+    return "".join(c if c.isspace() else "x" for c in value)
+
+
+def sanitize(obj: Any, parent: Optional[str] = None) -> Any:
+    if isinstance(obj, dict):
+        text_keys = _TEXT_KEYS.get(parent, ())
+        result = {}
+        for key, value in obj.items():
+            if key in _PHONE_KEYS and isinstance(value, (str, int)):
+                result[key] = pseudonymize_phone(value)
+            elif key == "profile" and isinstance(value, dict):
+                result[key] = {**value, "name": "Cliente"} if "name" in value else sanitize(value, key)
+            elif key in text_keys and isinstance(value, str):
+                result[key] = redact_text(value)
+            elif parent == "location" and key in _COORD_KEYS and isinstance(value, (int, float, str)):
+                try:
+                    result[key] = round(float(value), COORD_DECIMALS)
+                except ValueError:
+                    result[key] = None
+            else:
+                result[key] = sanitize(value, key)
+        return result
+    if isinstance(obj, list):
+        return [sanitize(item, parent) for item in obj]
+    return obj
+
+
+class WebhookRecorder:
+    """Escribe payloads sanitizados a un archivo JSONL (append, una línea por request)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.recorded = 0
+        self.errors = 0
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=_QUEUE_MAX)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._failed = False
+
+    def record(self, body: bytes, kind: str):
+        """Encola el payload (no bloquea). La captura nunca debe tumbar el webhook."""
+        if self._failed:
+            self.errors += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._writer, name="webhook-capture", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait((round(time.time(), 3), kind, body))
+        except queue.Full:
+            self.dropped += 1
+
+    def _line(self, ts: float, kind: str, body: bytes) -> str:
+        return json.dumps(
+            {"ts": ts, "kind": kind, "payload": sanitize(webhook_parser.loads(body))},
+            ensure_ascii=False
+        )
+
+    def _writer(self):
+        try:
+            file = open(self.path, "a", encoding="utf-8")
+        except OSError as e:
+            self._failed = True
+            print(f"[CAPTURE] ❌ No se pudo abrir {self.path}: {e}")
+            return
+        with file:
+            print(f"[CAPTURE] ✅ Capturando webhooks en {self.path}")
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                try:
+                    file.write(self._line(*item) + "\n")
+                    self.recorded += 1
+                except Exception as e:
+                    self.errors += 1
+                    print(f"[CAPTURE] ⚠️ Error capturando payload: {e}")
+                # flush sólo cuando la cola se vacía (no uno por request en ráfagas)
+                if self._queue.empty():
+                    file.flush()
+
+    def close(self, timeout: float = 5.0):
+        """Escribe lo pendiente y cierra el archivo."""
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print("[CAPTURE] ⚠️ Cola de captura llena al cerrar: se descartan los pendientes")
+            return
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "recorded": self.recorded,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+        }
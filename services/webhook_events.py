@@ -0,0 +1,57 @@
+"""
+Clasificador rápido de eventos del webhook.
+La mayoría del tráfico son callbacks de `statuses` (sent/delivered/read);
+se detectan sobre los bytes crudos, sin decodificar el JSON completo,
+y se cuentan por tipo para que el hot path sólo pague por mensajes reales.
+"""
+import re
+from collections import Counter
+
+# Tipos de mensaje que el bot sabe procesar
+SUPPORTED_MESSAGE_TYPES = {"text", "location", "button"}
+
+# Se busca la CLAVE del array: Meta manda `"field": "messages"` en todos los
+# changes (también en los de statuses), así que el literal solo no distingue nada
+_MESSAGES_RE = re.compile(rb'"messages"\s*:\s*\[')
+_STATUSES_RE = re.compile(rb'"statuses"\s*:\s*\[')
+_STATUS_RE = re.compile(rb'"status"\s*:\s*"([A-Za-z_]+)"')
+
+event_counts: Counter = Counter()
+
+
+def classify_payload(body: bytes) -> str:
+    """
+    Clasifica el payload sin parsearlo.
+    - "messages": puede traer mensajes de usuario → parsear completo
+    - "statuses": sólo callbacks de entrega/lectura → se descartan
+    - "other": cualquier otro evento (sin mensajes ni statuses)
+
+    Un falso positivo de "messages" (ej. el texto "messages" dentro de un body)
+    sólo cuesta el parseo completo; nunca se descarta un mensaje real.
+    """
+    if _MESSAGES_RE.search(body):
+        return "messages"
+    if _STATUSES_RE.search(body):
+        return "statuses"
+    return "other"
+
+
+def count_statuses(body: bytes):
+    """Cuenta cada status (sent, delivered, read, failed...) del payload."""
+    statuses = _STATUS_RE.findall(body)
+    if not statuses:
+        event_counts["status:unknown"] += 1
+    for status in statuses:
+        event_counts[f"status:{status.decode()}"] += 1
+
+
+def count_message(message_type: str):
+    event_counts[f"message:{message_type or 'unknown'}"] += 1
+
+
+def count_event(name: str):
+    event_counts[name] += 1
+
+
+def stats() -> dict:
+    return dict(event_counts)
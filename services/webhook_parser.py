@@ -0,0 +1,92 @@
+"""
+Parseo del webhook de WhatsApp en una sola pasada.
+Los bytes ya verificados (HMAC) se decodifican una sola vez con el backend
+JSON más rápido disponible y se convierten a structs tipados, en lugar de
+ir navegando diccionarios con cadenas de .get().
+
+Backend configurable con JSON_BACKEND: auto | orjson | msgspec | json
+(auto = orjson → msgspec → json, según lo que esté instalado).
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+
+def _load_backend(name: str):
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+            return "orjson", orjson.loads
+        except ImportError:
+            if name == "orjson":
+                print("[WEBHOOK-PARSER] ⚠️ orjson no instalado, usando fallback")
+    if name in ("auto", "msgspec", "orjson"):
+        try:
+            import msgspec
+            return "msgspec", msgspec.json.Decoder().decode
+        except ImportError:
+            if name == "msgspec":
+                print("[WEBHOOK-PARSER] ⚠️ msgspec no instalado, usando json")
+    return "json", json.loads
+
+
+JSON_BACKEND, loads = _load_backend(os.getenv("JSON_BACKEND", "auto").lower())
+
+
+@dataclass(slots=True)
+class IncomingMessage:
+    """Un mensaje de usuario ya normalizado."""
+    wa_id: str
+    message_id: str
+    type: str
+    phone_number_id: str
+    text: str = ""                  # text.body, o button.text para botones de template
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    merged_count: int = 1           # > 1 si se juntaron varios mensajes (coalescing)
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_message(message: dict, phone_number_id: str) -> IncomingMessage:
+    message_type = message.get("type") or ""
+    text = ""
+    lat = lng = None
+
+    if message_type == "text":
+        text = ((message.get("text") or {}).get("body") or "").strip()
+    elif message_type == "button":
+        text = ((message.get("button") or {}).get("text") or "").strip()
+    elif message_type == "location":
+        location = message.get("location") or {}
+        lat = _to_float(location.get("latitude"))
+        lng = _to_float(location.get("longitude"))
+
+    return IncomingMessage(
+        wa_id=message.get("from") or "",
+        message_id=message.get("id") or "",
+        type=message_type,
+        phone_number_id=phone_number_id,
+        text=text,
+        lat=lat,
+        lng=lng,
+    )
+
+
+def iter_messages(data: dict) -> Iterator[IncomingMessage]:
+    """Recorre entry → changes → value.messages y produce IncomingMessage en orden."""
+    for entry in data.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            messages = value.get("messages")
+            if not messages:
+                continue
+            phone_number_id = (value.get("metadata") or {}).get("phone_number_id") or ""
+            for message in messages:
+                yield parse_message(message, phone_number_id)
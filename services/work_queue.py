@@ -0,0 +1,106 @@
+"""
+Cola de trabajo en memoria para el webhook.
+El webhook verifica, encola y responde 200 de inmediato;
+un pool de workers procesa los mensajes en segundo plano.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from services.metrics import LatencyWindow
+
+
+class WorkQueue:
+    """Cola asyncio acotada servida por N workers."""
+
+    def __init__(self, name: str, handler: Callable[[Any], Awaitable[None]], max_size: int = 1000, workers: int = 8):
+        self.name = name
+        self.handler = handler
+        self.max_size = max_size
+        self.num_workers = workers
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.busy = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_time = LatencyWindow()
+        self.run_time = LatencyWindow()
+
+    @property
+    def running(self) -> bool:
+        return bool(self.tasks)
+
+    def start(self):
+        """Crea la cola y lanza los workers (debe llamarse dentro del event loop)."""
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self.tasks = [
+            asyncio.create_task(self._worker(i), name=f"{self.name}-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        print(f"[QUEUE:{self.name}] ✅ {self.num_workers} workers iniciados (max_size={self.max_size})")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Espera a que se vacíe la cola (con timeout) y detiene los workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"[QUEUE:{self.name}] ⚠️ Timeout drenando cola, quedan {self.queue.qsize()} items")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        print(f"[QUEUE:{self.name}] Workers detenidos")
+
+    def submit(self, item: Any) -> bool:
+        """Encola sin bloquear. Retorna False si la cola está llena o no está corriendo."""
+        if not self.running:
+            return False
+        try:
+            self.queue.put_nowait((time.monotonic(), item))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue else 0
+
+    async def _worker(self, worker_id: int):
+        while True:
+            enqueued_at, item = await self.queue.get()
+            started = time.monotonic()
+            self.wait_time.observe((started - enqueued_at) * 1000)
+            self.busy += 1
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except Exception as e:
+                # ⚠️ Un error en un mensaje no debe tumbar al worker
+                self.failed += 1
+                print(f"[QUEUE:{self.name}] ❌ Error procesando item (worker {worker_id}): {e}")
+            finally:
+                self.busy -= 1
+                self.run_time.observe((time.monotonic() - started) * 1000)
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self.num_workers,
+            "busy_workers": self.busy,
+            "depth": self.depth(),
+            "max_size": self.max_size,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_time": self.wait_time.snapshot(),
+            "run_time": self.run_time.snapshot(),
+        }